@@ -0,0 +1,200 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# asyncio download engine. All articles are downloaded by a single thread
+# through one aiohttp session, so connections are kept alive and reused
+# (per-host connection pool) instead of paying a TCP+TLS handshake for
+# every article. The number of requests in flight is bounded by the number
+# of worker coroutines and, below that, by the concurrency controller.
+
+
+import time
+import asyncio
+import aiohttp
+from ratelimit import RateLimiter, AIMDController, is_congested, \
+        retry_after, retry_delay
+from metrics import LATENCY_BUCKETS
+
+
+# Rate limiter and concurrency controller of the requests, along with the
+# event set whenever a slot of the controller is freed. Slots are only
+# released by coroutines of the same event loop, so the event is enough to
+# wake up the coroutines waiting for one.
+class RequestLimits:
+
+    def __init__(self, rate_limiter, concurrency, max_backoff):
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        self.max_backoff = max_backoff
+        self.slot_freed = asyncio.Event()
+
+    # Take a slot of the concurrency controller, waiting (without blocking
+    # the event loop) for a slot to be freed if the limit is reached.
+    async def acquire(self):
+        while True:
+            ticket = self.concurrency.try_acquire()
+            if ticket != None:
+                return ticket
+            self.slot_freed.clear()
+            await self.slot_freed.wait()
+
+    def release(self, ticket, congested=False):
+        self.concurrency.release(ticket, congested)
+        self.slot_freed.set()
+
+
+# Return the text of the raw HTML data of a response, like decode_body() of
+# the crawler: malformed bytes are replaced, and UTF-8 is assumed if the
+# server sent no charset or an unknown one.
+def decode_body(resp, data):
+    try:
+        return str(data, resp.charset or 'utf-8', errors='replace')
+    except LookupError:   # Unknown encoding
+        return str(data, 'utf-8', errors='replace')
+
+
+# Send a GET request for url, once the rate limiter of its host allows it
+# and a slot of the concurrency controller is free, and feed its outcome
+# back to the controller (see send_request() of the crawler).
+# Return the response and its HTML text, which is None for unsuccessful
+# responses.
+async def send_request(session, url, headers, limits):
+    await asyncio.sleep(limits.rate_limiter.wait_time(url))
+    ticket = await limits.acquire()
+    try:
+        async with session.get(url, headers=headers) as resp:
+            html_data = await resp.read() if resp.status == 200 else None
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        limits.release(ticket, congested=True)
+        raise
+    if is_congested(resp.status):
+        limits.release(ticket, congested=True)
+        delay = retry_after(resp.headers)
+        if delay != None:
+            limits.rate_limiter.pause(url, min(delay, limits.max_backoff))
+    else:
+        limits.release(ticket)
+    if html_data == None:
+        return resp, None
+    return resp, decode_body(resp, html_data)
+
+
+# Download an article, retrying at most max_retries times after an
+# exponential backoff (or the delay requested by the server). A 304 (Not
+# Modified) response to a conditional request is not an error.
+# Return the (status, headers, HTML text) of the response or None if all
+# attempts failed. The HTML text is None for 304 responses.
+async def fetch_article(session, url, headers, max_retries, backoff_base,
+        report_error, limits):
+    download_attempts = 0
+    while download_attempts <= max_retries:
+        resp_headers = None
+        try:
+            resp, html_text = await send_request(session, url, headers, limits)
+            if resp.status == 304 or resp.status == 200:
+                return resp.status, resp.headers, html_text
+            resp_headers = resp.headers
+            raise aiohttp.ClientResponseError(resp.request_info,
+                    resp.history, status=resp.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            report_error(url, download_attempts, e)
+        download_attempts += 1
+        if download_attempts <= max_retries:
+            await asyncio.sleep(retry_delay(download_attempts - 1,
+                    resp_headers, backoff_base, limits.max_backoff))
+    return None
+
+
+# Worker coroutine: download hrefs until there are no more left. Storing is
+# delegated to the default executor so that disk I/O does not block the
+# event loop. If metrics is given, the time spent fetching (and decoding)
+# every article and its latency, including retries, are recorded.
+async def worker(session, href_iter, url_prefix, store_article,
+        request_headers, max_retries, backoff_base, report_error, limits,
+        metrics):
+    loop = asyncio.get_running_loop()
+    local_downloads = 0
+    for href in href_iter:
+        url = url_prefix + href
+        headers = request_headers(href) if request_headers != None else None
+        t0 = time.perf_counter()
+        response = await fetch_article(session, url, headers, max_retries,
+                backoff_base, report_error, limits)
+        if metrics != None:
+            # Coroutines interleave in one thread, so stages cannot be
+            # timed with metrics.stage()
+            latency = time.perf_counter() - t0
+            metrics.add_time('fetch', latency)
+            metrics.observe('document_latency_seconds', latency,
+                    LATENCY_BUCKETS)
+        if response is None:
+            continue
+        status, resp_headers, html_text = response
+        local_downloads += await loop.run_in_executor(None, store_article,
+                href, status, resp_headers, html_text)
+    return local_downloads
+
+
+async def download_hrefs(hrefs, url_prefix, store_article, request_headers,
+        max_inflight, max_conns_per_host, max_retries, backoff_base,
+        report_error, rate_limiter, concurrency, max_backoff, metrics,
+        request_timeout):
+    connector = aiohttp.TCPConnector(limit=max_inflight,
+            limit_per_host=max_conns_per_host, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=request_timeout)
+    # A single iterator is shared by all workers; each worker takes the
+    # next href as soon as it is done with the previous one.
+    href_iter = iter(hrefs)
+    limits = RequestLimits(rate_limiter, concurrency, max_backoff)
+    async with aiohttp.ClientSession(connector=connector,
+            timeout=timeout) as session:
+        workers = [worker(session, href_iter, url_prefix, store_article,
+                request_headers, max_retries, backoff_base, report_error,
+                limits, metrics) for i in range(max_inflight)]
+        results = await asyncio.gather(*workers)
+    return sum(results)
+
+
+# Download url_prefix + href for every href in hrefs, keeping at most
+# max_inflight requests in flight and max_conns_per_host open connections
+# per host. store_article(href, status, headers, html_text) is called for
+# every downloaded (or not modified) article and returns the number of
+# stored articles (0 or 1), while report_error(url, attempt, error) is
+# called for every failed attempt. If request_headers is given,
+# request_headers(href) returns extra headers (i.e. conditional request
+# headers) to send when requesting href. Requests go through rate_limiter
+# (a RateLimiter) and the number of requests in flight is further bounded
+# by concurrency (an AIMDController), if given. Fetch times and latencies
+# are recorded in metrics (a Metrics object), if given. Requests time out
+# after request_timeout seconds.
+# Return the total number of stored articles.
+def download_all(hrefs, url_prefix, store_article, report_error,
+        request_headers=None, max_inflight=64, max_conns_per_host=64,
+        max_retries=6, rate_limiter=None, concurrency=None, backoff_base=1.0,
+        max_backoff=60.0, metrics=None, request_timeout=60.0):
+    if rate_limiter == None:
+        rate_limiter = RateLimiter()
+    if concurrency == None:
+        concurrency = AIMDController(max_inflight, min_limit=max_inflight,
+                max_limit=max_inflight)
+    return asyncio.run(download_hrefs(hrefs, url_prefix, store_article,
+            request_headers, max_inflight, max_conns_per_host, max_retries,
+            backoff_base, report_error, rate_limiter, concurrency,
+            max_backoff, metrics, request_timeout))
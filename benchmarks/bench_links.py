@@ -0,0 +1,158 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Equivalence check and micro-benchmark of the streaming link extractor
+# (linkextract.py). The hyperlinks it extracts from every article must be
+# the same as the ones found by the original BeautifulSoup-based
+# parse_hrefs(), kept below as the reference, no matter how the article is
+# split in chunks. Articles are the HTML files of the repository (if any),
+# a page with the corner cases of the tokenizer and pages generated by the
+# mock server of throttle_server.py.
+#
+# Usage (from the top-level directory):
+#     python benchmarks/bench_links.py [--files=N] [--pages=N] [--rounds=N]
+
+
+import os
+import sys
+import time
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from linkextract import LinkExtractor, is_article_href
+import throttle_server
+
+
+EXCLUDED = ('ISO_', 'IEEE_', '802.', 'IEC_')   # As in the 'small' profile
+
+CORNER_CASES = '''<!DOCTYPE html><html><head><title>T</title></head><body>
+<div id="content"><a href="/wiki/Before_content">x</a></div>
+<h1 id="firstHeading">T</h1>
+<DIV class="mw-body-content" ID='mw-content-text' lang="en"><div class="mw-parser-output">
+<p><a href="/wiki/First">1</a> <A HREF='/wiki/Second'>2</A> <a title="t" href=/wiki/Third>3</a>
+<a href="/wiki/Caf%C3%A9">4</a> <a href="/wiki/Fish_&amp;_chips">5</a> <a>no href</a>
+<a href="/wiki/Talk:First">talk</a> <a href="/wiki/First#History">section</a>
+<a href="/w/index.php?title=First">index</a> <a href="https://example.org/wiki/X">ext</a>
+<a href="/wiki/ISO_8601">iso</a> <a href="/wiki/IEEE_802.11">ieee</a>
+<a href="/wiki/Sub/page">sub</a> <a href="/wiki/Ελλάδα">utf8</a></p>
+<!-- <a href="/wiki/In_comment">c</a> </div> -->
+<div><div><a href="/wiki/Nested">n</a></div></div>
+<abbr title="x">abbr</abbr> <a
+    href="/wiki/Multiline">m</a>
+</div></div>
+<div class="printfooter"><a href="/wiki/After_content">y</a></div>
+</body></html>'''
+
+
+# Reference version of parse_hrefs() of the crawlers.
+def ref_parse_hrefs(html_text, excluded_substrings):
+    hrefs = []
+    soup = BeautifulSoup(html_text, 'html.parser')
+    links = soup.find('div', id='mw-content-text').find_all('a')
+    for link in links:
+        href = str(link.get('href'))
+        if is_article_href(href, excluded_substrings):
+            hrefs.append(href)
+    return hrefs
+
+
+# Return the hyperlinks extracted from html_bytes fed in chunks of
+# chunk_size bytes.
+def stream_hrefs(html_bytes, excluded_substrings, chunk_size):
+    extractor = LinkExtractor(excluded_substrings)
+    hrefs = []
+    for lb in range(0, len(html_bytes), chunk_size):
+        hrefs += extractor.feed(html_bytes[lb:lb + chunk_size])
+        if extractor.done:
+            break
+    return hrefs
+
+
+# Return the minimum time (seconds) of rounds calls of function().
+def time_function(function):
+    best = None
+    for i in range(rounds):
+        t0 = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - t0
+        if best == None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def load_articles():
+    articles = [('corner cases', CORNER_CASES)]
+    if os.path.isdir(repo_path):
+        html_files = sorted(f for f in os.listdir(repo_path) if f.endswith('.html'))
+        for hf in html_files[:num_files]:
+            with open(repo_path + hf, mode='r', encoding='utf-8') as infile:
+                articles.append((hf, infile.read()))
+    for n in range(num_pages):
+        title = 'Article_%d' % (n)
+        articles.append((title, throttle_server.generate_page(title)))
+    return articles
+
+
+def main():
+    mismatches = 0
+    total_ref_time = total_new_time = 0.0
+    for name, html_text in load_articles():
+        html_bytes = html_text.encode('utf-8')
+        for excluded in [(), EXCLUDED]:
+            expected = ref_parse_hrefs(html_text, excluded)
+            for chunk_size in chunk_sizes:
+                if stream_hrefs(html_bytes, excluded, chunk_size) != expected:
+                    print('Mismatch: \'%s\' (chunks of %d bytes, excluded %s)' %
+                            (name, chunk_size, excluded))
+                    mismatches += 1
+        total_ref_time += time_function(lambda: ref_parse_hrefs(
+                html_bytes.decode('utf-8'), ()))
+        total_new_time += time_function(lambda: stream_hrefs(html_bytes, (),
+                2**16))
+    print('BeautifulSoup %.2fms, streaming %.2fms (%.2fx), %d mismatches' %
+            (total_ref_time * 1000, total_new_time * 1000,
+            total_ref_time / max(total_new_time, 1e-9), mismatches))
+    if mismatches != 0:
+        exit(1)
+
+
+###############
+# Global data #
+###############
+repo_path = './repository/'  # Where downloaded HTML files are stored
+num_files = 200  # Number of HTML files of the repository to check
+num_pages = 50  # Number of generated pages to check
+rounds = 3  # Every extractor is timed rounds times per article; the minimum is kept
+chunk_sizes = [1, 7, 4096, 2**16]  # Chunk sizes the articles are split in
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    for arg in args:
+        if arg.startswith("--files="):
+            num_files = int(arg.split('=', 1)[1])
+        elif arg.startswith("--pages="):
+            num_pages = int(arg.split('=', 1)[1])
+        elif arg.startswith("--rounds="):
+            rounds = int(arg.split('=', 1)[1])
+        else:
+            print("Uknown command-line argument: '" + arg + "'", file=sys.stderr)
+            exit(1)
+    main()
@@ -0,0 +1,167 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Equivalence check and micro-benchmark of the text normalizers of
+# preprocess.py (cleanup_section() and remove_matching_parentheses()). The
+# original implementations are kept below as the reference. Both versions
+# are first run on random strings made of the characters the normalizers
+# care about (whitespace, punctuation and parentheses), which must produce
+# identical output, and then timed on long generated sections.
+#
+# Usage (from the top-level directory):
+#     python benchmarks/bench_normalize.py [--cases=N] [--seed=N] [--size=N]
+
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import preprocess
+
+
+##########################################
+# Reference implementation               #
+##########################################
+def ref_remove_matching_parentheses(string):
+    stack = []
+    new_str = ''
+    for c in string:
+        if c == '(':
+            stack.append(c)
+        if len(stack) == 0:
+            new_str += c
+        if c == ')':
+            if len(stack) == 0:
+                continue
+            stack.pop()
+    # The 'Mismatching parentheses' message is not reproduced
+    new_str = new_str.replace('  ', ' ')
+    return new_str
+
+
+def ref_cleanup_section(string):
+    string = string.replace('\t', ' ')
+    while '  ' in string:
+        string = string.replace('  ', ' ')
+    while ' \n' in string:
+        string = string.replace(' \n', '\n')
+    while '\n ' in string:
+        string = string.replace('\n ', '\n')
+    while '\n\n' in string:
+        string = string.replace('\n\n', '\n')
+    while ' ,' in string:
+        string = string.replace(' ,', ',')
+    while ' .' in string:
+        string = string.replace(' .', '.')
+    return string.strip()
+
+
+# Return a random string of at most max_length characters. Words are mixed
+# with runs of the characters handled by the normalizers, so that all of
+# their corner cases (long runs, nesting, unmatched parentheses) come up.
+def random_string(rng, max_length):
+    tokens = [' ', '\t', '\n', ',', '.', '(', ')', 'a', 'word', '\xa0']
+    parts = []
+    while len(parts) < max_length:
+        token = rng.choice(tokens)
+        parts.append(token * rng.choice([1, 1, 1, 2, 3, 7]))
+    return ''.join(parts)[:rng.randint(0, max_length)]
+
+
+# Return a long section resembling the text of a reference list.
+def generate_section(rng, size):
+    words = ['Retrieved', 'Journal', '(2019)', '(in French)', 'p.', 'pp.',
+            'doi', ',', '.', '  ', '\n', ' \n \n', '\t', 'ISBN', '(ed.)']
+    parts = []
+    length = 0
+    while length < size:
+        word = rng.choice(words)
+        parts += (word, ' ')
+        length += len(word) + 1
+    return ''.join(parts)
+
+
+# Return the minimum time (seconds) of rounds calls of function(string).
+def time_function(function, string):
+    best = None
+    for i in range(rounds):
+        t0 = time.perf_counter()
+        function(string)
+        elapsed = time.perf_counter() - t0
+        if best == None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    rng = random.Random(seed)
+    pairs = [('cleanup_section', ref_cleanup_section,
+                preprocess.cleanup_section),
+            ('remove_matching_parentheses', ref_remove_matching_parentheses,
+                preprocess.remove_matching_parentheses)]
+    # Silence the 'Mismatching parentheses' messages of random strings
+    preprocess.perror = lambda *args, **kwargs: None
+    mismatches = 0
+    for i in range(num_cases):
+        string = random_string(rng, rng.choice([8, 32, 256]))
+        for name, ref_function, function in pairs:
+            if ref_function(string) != function(string):
+                print('%s: output mismatch for %r' % (name, string))
+                mismatches += 1
+    print('%d random strings checked, %d mismatches\n' % (num_cases, mismatches))
+    section = generate_section(rng, section_size)
+    for name, ref_function, function in pairs:
+        if ref_function(section) != function(section):
+            print('%s: output mismatch for the generated section' % (name))
+            mismatches += 1
+            continue
+        ref_time = time_function(ref_function, section)
+        new_time = time_function(function, section)
+        print('%-28s %7d chars: reference %9.2fms, current %9.2fms (%.2fx)' %
+                (name, len(section), ref_time * 1000, new_time * 1000,
+                ref_time / new_time))
+    if mismatches != 0:
+        exit(1)
+
+
+###############
+# Global data #
+###############
+num_cases = 100000  # Number of random strings to check
+seed = 0  # Seed of the random string generator
+section_size = 1000000  # Size of the generated section that is timed (chars)
+rounds = 3  # Every normalizer is timed rounds times; the minimum is kept
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    for arg in args:
+        if arg.startswith("--cases="):
+            num_cases = int(arg.split('=', 1)[1])
+        elif arg.startswith("--seed="):
+            seed = int(arg.split('=', 1)[1])
+        elif arg.startswith("--size="):
+            section_size = int(arg.split('=', 1)[1])
+        else:
+            preprocess.perror("Uknown command-line argument: '" + arg + "'")
+            exit(1)
+    main()
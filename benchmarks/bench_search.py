@@ -0,0 +1,190 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Equivalence check and benchmark of the query engine (search.py). An index
+# of synthetic documents, whose words follow a Zipf distribution like the
+# words of real text, is built with invindex.IndexWriter (in several runs,
+# which are merged, so merged skips are exercised too). Then random queries
+# of 1 to 4 words are run both with MaxScore and exhaustively: the scores of
+# the top-k documents must be the same (documents with equal scores may be
+# ranked differently). The time to open the index and the latency
+# percentiles of both modes are reported.
+#
+# Usage (from the top-level directory):
+#     python benchmarks/bench_search.py [--docs=N] [--queries=N] [--top=N]
+#             [--index=DIR]
+# An existing index is reused if --index is given and the index exists.
+
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import invindex
+import search
+
+
+# Return the vocabulary and the cumulative weights of its words.
+def zipf_vocabulary(rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    vocabulary = []
+    while len(vocabulary) < vocabulary_size:
+        word = ''.join(rng.choice(letters) for i in range(rng.randrange(2, 10)))
+        vocabulary.append(word)
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, vocabulary_size + 1):
+        total += 1 / rank
+        cum_weights.append(total)
+    return vocabulary, cum_weights
+
+
+def words(rng, vocabulary, cum_weights, count):
+    return ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=count))
+
+
+# Return a synthetic document in the form of
+# preprocess.render_json_document().
+def generate_document(rng, vocabulary, cum_weights, n):
+    title = words(rng, vocabulary, cum_weights, rng.randrange(1, 4))
+    sections = [{'heading': title,
+            'content': words(rng, vocabulary, cum_weights, rng.randrange(20, 100))}]
+    for i in range(rng.randrange(1, 6)):
+        sections.append({'heading': words(rng, vocabulary, cum_weights, 2),
+                'content': words(rng, vocabulary, cum_weights, rng.randrange(20, 150))})
+    return {
+        'url': 'https://en.wikipedia.org/wiki/Document_%d' % (n),
+        'title': title,
+        'sections': sections,
+        'summary': words(rng, vocabulary, cum_weights, 20),
+        'infobox': ''
+    }
+
+
+def build_index(path):
+    rng = random.Random(0)
+    vocabulary, cum_weights = zipf_vocabulary(rng)
+    os.makedirs(path, exist_ok=True)
+    writer = invindex.IndexWriter(os.path.join(path, invindex.RUN_PREFIX + '000'))
+    for n in range(num_docs):
+        writer.add('Document_%d' % (n), generate_document(rng, vocabulary,
+                cum_weights, n))
+    writer.close()
+    return invindex.merge_runs(path)
+
+
+# Return num_queries queries of 1 to 4 words, drawn from the vocabulary
+# the same way as the words of the documents.
+def generate_queries():
+    rng = random.Random(1)
+    vocabulary, cum_weights = zipf_vocabulary(random.Random(0))
+    return [words(rng, vocabulary, cum_weights, rng.randrange(1, 5))
+            for i in range(num_queries)]
+
+
+# Return the results and the latencies (seconds) of queries.
+def run_queries(searcher, queries, exhaustive):
+    results = []
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(searcher.top_k(q, top_k, exhaustive))
+        latencies.append(time.perf_counter() - t0)
+    return results, latencies
+
+
+def same_scores(top_a, top_b):
+    if len(top_a) != len(top_b):
+        return False
+    for (score_a, doc_a), (score_b, doc_b) in zip(top_a, top_b):
+        if abs(score_a - score_b) > 1e-9 * max(1.0, score_a):
+            return False
+    return True
+
+
+def main():
+    path = index_path
+    temporary = path == None
+    if temporary:
+        path = tempfile.mkdtemp(prefix='bench-index-')
+    try:
+        if not os.path.exists(os.path.join(path, invindex.META_FILENAME)):
+            t0 = time.perf_counter()
+            runs = build_index(path)
+            print('Indexed %d documents (%d runs) in %.2f sec' % (num_docs,
+                    runs, time.perf_counter() - t0))
+        t0 = time.perf_counter()
+        searcher = search.Searcher(path)
+        print('Opened the index (%d documents, %d terms) in %.2fms' %
+                (searcher.reader.num_docs, searcher.reader.num_terms,
+                (time.perf_counter() - t0) * 1000))
+        queries = generate_queries()
+        max_score_results, max_score_latencies = run_queries(searcher, queries,
+                False)
+        exhaustive_results, exhaustive_latencies = run_queries(searcher, queries,
+                True)
+        mismatches = 0
+        for q, top_a, top_b in zip(queries, max_score_results, exhaustive_results):
+            if not same_scores(top_a, top_b):
+                print('Mismatch: \'%s\'' % (q))
+                mismatches += 1
+        print('MaxScore:   ', end='')
+        search.print_latencies(max_score_latencies)
+        print('Exhaustive: ', end='')
+        search.print_latencies(exhaustive_latencies)
+        print('%.2fx faster, %d mismatches' % (sum(exhaustive_latencies) /
+                sum(max_score_latencies), mismatches))
+        searcher.close()
+    finally:
+        if temporary:
+            shutil.rmtree(path, ignore_errors=True)
+    if mismatches != 0:
+        exit(1)
+
+
+###############
+# Global data #
+###############
+index_path = None  # Where the index is stored (None: a temporary directory)
+num_docs = 100000  # Number of documents indexed
+num_queries = 200  # Number of queries run
+top_k = 10  # Number of results per query
+vocabulary_size = 50000  # Number of distinct words of the documents
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    for arg in args:
+        if arg.startswith("--docs="):
+            num_docs = int(arg.split('=', 1)[1])
+        elif arg.startswith("--queries="):
+            num_queries = int(arg.split('=', 1)[1])
+        elif arg.startswith("--top="):
+            top_k = int(arg.split('=', 1)[1])
+        elif arg.startswith("--index="):
+            index_path = os.path.join(arg.split('=', 1)[1], '')
+        else:
+            print("Uknown command-line argument: '" + arg + "'", file=sys.stderr)
+            exit(1)
+    main()
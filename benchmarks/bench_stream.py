@@ -0,0 +1,205 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Equivalence check and memory benchmark of the streaming mode of
+# preprocess.py (stream_article()). Every HTML file of the repository (or
+# of a synthetic fixture set, see fixtures.py, if there are none) is parsed
+# both as a whole and in streaming mode, using small chunks so that almost
+# every section is split: the virtual XML documents must be identical,
+# including those of articles that repeat a heading, which are parsed
+# again with all sections kept until the end (see stream_article()). So
+# must those of a copy of every article with elements whose end tag is
+# implied (i.e. <li>one<li>two</ul>, <p>a<p>b) before every <h2>, whose
+# content must still be delimited (see split_content()).
+# Then an article --scale times larger than the largest one (its content is
+# repeated) is parsed in both modes and the peak memory allocated by each
+# (as traced by tracemalloc) is reported.
+#
+# Usage (from the top-level directory):
+#     python benchmarks/bench_stream.py [--repo=DIR] [--chunk-size=N]
+#             [--scale=N] [--parser=P]
+
+
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+
+benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarks_path, '..'))
+import preprocess
+import fixtures
+
+
+# Return the virtual XML document of html_text, parsed as a whole.
+def render_whole(hf, html_text):
+    dictionary, url, date_modified, date_published = \
+            preprocess.parse_article(hf, parser, html_text)
+    if dictionary == {} or url == None:
+        return None
+    return preprocess.render_virtual_xml(dictionary, url, date_modified,
+            date_published)
+
+
+# Return the virtual XML document of html_text, parsed in streaming mode,
+# and whether it had to be parsed again because a heading was repeated.
+def render_streamed(hf, html_text):
+    try:
+        return render_sections(html_text, False), False
+    except preprocess.RepeatedHeading:
+        return render_sections(html_text, True), True
+
+
+# Return None if the content of html_text cannot be delimited.
+def render_sections(html_text, buffered):
+    streamed = preprocess.stream_article(html_text, parser, buffered)
+    if streamed == None:
+        return None
+    sections, url, date_modified, date_published = streamed
+    parts = preprocess.virtual_xml_header(url, date_modified, date_published)
+    first_key = True
+    for key, string in sections:
+        parts += preprocess.virtual_xml_section(key, string, first_key)
+        first_key = False
+    parts.append('</document>\n')
+    return ''.join(parts)
+
+
+# Return an article whose content is the content of html_text repeated
+# scale times. The headings of every copy are numbered, so that none is
+# repeated (which would make streaming keep all sections until the end).
+def scale_article(html_text):
+    content_tag, content_end, chunks = preprocess.split_content(html_text)
+    content = html_text[content_tag.end():content_end]
+    copies = [re.sub(r'(<h2[^>]*>)', r'\g<1>%d ' % (i), content)
+            for i in range(scale)]
+    return (html_text[:content_tag.end()] + ''.join(copies) +
+            html_text[content_end:])
+
+
+# Return a copy of html_text with IMPLIED_END_TAGS before every <h2> of its
+# content.
+def imply_end_tags(html_text):
+    content_tag, content_end, chunks = preprocess.split_content(html_text)
+    content = html_text[content_tag.end():content_end]
+    return (html_text[:content_tag.end()] +
+            re.sub(r'(<h2[^>]*>)', IMPLIED_END_TAGS + r'\g<1>', content) +
+            html_text[content_end:])
+
+
+# Return the peak memory (bytes) allocated by render(hf, html_text) and the
+# time it took.
+def trace_peak(render, hf, html_text):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    render(hf, html_text)
+    elapsed = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main():
+    path = repo_path
+    synthetic_path = None
+    if len(fixtures.list_fixtures(path)) == 0:
+        synthetic_path = tempfile.mkdtemp(prefix='bench-fixtures-')
+        path = synthetic_path
+        fixtures.generate_fixtures(path, num_synthetic)
+    try:
+        articles = {}
+        for hf in fixtures.list_fixtures(path):
+            with open(os.path.join(path, hf), mode='r', encoding='utf-8') as infile:
+                articles[hf] = infile.read()
+    finally:
+        if synthetic_path != None:
+            shutil.rmtree(synthetic_path, ignore_errors=True)
+    preprocess.stream_chunk_size = chunk_size
+    mismatches = 0
+    repeated_count = 0
+    for hf, html_text in articles.items():
+        streamed, repeated = render_streamed(hf, html_text)
+        if repeated:
+            repeated_count += 1
+        if render_whole(hf, html_text) != streamed:
+            print('Output mismatch: \'%s\'' % (hf))
+            mismatches += 1
+    print('%d/%d HTML files produced identical output in streaming mode '
+            '(%d parsed again: a heading was repeated)' %
+            (len(articles) - mismatches, len(articles), repeated_count))
+    implied_mismatches = 0
+    for hf, html_text in articles.items():
+        html_text = imply_end_tags(html_text)
+        streamed, repeated = render_streamed(hf, html_text)
+        if streamed == None or render_whole(hf, html_text) != streamed:
+            print('Output mismatch with implied end tags: \'%s\'%s' %
+                    (hf, ' (content not delimited)' if streamed == None else ''))
+            implied_mismatches += 1
+    print('%d/%d HTML files with implied end tags produced identical output '
+            'in streaming mode' % (len(articles) - implied_mismatches,
+                len(articles)))
+    mismatches += implied_mismatches
+
+    preprocess.stream_chunk_size = 2**18
+    hf = max(articles, key=lambda hf: len(articles[hf]))
+    html_text = scale_article(articles[hf])
+    print('Largest article: \'%s\' x %d [%.1f MB]' % (hf, scale,
+            len(html_text) / 2**20))
+    whole_peak, whole_time = trace_peak(render_whole, hf, html_text)
+    streamed_peak, streamed_time = trace_peak(render_streamed, hf, html_text)
+    print('Whole:     peak %7.1f MB, %.2f sec' % (whole_peak / 2**20, whole_time))
+    print('Streaming: peak %7.1f MB, %.2f sec' % (streamed_peak / 2**20,
+            streamed_time))
+    print('%.1fx less memory' % (whole_peak / streamed_peak))
+    if mismatches != 0:
+        exit(1)
+
+
+###############
+# Global data #
+###############
+repo_path = './repository/'  # Where downloaded HTML files are stored
+num_synthetic = 120  # Number of articles generated if the repository is empty
+chunk_size = 512  # Characters parsed at once by the equivalence check
+scale = 50  # How many times the content of the largest article is repeated
+parser = 'html5lib'  # Tree builder used by BeautifulSoup
+# Elements closed without an end tag, by the start tag of another element
+IMPLIED_END_TAGS = ('<ul><li>one<li>two</ul><p>a<p>b<dl><dt>term<dd>definition'
+        '</dl><table><tr><th>x<td>1<td>2<tr><td>3</table><p>c')
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    for arg in args:
+        if arg.startswith("--repo="):
+            repo_path = os.path.join(arg.split('=', 1)[1], '')
+        elif arg.startswith("--chunk-size="):
+            chunk_size = int(arg.split('=', 1)[1])
+        elif arg.startswith("--scale="):
+            scale = int(arg.split('=', 1)[1])
+        elif arg.startswith("--parser=") and arg[9:] in preprocess.PARSER_BACKENDS:
+            parser = arg[9:]
+        else:
+            preprocess.perror("Uknown command-line argument: '" + arg + "'")
+            exit(1)
+    main()
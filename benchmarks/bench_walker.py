@@ -0,0 +1,288 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Micro-benchmark of the DOM walker of preprocess.py. The largest HTML files
+# of the repository (or of a synthetic fixture set, see fixtures.py, if
+# there are none) are parsed by both the current (iterative) walker and
+# the original recursive one, kept below as the reference implementation.
+# The extracted sections must be identical; the time spent walking the
+# already built tree (i.e. excluding BeautifulSoup) is reported for both.
+#
+# Usage (from the top-level directory):
+#     python benchmarks/bench_walker.py [--repo=DIR] [--files=N] [--rounds=N]
+#             [--parser=P]
+
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from bs4 import BeautifulSoup, NavigableString, Comment
+
+benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarks_path, '..'))
+import preprocess
+import fixtures
+from preprocess import find_in, get_img_alt_text, NO_DESC_AVAIL
+
+
+##########################################
+# Reference (recursive) implementation   #
+##########################################
+def ref_parse_sup(c, level, in_infobox):
+    string = ref_parse_childrenof(c, level, ignore_hrefs=True, in_infobox=in_infobox)
+    if string != '':
+        string  = '^' + string
+    return string
+
+
+def ref_add_to_misc(key, string, join_str):
+    global misc
+    if key in misc:
+        misc[key] += join_str + string
+    else:
+        misc[key] = string
+
+
+def ref_parse_childrenof(c, level, ignore_hrefs=False, in_infobox=False):
+    string = ''
+    for inner_c in c.children:
+        string += ref_parse_child(inner_c, level+1, ignore_hrefs, in_infobox)
+    return string
+
+
+def ref_parse_child(c, level, ignore_hrefs=False, in_infobox=False):
+    global curr_heading, read_summary, title
+    if isinstance(c, Comment):
+        return ''
+    if isinstance(c, NavigableString):
+        return c.string
+    if c.name == 'style':
+        return ''
+    if c.name == 'script':
+        return ''
+    if c.name == 'caption':
+        return ''
+    if c.name == 'a' and ignore_hrefs == True:
+        return ''
+    if c.name == 'span':
+        if c.has_attr('id'):
+            ids = c.attrs['id']
+            if find_in(ids, 'coordinates'):
+                return ''
+    if c.has_attr('role'):
+        roles = c.attrs['role']
+        if 'note' in roles:
+            return ''
+        if 'presentation' in roles:
+            return ''
+        if 'navigation' in roles:
+            return ''
+    if c.has_attr('class'):
+        classes = c.attrs['class']
+        if find_in(classes, 'navbox', search_type='contains'):
+            return ''
+        if find_in(classes, 'noprint'):
+            return ''
+        if find_in(classes, 'haudio'):
+            return ''
+        if find_in(classes, 'mw-editsection'):
+            return ''
+        if find_in(classes, 'mw-cite-backlink'):
+            return ''
+        if c.name == 'div':
+            if find_in(classes, 'toc'):
+                return ''
+    if c.name == 'h2':
+        curr_heading = ref_parse_childrenof(c, level, ignore_hrefs, in_infobox)
+        plain_text[curr_heading] = ''
+        if curr_heading != title:
+            read_summary = False
+        return ''
+    if c.name in ['h3','h4','h5','h6']:
+        string = ref_parse_childrenof(c, level, ignore_hrefs, in_infobox)
+        plain_text[curr_heading] += string
+        return string
+    if c.name == 'p' and level == 0 and read_summary == True:
+        string = ref_parse_childrenof(c, level, ignore_hrefs, in_infobox)
+        ref_add_to_misc('__summary__', string, ' ')
+        return string
+    if c.name == 'blockquote':
+        string = ref_parse_childrenof(c, level, ignore_hrefs, in_infobox)
+        ref_add_to_misc('__quotes__', string, '\n')
+        plain_text[curr_heading] += string
+        return ''
+    if c.name == 'tr':
+        string = ref_parse_childrenof(c, level, ignore_hrefs, in_infobox)
+        string = string.replace('\n', ' ')
+        return string
+    if c.name == 'th' and in_infobox == True:
+        string = ref_parse_childrenof(c, level, ignore_hrefs, in_infobox=True)
+        return ' ' + string + ' '
+    if c.has_attr('class'):
+        classes = c.attrs['class']
+        if c.name == 'div':
+            if find_in(classes, 'quotebox'):
+                string = ref_parse_childrenof(c, level, ignore_hrefs, in_infobox)
+                ref_add_to_misc('__quotes__', string, '\n')
+                return ''
+        if find_in(classes, 'thumbcaption'):
+            string = ref_parse_childrenof(c, level, ignore_hrefs, in_infobox)
+            ref_add_to_misc('__multimedia__', string, '\n')
+            return ''
+        if find_in(classes, 'gallerytext'):
+            string = ref_parse_childrenof(c, level, ignore_hrefs, in_infobox)
+            ref_add_to_misc('__multimedia__', string, '\n')
+            return ''
+        if find_in(classes, 'infobox'):
+            string = ref_parse_childrenof(c, level, ignore_hrefs, in_infobox=True)
+            ref_add_to_misc('__infobox__', string, '\n')
+            return ''
+        if find_in(classes, 'mwe-math-element'):
+            img = c.find('img')
+            return get_img_alt_text(img)
+        if c.name == 'sup':
+            if find_in(classes, 'reference'):
+                return ''
+            elif find_in(classes, 'plainlinks'):
+                return ''
+            else:
+                return ref_parse_sup(c, level, in_infobox)
+        if c.name == 'sub':
+            return '_' + ref_parse_childrenof(c, level, ignore_hrefs, in_infobox)
+        if c.name == 'table':
+            if find_in(classes, 'clade'):
+                return ''
+    else:
+        if c.name == 'sup':
+            return ref_parse_sup(c, level, in_infobox)
+        if c.name == 'sub':
+            return '_' + ref_parse_childrenof(c, level, ignore_hrefs, in_infobox)
+    return ref_parse_childrenof(c, level, ignore_hrefs, in_infobox)
+
+
+# Reference version of preprocess.extract_sections().
+def ref_extract_sections(soup):
+    global plain_text, misc, curr_heading, read_summary, title
+    plain_text = {}
+    misc = {}
+    read_summary = True
+    title = ref_parse_childrenof(soup.body.find('h1', id='firstHeading'), level=0)
+    content = soup.find('div', id='mw-content-text').contents[0]
+    curr_heading = title
+    plain_text[curr_heading] = ''
+    for c in content.children:
+        plain_text[curr_heading] += ref_parse_child(c, level = 0)
+    if '__summary__' not in misc:
+        ref_add_to_misc('__summary__', NO_DESC_AVAIL, '')
+    return dict(plain_text, **misc)
+
+
+# Return the minimum time (seconds) of rounds calls of extract(soup).
+def time_walker(extract, soup):
+    best = None
+    for i in range(rounds):
+        t0 = time.perf_counter()
+        extract(soup)
+        elapsed = time.perf_counter() - t0
+        if best == None or elapsed < best:
+            best = elapsed
+    return best
+
+
+# Return {filename: HTML text} of the num_files largest HTML files stored
+# in path.
+def load_largest(path):
+    html_files = fixtures.list_fixtures(path)
+    sizes = {f: os.path.getsize(os.path.join(path, f)) for f in html_files}
+    articles = {}
+    for hf in sorted(html_files, key=lambda f: sizes[f], reverse=True)[:num_files]:
+        with open(os.path.join(path, hf), mode='r', encoding='utf-8') as infile:
+            articles[hf] = infile.read()
+    return articles
+
+
+def main():
+    path = repo_path
+    synthetic_path = None
+    if len(fixtures.list_fixtures(path)) == 0:
+        synthetic_path = tempfile.mkdtemp(prefix='bench-fixtures-')
+        path = synthetic_path
+        fixtures.generate_fixtures(path, num_synthetic)
+    try:
+        articles = load_largest(path)
+    finally:
+        if synthetic_path != None:
+            shutil.rmtree(synthetic_path, ignore_errors=True)
+    mismatches = 0
+    total_ref_time = total_new_time = 0.0
+    print('%-50s %9s %11s %11s %8s' % ('File', 'KiB', 'Recursive', 'Iterative',
+            'Speedup'))
+    for hf, html_text in articles.items():
+        soup = BeautifulSoup(html_text, parser)
+        if ref_extract_sections(soup) != preprocess.extract_sections(soup):
+            print('Output mismatch: \'%s\'' % (hf))
+            mismatches += 1
+            continue
+        ref_time = time_walker(ref_extract_sections, soup)
+        new_time = time_walker(preprocess.extract_sections, soup)
+        total_ref_time += ref_time
+        total_new_time += new_time
+        print('%-50s %9.1f %9.2fms %9.2fms %7.2fx' % (hf[:50],
+                len(html_text.encode('utf-8')) / 1024,
+                ref_time * 1000, new_time * 1000, ref_time / new_time))
+    print('\nTotal: recursive %.2fms, iterative %.2fms (%.2fx), %d mismatches' %
+            (total_ref_time * 1000, total_new_time * 1000,
+            total_ref_time / max(total_new_time, 1e-9), mismatches))
+    if mismatches != 0:
+        exit(1)
+
+
+###############
+# Global data #
+###############
+repo_path = './repository/'  # Where downloaded HTML files are stored
+num_synthetic = 50  # Number of articles generated if the repository is empty
+num_files = 20  # Number of (largest) HTML files to benchmark
+rounds = 5  # Every walker is timed rounds times per file; the minimum is kept
+parser = 'html5lib'  # Tree builder used by BeautifulSoup
+plain_text = {}
+misc = {}
+curr_heading = ''
+read_summary = True
+title = ''
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    for arg in args:
+        if arg.startswith("--repo="):
+            repo_path = os.path.join(arg.split('=', 1)[1], '')
+        elif arg.startswith("--files="):
+            num_files = int(arg.split('=', 1)[1])
+        elif arg.startswith("--rounds="):
+            rounds = int(arg.split('=', 1)[1])
+        elif arg.startswith("--parser=") and arg[9:] in preprocess.PARSER_BACKENDS:
+            parser = arg[9:]
+        else:
+            preprocess.perror("Uknown command-line argument: '" + arg + "'")
+            exit(1)
+    main()
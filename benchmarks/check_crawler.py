@@ -0,0 +1,412 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# End-to-end checks of crawler.py, which crawls a fixture set (see
+# fixtures.py) served by throttle_server.py. Every crawl runs crawler.py
+# (small profile) in a process of its own, inside a temporary directory.
+# The checks are:
+#  - engines: the articles of the fixture set are downloaded by the threaded
+#    download engine and by the asyncio one (--async); both must store the
+#    same articles with the same HTML text,
+#  - incremental: the fixture set is crawled from a server that sends HTTP
+#    validators (--validators of throttle_server.py) and then updated
+#    (--incremental) three times: every article must be found not modified,
+#    1) by a 304 response, 2) by its unchanged revision, once the server has
+#    changed all validators (--generation), and 3) by a 304 response again,
+#    as the new validators were saved,
+#  - compaction: the fixture set is crawled into segment files
+#    (--storage=segments) and updated (--update) three times; the segment
+#    files must be compacted, so that at most half of them is ever stale,
+#    without losing or changing any article,
+#  - concurrency: generated pages of very different sizes (--size-spread of
+#    throttle_server.py) are crawled; the concurrency limit must never be
+#    decreased unless the server starts rejecting requests (--capacity),
+#  - pipeline: the fixture set is crawled and preprocessed (--pipeline)
+#    into a repository and a corpus given by --repo and --corpus, from a
+#    directory without ./repository/ and from one with an unrelated
+#    ./repository/; every stored article must be in the corpus,
+#  - encoding: the fixture set is downloaded by both engines from a server
+#    whose pages are not valid UTF-8 (--invalid-utf8 of throttle_server.py),
+#    first with their charset and then with an unknown one (--charset); the
+#    malformed bytes must be replaced, so that both engines store every
+#    article with the same HTML text.
+# The name of every check is printed along with PASS or FAIL; the exit
+# status is 1 if any check failed.
+#
+# Usage (from the top-level directory):
+#     python benchmarks/check_crawler.py [--fixtures=DIR] [--synthetic=N]
+#             [--only=NAME,...]
+
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import shutil
+import tempfile
+import subprocess
+import urllib.request
+
+benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarks_path, '..'))
+crawler_filename = os.path.join(benchmarks_path, '..', 'crawler.py')
+import fixtures
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# Start throttle_server.py serving the fixture set (or generated pages, if
+# serve_fixtures is False), with the extra command-line arguments args, and
+# wait until it accepts requests.
+# Return the server process and its URL.
+def start_server(args=[], serve_fixtures=True):
+    port = free_port()
+    if serve_fixtures:
+        args = ['--latency=0', '--fixtures=' + fixtures_path] + args
+    server = subprocess.Popen([sys.executable,
+            os.path.join(benchmarks_path, 'throttle_server.py'),
+            '--port=%d' % (port)] + args, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL)
+    url_prefix = 'http://127.0.0.1:%d' % (port)
+    for i in range(100):
+        try:
+            urllib.request.urlopen(url_prefix + '/stats').read()
+            return server, url_prefix
+        except OSError:
+            if server.poll() != None:
+                break
+            time.sleep(0.1)
+    server.kill()
+    print('Cannot start the fixture server', file=sys.stderr)
+    exit(1)
+
+
+def stop_server(server):
+    server.terminate()
+    server.wait()
+
+
+# Return the number of responses of the server per status code.
+def server_stats(url_prefix):
+    with urllib.request.urlopen(url_prefix + '/stats') as resp:
+        return {int(status): count for status, count in
+                json.loads(resp.read()).items()}
+
+
+# Run crawler.py in work_path with the command-line arguments args, after
+# the ones that point it to url_prefix and the seeds of the fixture set.
+# Return its output, or None if it failed.
+def crawl(work_path, url_prefix, args=[]):
+    seeds_filename = os.path.join(work_path, 'seeds.txt')
+    if not os.path.exists(seeds_filename):
+        with open(seeds_filename, mode='w', encoding='utf-8') as outfile:
+            outfile.write(''.join('/wiki/%s\n' % (fixtures.fixture_title(hf))
+                    for hf in fixtures.list_fixtures(fixtures_path)[:num_seeds]))
+    result = subprocess.run([sys.executable, os.path.abspath(crawler_filename),
+            '--profile=small', '--url-prefix=' + url_prefix,
+            '--seeds=' + seeds_filename, '--target=%d' % (crawl_target())] +
+            args, cwd=work_path, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stdout + result.stderr, file=sys.stderr)
+        return None
+    return result.stdout
+
+
+# Number of articles downloaded by every crawl.
+def crawl_target():
+    return len(fixtures.list_fixtures(fixtures_path))
+
+
+# Return {filename: HTML text} of the articles stored in repo_path.
+def stored_articles(repo_path):
+    articles = {}
+    for hf in fixtures.list_fixtures(repo_path):
+        with open(os.path.join(repo_path, hf), mode='r',
+                encoding='utf-8') as infile:
+            articles[hf] = infile.read()
+    return articles
+
+
+# The frontier is built (and the articles are downloaded) by the threaded
+# engine into work_path/threads<name>/, then the asyncio engine downloads
+# the same articles (--update) into work_path/async<name>/. Both crawls get
+# the command-line arguments args.
+# Return the stored articles of both engines, or None if a crawl failed.
+def crawl_with_engines(work_path, url_prefix, name, args=[]):
+    threads_path = os.path.join(work_path, 'threads' + name, '')
+    async_path = os.path.join(work_path, 'async' + name, '')
+    if crawl(work_path, url_prefix, args + ['--repo=' + threads_path]) == None:
+        return None
+    os.makedirs(async_path)
+    shutil.copy(threads_path + 'urls.txt', async_path)
+    if crawl(work_path, url_prefix, args + ['--async', '--update',
+            '--repo=' + async_path]) == None:
+        return None
+    return stored_articles(threads_path), stored_articles(async_path)
+
+
+# Which alias of an article is stored depends on the order the downloads
+# complete, so with duplicate detection only the stored HTML texts of the
+# engines are compared, while without it (--no-dedup) the stored files are
+# compared one by one.
+def check_engines(work_path):
+    server, url_prefix = start_server()
+    try:
+        passed = True
+        for args in [[], ['--no-dedup']]:
+            articles = crawl_with_engines(work_path, url_prefix, ''.join(args),
+                    args)
+            if articles == None:
+                return False
+            threads, async_ = articles
+            print('    %s: threads: %d articles, async: %d articles' %
+                    (' '.join(args) or 'dedup', len(threads), len(async_)))
+            if args == []:
+                threads = dict.fromkeys(threads.values())
+                async_ = dict.fromkeys(async_.values())
+                passed = passed and set(threads) == set(async_)
+                continue
+            for hf in sorted(set(threads) | set(async_)):
+                if threads.get(hf) != async_.get(hf):
+                    print('    Stored by one engine only or different: '
+                            '\'%s\'' % (hf))
+                    passed = False
+    finally:
+        stop_server(server)
+    return passed
+
+
+# Update the corpus of repo_path (--incremental). Return True if all of
+# its num_articles articles were found not modified and the server replied
+# to not_modified_replies of the requests with 304.
+def incremental_update(work_path, url_prefix, repo_path, num_articles,
+        not_modified_replies):
+    replies = server_stats(url_prefix).get(304, 0)
+    output = crawl(work_path, url_prefix, ['--incremental', '--repo=' + repo_path])
+    if output == None:
+        return False
+    not_modified = output.count('Not modified \'')
+    replies = server_stats(url_prefix).get(304, 0) - replies
+    print('    %d/%d articles not modified, %d replies with 304' %
+            (not_modified, num_articles, replies))
+    return not_modified == num_articles and replies == not_modified_replies
+
+
+def check_incremental(work_path):
+    repo_path = os.path.join(work_path, 'repository', '')
+    server, url_prefix = start_server(['--validators'])
+    try:
+        if crawl(work_path, url_prefix, ['--repo=' + repo_path]) == None:
+            return False
+        articles = stored_articles(repo_path)
+        passed = incremental_update(work_path, url_prefix, repo_path,
+                len(articles), len(articles))
+    finally:
+        stop_server(server)
+    server, url_prefix = start_server(['--validators', '--generation=1'])
+    try:
+        passed = incremental_update(work_path, url_prefix, repo_path,
+                len(articles), 0) and passed
+        passed = incremental_update(work_path, url_prefix, repo_path,
+                len(articles), len(articles)) and passed
+    finally:
+        stop_server(server)
+    return passed and stored_articles(repo_path) == articles
+
+
+# Return {filename: HTML text} of the articles stored in the segment files
+# of repo_path.
+def stored_records(repo_path):
+    from segments import SegmentReader
+    reader = SegmentReader(os.path.join(repo_path, 'segments', ''))
+    articles = dict(reader)
+    reader.close()
+    return articles
+
+
+def check_compaction(work_path):
+    import segments
+    repo_path = os.path.join(work_path, 'repository', '')
+    segments_path = os.path.join(repo_path, 'segments', '')
+    server, url_prefix = start_server()
+    try:
+        args = ['--storage=segments', '--repo=' + repo_path]
+        if crawl(work_path, url_prefix, args) == None:
+            return False
+        articles = stored_records(repo_path)
+        size = segments.segments_size(segments_path)
+        print('    Crawl: %d articles, %.2f MB' % (len(articles), size / 2**20))
+        compacted = False
+        max_stale = 0.0
+        for i in range(3):
+            output = crawl(work_path, url_prefix, args + ['--update'])
+            if output == None:
+                return False
+            compacted = compacted or 'Compacted segment files' in output
+            stale = segments.stale_fraction(segments_path)
+            max_stale = max(max_stale, stale)
+            print('    Update %d: %.2f MB, %.1f%% stale' % (i + 1,
+                    segments.segments_size(segments_path) / 2**20, stale * 100))
+    finally:
+        stop_server(server)
+    return (compacted and max_stale <= 0.5 and
+            stored_records(repo_path) == articles)
+
+
+# Crawl the generated pages of the server started with the command-line
+# arguments args. Return the number of decreases of the concurrency limit,
+# or None if the crawl failed.
+def concurrency_decreases(work_path, args):
+    server, url_prefix = start_server(['--latency=0.02', '--size-spread=10'] +
+            args, serve_fixtures=False)
+    try:
+        output = crawl(work_path, url_prefix, ['--target=300', '--threads=4',
+                '--max-threads=32', '--repo=' + os.path.join(work_path,
+                    'repository' + ''.join(args))])
+    finally:
+        stop_server(server)
+    if output == None:
+        return None
+    summary = re.search(r'Concurrency limit: .*, (\d+) decreases, .*', output)
+    print('    ' + summary.group(0))
+    return int(summary.group(1))
+
+
+def check_concurrency(work_path):
+    decreases = concurrency_decreases(work_path, [])
+    throttled_decreases = concurrency_decreases(work_path, ['--capacity=8'])
+    return (decreases == 0 and throttled_decreases != None and
+            throttled_decreases > 0)
+
+
+def check_pipeline(work_path):
+    server, url_prefix = start_server()
+    try:
+        passed = True
+        for decoy in [False, True]:
+            crawl_path = os.path.join(work_path, 'decoy' if decoy else 'empty')
+            os.makedirs(os.path.join(crawl_path, 'repository') if decoy
+                    else crawl_path)
+            repo_path = os.path.join(work_path, 'repository-%d' % (decoy), '')
+            corpus_path = os.path.join(work_path, 'corpus-%d' % (decoy), '')
+            if crawl(crawl_path, url_prefix, ['--pipeline', '--repo=' + repo_path,
+                    '--corpus=' + corpus_path]) == None:
+                return False
+            articles = fixtures.list_fixtures(repo_path)
+            corpus_files = os.listdir(corpus_path)
+            missing = [hf for hf in articles if hf[:-5] + '.xml' not in corpus_files]
+            print('    %s ./repository/: %d articles, %d missing from the corpus' %
+                    ('Unrelated' if decoy else 'No', len(articles), len(missing)))
+            passed = (passed and len(articles) > 0 and len(missing) == 0 and
+                    'manifest.tsv' in corpus_files and
+                    not os.path.exists(os.path.join(crawl_path, 'corpus')))
+    finally:
+        stop_server(server)
+    return passed
+
+
+def check_encoding(work_path):
+    passed = True
+    for server_args in [['--invalid-utf8'], ['--invalid-utf8', '--charset=x-unknown']]:
+        server, url_prefix = start_server(server_args)
+        try:
+            articles = crawl_with_engines(work_path, url_prefix,
+                    server_args[-1][1:], ['--no-dedup'])
+        finally:
+            stop_server(server)
+        if articles == None:
+            return False
+        threads, async_ = articles
+        replaced = [hf for hf, html_text in async_.items() if '\ufffd' in html_text]
+        print('    %s: threads: %d articles, async: %d articles, %d with '
+                'replaced bytes' % (' '.join(server_args), len(threads),
+                    len(async_), len(replaced)))
+        passed = (passed and len(threads) == crawl_target() and
+                threads == async_ and len(replaced) == len(async_))
+    return passed
+
+
+def main():
+    global fixtures_path
+    synthetic_path = None
+    if len(fixtures.list_fixtures(fixtures_path)) == 0:
+        # No recorded fixture set; check against a synthetic one
+        synthetic_path = tempfile.mkdtemp(prefix='check-fixtures-')
+        fixtures_path = synthetic_path
+        fixtures.generate_fixtures(fixtures_path, num_synthetic)
+    failures = 0
+    try:
+        for name in selected_checks:
+            print('Checking %s...' % (name))
+            work_path = tempfile.mkdtemp(prefix='check-%s-' % (name))
+            try:
+                passed = CHECKS[name](work_path)
+            finally:
+                shutil.rmtree(work_path, ignore_errors=True)
+            print('%s: %s' % (name, 'PASS' if passed else 'FAIL'))
+            if not passed:
+                failures += 1
+    finally:
+        if synthetic_path != None:
+            shutil.rmtree(synthetic_path, ignore_errors=True)
+    if failures > 0:
+        exit(1)
+
+
+###############
+# Global data #
+###############
+CHECKS = {
+    'engines': check_engines,
+    'incremental': check_incremental,
+    'compaction': check_compaction,
+    'concurrency': check_concurrency,
+    'pipeline': check_pipeline,
+    'encoding': check_encoding
+}
+fixtures_path = os.path.join(benchmarks_path, 'fixtures')  # Recorded fixture set
+num_synthetic = 60  # Number of articles generated if there is no recorded fixture set
+num_seeds = 3  # Number of fixtures used as seeds
+selected_checks = list(CHECKS)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    for arg in args:
+        if arg.startswith("--fixtures="):
+            fixtures_path = os.path.abspath(arg.split('=', 1)[1])
+        elif arg.startswith("--synthetic="):
+            num_synthetic = int(arg.split('=', 1)[1])
+        elif arg.startswith("--only="):
+            selected_checks = arg.split('=', 1)[1].split(',')
+            for name in selected_checks:
+                if name not in CHECKS:
+                    print("Unknown check: '" + name + "'", file=sys.stderr)
+                    exit(1)
+        else:
+            print("Uknown command-line argument: '" + arg + "'", file=sys.stderr)
+            exit(1)
+    main()
@@ -0,0 +1,168 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# HTML fixtures of the benchmarks: a set of Wikipedia articles stored as
+# one raw HTML file per article, exactly like the repository written by
+# the crawler. A fixture set is recorded once with the crawler itself, i.e.
+#     python crawler.py --profile=small --target=500 --repo=benchmarks/fixtures/
+# and then used offline. If no recorded set is available, a synthetic one
+# is generated: deterministic pages with the structure of Wikipedia
+# articles (infobox, sections, references, tables, quotes, math, navboxes,
+# JSON-LD dates) that link to each other.
+
+
+import os
+import json
+import zlib
+import random
+
+
+# Return the names of the HTML files of the fixture set stored in path.
+def list_fixtures(path):
+    if not os.path.isdir(path):
+        return []
+    return sorted(f for f in os.listdir(path) if f.endswith('.html'))
+
+
+# Return the title of the article stored in fixture filename.
+def fixture_title(filename):
+    title = filename[:-len('.html')]
+    if title.startswith('__dot__'):
+        title = '.' + title[len('__dot__'):]
+    return title
+
+
+WORDS = ['the', 'of', 'and', 'in', 'was', 'is', 'for', 'as', 'with', 'by',
+        'system', 'language', 'network', 'university', 'history', 'century',
+        'government', 'theory', 'population', 'computer', 'river', 'album',
+        'species', 'research', 'development', 'European', 'national', 'early',
+        'published', 'known', 'between', 'during', 'including', 'several']
+
+
+def sentence(rng, titles, num_words):
+    words = []
+    for i in range(num_words):
+        if rng.random() < 0.08:
+            target = rng.choice(titles)
+            words.append('<a href="/wiki/%s" title="%s">%s</a>' %
+                    (target, target.replace('_', ' '), target.replace('_', ' ')))
+        elif rng.random() < 0.03:
+            words.append('(%s %s)' % (rng.choice(WORDS), rng.choice(WORDS)))
+        else:
+            words.append(rng.choice(WORDS))
+    ref = rng.randrange(1, 40)
+    return ' '.join(words).capitalize() + ('.<sup id="cite_ref-%d" '
+            'class="reference"><a href="#cite_note-%d">[%d]</a></sup>' %
+            (ref, ref, ref))
+
+
+def paragraph(rng, titles):
+    return '<p>%s</p>\n' % (' '.join(sentence(rng, titles, rng.randrange(8, 30))
+            for i in range(rng.randrange(2, 8))))
+
+
+# Return the HTML text of the synthetic article title, linking to titles.
+def generate_article(title, titles, seed=0):
+    rng = random.Random(zlib.crc32(title.encode('utf-8')) ^ seed)
+    name = title.replace('_', ' ')
+    body = []
+    body.append('<table class="infobox vcard"><tbody>'
+            '<tr><th colspan="2" class="infobox-above">%s</th></tr>' % (name))
+    for i in range(rng.randrange(3, 12)):
+        body.append('<tr><th scope="row">%s</th><td>%s<br/>%s</td></tr>' %
+                (rng.choice(WORDS).capitalize(), rng.choice(WORDS),
+                    rng.randrange(1000, 2020)))
+    body.append('</tbody></table>\n')
+    body.append('<div role="note" class="hatnote">Not to be confused with '
+            '<a href="/wiki/%s">%s</a>.</div>\n' % (rng.choice(titles), name))
+    for i in range(rng.randrange(1, 4)):
+        body.append(paragraph(rng, titles))
+    body.append('<div id="toc" class="toc"><ul><li>Contents</li></ul></div>\n')
+    for s in range(rng.randrange(3, 12)):
+        heading = '%s %s' % (rng.choice(WORDS).capitalize(), rng.choice(WORDS))
+        body.append('<h2><span class="mw-headline" id="S%d">%s</span>'
+                '<span class="mw-editsection">[<a href="/w/index.php?'
+                'title=%s&amp;action=edit&amp;section=%d">edit</a>]</span></h2>\n' %
+                (s, heading, title, s + 1))
+        for i in range(rng.randrange(1, 6)):
+            kind = rng.random()
+            if kind < 0.1:
+                body.append('<h3><span class="mw-headline">%s</span></h3>\n' %
+                        (rng.choice(WORDS).capitalize()))
+            elif kind < 0.15:
+                body.append('<blockquote><p>%s</p></blockquote>\n' %
+                        (sentence(rng, titles, 20)))
+            elif kind < 0.2:
+                body.append('<div class="thumb tright"><div class="thumbinner">'
+                        '<div class="thumbcaption">%s</div></div></div>\n' %
+                        (sentence(rng, titles, 10)))
+            elif kind < 0.25:
+                rows = ''.join('<tr><td>%s</td><td>%d</td></tr>' %
+                        (rng.choice(WORDS), rng.randrange(100))
+                        for r in range(rng.randrange(2, 20)))
+                body.append('<table class="wikitable"><tbody>%s</tbody></table>\n' %
+                        (rows))
+            elif kind < 0.28:
+                body.append('<p>The value is <span class="mwe-math-element">'
+                        '<img class="mwe-math-fallback-image-inline" '
+                        'alt="{\\displaystyle x^{%d}}"/></span>.</p>\n' %
+                        (rng.randrange(2, 9)))
+            else:
+                body.append(paragraph(rng, titles))
+    body.append('<h2><span class="mw-headline" id="References">References'
+            '</span></h2>\n<div class="reflist"><ol class="references">')
+    for ref in range(1, 40):
+        body.append('<li id="cite_note-%d"><span class="mw-cite-backlink">'
+                '<a href="#cite_ref-%d">^</a></span> <cite>%s</cite></li>' %
+                (ref, ref, sentence(rng, titles, 8)))
+    body.append('</ol></div>\n<div role="navigation" class="navbox">%s</div>\n' %
+            (' '.join('<a href="/wiki/%s">%s</a>' % (t, t)
+                for t in rng.sample(titles, min(20, len(titles))))))
+    dates = json.dumps({'datePublished': '20%02d-%02d-%02dT10:00:00Z' %
+            (rng.randrange(1, 20), rng.randrange(1, 13), rng.randrange(1, 29)),
+            'dateModified': '2020-%02d-%02dT12:00:00Z' % (rng.randrange(1, 13),
+                rng.randrange(1, 29))})
+    return ('<!DOCTYPE html>\n<html class="client-nojs" lang="en" dir="ltr">'
+            '<head><meta charset="UTF-8"/><title>%s - Wikipedia</title>'
+            '<script>RLCONF={"wgRevisionId":%d};</script>'
+            '<link rel="canonical" href="https://en.wikipedia.org/wiki/%s"/>'
+            '</head><body>\n<div id="content" class="mw-body" role="main">'
+            '<h1 id="firstHeading" class="firstHeading" lang="en">%s</h1>\n'
+            '<div id="bodyContent" class="mw-body-content">'
+            '<div id="mw-content-text" lang="en" dir="ltr" '
+            'class="mw-content-ltr"><div class="mw-parser-output">\n%s</div>'
+            '</div><div class="printfooter">Retrieved from "<a dir="ltr" '
+            'href="https://en.wikipedia.org/wiki/%s">here</a>"</div></div></div>'
+            '<script type="application/ld+json">%s</script>'
+            '<script>(RLQ=window.RLQ||[]).push(function(){});</script>'
+            '</body></html>' %
+            (name, rng.randrange(10**9), title, name, ''.join(body), title, dates))
+
+
+# Write a synthetic fixture set of count articles to path.
+# Return the names of the HTML files written.
+def generate_fixtures(path, count, seed=0):
+    os.makedirs(path, exist_ok=True)
+    titles = ['Article_%d' % (n) for n in range(count)]
+    for title in titles:
+        with open(os.path.join(path, title + '.html'), mode='w',
+                encoding='utf-8') as outfile:
+            outfile.write(generate_article(title, titles, seed))
+    return list_fixtures(path)
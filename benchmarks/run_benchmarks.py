@@ -0,0 +1,422 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Offline benchmark suite of the crawler and the preprocessor, run over a
+# fixture set of Wikipedia articles (see fixtures.py). The benchmarks are:
+#  - crawl: the crawler (small profile) crawls the fixture set, served by
+#    throttle_server.py without any throttling or latency; reports the
+#    frontier-build rate and the download throughput,
+#  - parse_html5lib, parse_lxml: parse_article() of every fixture,
+#  - cleanup_section, get_summary: the text normalizers, over the sections
+#    extracted from the fixtures.
+# Every benchmark runs in a process of its own, so that its peak RSS is
+# reported too. Timed loops are run --rounds times and the best round is
+# kept. Results are written as JSON (by default to
+# benchmarks/results/<commit>.json) and may be compared to the results of
+# an earlier run, i.e. of another commit, using --compare.
+#
+# Usage (from the top-level directory):
+#     python benchmarks/run_benchmarks.py [--fixtures=DIR] [--synthetic=N]
+#             [--rounds=N] [--only=NAME,...] [--output=FILE]
+#             [--compare=FILE] [--threshold=PERCENT]
+
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import platform
+import resource
+import tempfile
+import datetime
+import subprocess
+import contextlib
+import urllib.request
+
+benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarks_path, '..'))
+import fixtures
+
+
+# Return the minimum time (seconds) of rounds calls of function().
+def time_function(function):
+    best = None
+    for i in range(rounds):
+        t0 = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - t0
+        if best == None or elapsed < best:
+            best = elapsed
+    return best
+
+
+# Return the peak RSS of the current process in MB.
+def peak_rss_mb():
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':   # Bytes instead of kilobytes
+        return maxrss / 2**20
+    return maxrss / 2**10
+
+
+# Return {filename: HTML text} of the fixture set.
+def load_fixtures():
+    articles = {}
+    for hf in fixtures.list_fixtures(fixtures_path):
+        with open(os.path.join(fixtures_path, hf), mode='r',
+                encoding='utf-8') as infile:
+            articles[hf] = infile.read()
+    return articles
+
+
+# Return the raw sections (before cleanup) of all fixtures.
+def load_sections():
+    import preprocess
+    sections = []
+    for hf, html_text in load_fixtures().items():
+        plain_text = preprocess.parse_article(hf, 'lxml', html_text)[0]
+        sections += plain_text.values()
+    return sections
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# Start throttle_server.py serving the fixture set and wait until it
+# accepts requests. Return the server process and its URL.
+def start_server():
+    port = free_port()
+    # stderr is silenced, i.e. connections closed by the frontier builder
+    server = subprocess.Popen([sys.executable,
+            os.path.join(benchmarks_path, 'throttle_server.py'),
+            '--port=%d' % (port), '--latency=0',
+            '--fixtures=' + fixtures_path], stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL)
+    url_prefix = 'http://127.0.0.1:%d' % (port)
+    for i in range(100):
+        try:
+            urllib.request.urlopen(url_prefix + '/stats').read()
+            return server, url_prefix
+        except OSError:
+            if server.poll() != None:
+                break
+            time.sleep(0.1)
+    server.kill()
+    print('Cannot start the fixture server', file=sys.stderr)
+    exit(1)
+
+
+# Crawl the fixture set once. Return the CrawlStats of the crawl.
+def crawl_once(url_prefix, seeds):
+    import crawler
+    work_path = tempfile.mkdtemp(prefix='bench-crawl-')
+    try:
+        config = crawler.CrawlConfig('small')
+        config.url_prefix = url_prefix
+        config.repo_path = os.path.join(work_path, 'repository', '')
+        config.seeds_filename = os.path.join(work_path, 'seeds.txt')
+        config.article_target = crawl_target
+        config.redundancy = 1.0
+        with open(config.seeds_filename, mode='w', encoding='utf-8') as outfile:
+            outfile.write(''.join('/wiki/%s\n' % (s) for s in seeds))
+        crawl = crawler.Crawler(config)
+        with open(os.devnull, mode='w') as devnull:
+            with contextlib.redirect_stdout(devnull):
+                crawl.run()
+        return crawl.stats
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+
+def bench_crawl():
+    global crawl_target
+    titles = [fixtures.fixture_title(hf) for hf in
+            fixtures.list_fixtures(fixtures_path)]
+    if crawl_target == None:
+        crawl_target = len(titles)
+    server, url_prefix = start_server()
+    frontier_rate = download_rate = download_mbps = None
+    try:
+        for i in range(rounds):
+            stats = crawl_once(url_prefix, titles[:num_seeds])
+            rate = crawl_target / max(stats.frontier_build_time, 1e-9)
+            if frontier_rate == None or rate > frontier_rate:
+                frontier_rate = rate
+                pages_rate = stats.webpages_parsed / max(stats.frontier_build_time, 1e-9)
+            rate = stats.total_downloads / max(stats.download_time, 1e-9)
+            if download_rate == None or rate > download_rate:
+                download_rate = rate
+                download_mbps = stats.downloaded_bytes / 2**20 / max(
+                        stats.download_time, 1e-9)
+                failures = len(stats.download_failures)
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        'articles': crawl_target,
+        'frontier_hrefs_per_sec': frontier_rate,
+        'frontier_pages_per_sec': pages_rate,
+        'download_docs_per_sec': download_rate,
+        'download_mb_per_sec': download_mbps,
+        'download_failures': failures
+    }
+
+
+def bench_parse(parser):
+    import preprocess
+    preprocess.repo_path = os.path.join(fixtures_path, '')
+    articles = load_fixtures()
+    size = sum(len(html_text.encode('utf-8')) for html_text in articles.values())
+    def parse_all():
+        for hf, html_text in articles.items():
+            preprocess.parse_article(hf, parser, html_text)
+    best = time_function(parse_all)
+    return {
+        'docs': len(articles),
+        'docs_per_sec': len(articles) / best,
+        'mb_per_sec': size / 2**20 / best,
+        'parse_failures': len(set(preprocess.parse_failures))
+    }
+
+
+def bench_cleanup_section():
+    import preprocess
+    sections = load_sections()
+    size = sum(len(s) for s in sections)
+    def cleanup_all():
+        for s in sections:
+            preprocess.cleanup_section(s)
+    best = time_function(cleanup_all)
+    return {
+        'calls': len(sections),
+        'calls_per_sec': len(sections) / best,
+        'mb_per_sec': size / 2**20 / best
+    }
+
+
+def bench_get_summary():
+    import preprocess
+    sections = [preprocess.cleanup_section(s) for s in load_sections()]
+    sections = [s for s in sections if len(s) > 0]
+    def summarize_all():
+        for s in sections:
+            preprocess.get_summary(s)
+    best = time_function(summarize_all)
+    return {
+        'calls': len(sections),
+        'calls_per_sec': len(sections) / best
+    }
+
+
+# Run benchmark name in the current process and write its results to
+# result_filename.
+def run_child(name, result_filename):
+    t0 = time.perf_counter()
+    results = BENCHMARKS[name]()
+    results['wall_time'] = time.perf_counter() - t0
+    results['peak_rss_mb'] = peak_rss_mb()
+    with open(result_filename, mode='w', encoding='utf-8') as outfile:
+        json.dump(results, outfile)
+
+
+# Run benchmark name in a new process. Return its results or None.
+def run_benchmark(name):
+    fd, result_filename = tempfile.mkstemp(prefix='bench-', suffix='.json')
+    os.close(fd)
+    try:
+        args = [sys.executable, os.path.abspath(__file__), '--child=' + name,
+                '--result-file=' + result_filename,
+                '--fixtures=' + fixtures_path, '--rounds=%d' % (rounds)]
+        if crawl_target != None:
+            args.append('--crawl-target=%d' % (crawl_target))
+        if subprocess.run(args).returncode != 0:
+            return None
+        with open(result_filename, mode='r', encoding='utf-8') as infile:
+            return json.load(infile)
+    finally:
+        os.remove(result_filename)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=benchmarks_path, capture_output=True, text=True,
+                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Return +1 if higher values of metric are better, -1 if lower values are
+# better and 0 if metric is informational (i.e. wall_time, which includes
+# loading the fixtures).
+def metric_direction(metric):
+    if metric.endswith('_per_sec'):
+        return 1
+    if metric == 'peak_rss_mb':
+        return -1
+    return 0
+
+
+# Print the change of every metric since the results of old_filename.
+# Return the number of metrics that regressed by more than threshold
+# percent.
+def compare_results(results, old_filename):
+    with open(old_filename, mode='r', encoding='utf-8') as infile:
+        old_results = json.load(infile)
+    regressions = 0
+    print('\n########################## COMPARISON ##########################')
+    print('%s (%s) -> %s (%s)' % (old_results.get('commit'),
+            old_results.get('date'), results.get('commit'), results.get('date')))
+    for name, metrics in results['benchmarks'].items():
+        old_metrics = old_results['benchmarks'].get(name)
+        if old_metrics == None:
+            continue
+        for metric, value in metrics.items():
+            direction = metric_direction(metric)
+            old_value = old_metrics.get(metric)
+            if direction == 0 or old_value == None or old_value == 0:
+                continue
+            change = (value - old_value) / old_value * 100
+            flag = ''
+            if change * direction < -threshold:
+                flag = '  <-- REGRESSION'
+                regressions += 1
+            print('%-16s %-24s %12.2f -> %12.2f  %+7.1f%%%s' % (name, metric,
+                    old_value, value, change, flag))
+    print('################################################################\n')
+    return regressions
+
+
+def main():
+    global fixtures_path
+    synthetic_path = None
+    if len(fixtures.list_fixtures(fixtures_path)) == 0:
+        # No recorded fixture set; benchmark a synthetic one
+        synthetic_path = tempfile.mkdtemp(prefix='bench-fixtures-')
+        fixtures_path = synthetic_path
+        fixtures.generate_fixtures(fixtures_path, num_synthetic)
+    try:
+        html_files = fixtures.list_fixtures(fixtures_path)
+        results = {
+            'commit': git_commit(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'rounds': rounds,
+            'fixtures': {
+                'path': None if synthetic_path != None else fixtures_path,
+                'synthetic': synthetic_path != None,
+                'docs': len(html_files),
+                'size_mb': sum(os.path.getsize(os.path.join(fixtures_path, hf))
+                        for hf in html_files) / 2**20
+            },
+            'benchmarks': {}
+        }
+        for name in selected_benchmarks:
+            print('Running %s...' % (name))
+            metrics = run_benchmark(name)
+            if metrics == None:
+                print('Benchmark %s failed' % (name), file=sys.stderr)
+                continue
+            results['benchmarks'][name] = metrics
+            print('    ' + ', '.join('%s: %.2f' % (metric, value)
+                    for metric, value in metrics.items()))
+    finally:
+        if synthetic_path != None:
+            shutil.rmtree(synthetic_path, ignore_errors=True)
+    filename = output_filename
+    if filename == None:
+        filename = os.path.join(benchmarks_path, 'results',
+                '%s.json' % (results['commit'] or 'results'))
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    with open(filename, mode='w', encoding='utf-8') as outfile:
+        json.dump(results, outfile, indent=2)
+        outfile.write('\n')
+    print('Results written to \'%s\'' % (filename))
+    if compare_filename != None:
+        regressions = compare_results(results, compare_filename)
+        if regressions > 0:
+            print('%d metrics regressed by more than %.1f%%' %
+                    (regressions, threshold))
+            exit(1)
+
+
+###############
+# Global data #
+###############
+BENCHMARKS = {
+    'crawl': bench_crawl,
+    'parse_html5lib': lambda: bench_parse('html5lib'),
+    'parse_lxml': lambda: bench_parse('lxml'),
+    'cleanup_section': bench_cleanup_section,
+    'get_summary': bench_get_summary
+}
+fixtures_path = os.path.join(benchmarks_path, 'fixtures')  # Recorded fixture set
+num_synthetic = 200  # Number of articles generated if there is no recorded fixture set
+rounds = 3  # Every timed loop runs rounds times; the best round is kept
+crawl_target = None  # Articles downloaded by the crawl benchmark (None: all fixtures)
+num_seeds = 3  # Number of fixtures used as seeds by the crawl benchmark
+selected_benchmarks = list(BENCHMARKS)
+output_filename = None  # Where results are written (None: results/<commit>.json)
+compare_filename = None  # Results of an earlier run to compare with
+threshold = 10.0  # Changes for the worse above threshold percent are regressions
+child_benchmark = None
+result_filename = None
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    for arg in args:
+        if arg.startswith("--fixtures="):
+            fixtures_path = os.path.abspath(arg.split('=', 1)[1])
+        elif arg.startswith("--synthetic="):
+            num_synthetic = int(arg.split('=', 1)[1])
+        elif arg.startswith("--rounds="):
+            rounds = int(arg.split('=', 1)[1])
+        elif arg.startswith("--crawl-target="):
+            crawl_target = int(arg.split('=', 1)[1])
+        elif arg.startswith("--only="):
+            selected_benchmarks = arg.split('=', 1)[1].split(',')
+            for name in selected_benchmarks:
+                if name not in BENCHMARKS:
+                    print("Unknown benchmark: '" + name + "'", file=sys.stderr)
+                    exit(1)
+        elif arg.startswith("--output="):
+            output_filename = arg.split('=', 1)[1]
+        elif arg.startswith("--compare="):
+            compare_filename = arg.split('=', 1)[1]
+        elif arg.startswith("--threshold="):
+            threshold = float(arg.split('=', 1)[1])
+        elif arg.startswith("--child="):
+            child_benchmark = arg.split('=', 1)[1]
+        elif arg.startswith("--result-file="):
+            result_filename = arg.split('=', 1)[1]
+        else:
+            print("Uknown command-line argument: '" + arg + "'", file=sys.stderr)
+            exit(1)
+    if child_benchmark != None:
+        run_child(child_benchmark, result_filename)
+    else:
+        main()
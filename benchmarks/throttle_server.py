@@ -0,0 +1,314 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Local mock of Wikipedia that throttles its clients, to exercise the rate
+# limiter and the adaptive concurrency of the crawler. Every /wiki/<title>
+# page is generated from its title (so it is always the same) and links to
+# other generated pages. The server:
+#  - replies with 429 (Too Many Requests) and a Retry-After header to
+#    requests above --rate requests/sec,
+#  - replies with 503 (Service Unavailable) to requests above --capacity
+#    concurrent requests, while the latency of the accepted ones grows with
+#    the number of requests being served,
+#  - fails --error-rate of the requests at random with 503,
+#  - with --validators, sends the HTTP validators (ETag, Last-Modified) of
+#    every page and replies with 304 (Not Modified) to conditional requests
+#    (If-None-Match, If-Modified-Since) that match them. The validators are
+#    derived from the revision of the page and --generation, so changing
+#    the generation changes every validator but no page, i.e. like a
+#    server whose caches were rebuilt,
+#  - with --invalid-utf8, sends pages whose first paragraph contains bytes
+#    that are not valid UTF-8, and with --charset, sends another charset
+#    (i.e. an unknown one) than UTF-8 in the Content-Type of every page.
+# The number of responses per status code is served as JSON at /stats and
+# printed on exit. With --fixtures=DIR, the HTML files of a recorded
+# fixture set (see fixtures.py) are served instead of generated pages; a
+# title that is not part of the set gets one of its pages, picked by title.
+#
+# Usage (from the top-level directory):
+#     python benchmarks/throttle_server.py [--port=N] [--rate=R] [--burst=N]
+#             [--capacity=N] [--latency=S] [--error-rate=P] [--links=N]
+#             [--size=N] [--size-spread=F] [--seed=N] [--fixtures=DIR]
+#             [--validators] [--generation=N] [--invalid-utf8]
+#             [--charset=NAME]
+# and then, for example:
+#     python crawl-wikipedia-large.py --url-prefix=http://127.0.0.1:8765
+
+
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import threading
+from math import ceil
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fixtures
+
+
+# Return the HTML text of the generated page title.
+def generate_page(title):
+    rng = random.Random(zlib.crc32(title.encode('utf-8')) ^ seed)
+    links = ''.join('<li><a href="/wiki/Article_%d">Article %d</a></li>' %
+            (n, n) for n in [rng.randrange(num_pages) for i in range(num_links)])
+    words = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur',
+            'adipiscing', 'elit', 'sed', 'do', 'eiusmod', 'tempor']
+    size = page_size
+    if size_spread > 1:   # Log-uniform in [size / spread, size * spread]
+        size *= size_spread ** rng.uniform(-1, 1)
+    paragraphs = []
+    length = 0
+    while length < size:
+        paragraph = ' '.join(rng.choice(words) for i in range(80))
+        paragraphs.append('<p>%s.</p>' % (paragraph))
+        length += len(paragraph)
+    return ('<!DOCTYPE html><html><head><title>%s</title>'
+            '<script>RLCONF={"wgRevisionId":%d};</script></head><body>'
+            '<h1 id="firstHeading" class="firstHeading">%s</h1>'
+            '<div id="mw-content-text"><div class="mw-parser-output">%s'
+            '<h2><span class="mw-headline" id="See_also">See also</span></h2>'
+            '<ul>%s</ul></div></div></body></html>' % (title,
+                rng.randrange(10**8), title.replace('_', ' '),
+                ''.join(paragraphs), links))
+
+
+# Return the HTML text of the page title out of the fixture set.
+def fixture_page(title):
+    filename = title if not title.startswith('.') else '__dot__' + title[1:]
+    if filename not in fixture_pages:
+        filename = filename[:64]   # As truncated by the 'large' profile
+        if filename not in fixture_pages:
+            names = sorted(fixture_pages)
+            filename = names[zlib.crc32(title.encode('utf-8')) % len(names)]
+    return fixture_pages[filename]
+
+
+# Load the HTML files of the fixture set stored in path in memory.
+def load_fixtures(path):
+    pages = {}
+    for hf in fixtures.list_fixtures(path):
+        with open(os.path.join(path, hf), mode='rb') as infile:
+            pages[hf[:-len('.html')]] = infile.read()
+    if len(pages) == 0:
+        print('No HTML files found in \'%s\'' % (path), file=sys.stderr)
+        exit(1)
+    return pages
+
+
+# Server-side token bucket. Return the number of seconds until a token is
+# available, or 0 if a token was taken.
+def take_token():
+    global tokens, last_refill
+    now = time.monotonic()
+    slock.acquire()
+    tokens = min(burst, tokens + (now - last_refill) * request_rate)
+    last_refill = now
+    if tokens >= 1:
+        tokens -= 1
+        wait = 0
+    else:
+        wait = (1 - tokens) / request_rate
+    slock.release()
+    return wait
+
+
+# Return the HTTP validators (ETag, Last-Modified) of the page body.
+def page_validators(body):
+    match = revision_id_regex.search(body)
+    revision = int(match.group(1)) if match != None else zlib.crc32(body)
+    etag = '"%d-%d"' % (revision, generation)
+    # One day later for every generation
+    last_modified = formatdate(1577836800 + generation * 86400, usegmt=True)
+    return etag, last_modified
+
+
+# Return True if the conditional request headers match the validators of
+# the page, so that it need not be sent again. If-None-Match takes
+# precedence over If-Modified-Since.
+def not_modified(headers, etag, last_modified):
+    if headers.get('If-None-Match') != None:
+        return etag in [t.strip() for t in headers['If-None-Match'].split(',')]
+    if headers.get('If-Modified-Since') != None:
+        try:
+            return parsedate_to_datetime(headers['If-Modified-Since']) >= \
+                    parsedate_to_datetime(last_modified)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def count_response(status):
+    slock.acquire()
+    responses[status] = responses.get(status, 0) + 1
+    slock.release()
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=b'', headers={}):
+        count_response(status)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        global active_requests
+        if self.path == '/stats':
+            body = json.dumps({str(status): count
+                    for status, count in sorted(responses.items())})
+            self.reply(200, body.encode('utf-8'),
+                    {'Content-Type': 'application/json'})
+            return
+        if not self.path.startswith('/wiki/'):
+            self.reply(404)
+            return
+        if request_rate != None:
+            wait = take_token()
+            if wait > 0:
+                self.reply(429, headers={'Retry-After': str(ceil(wait))})
+                return
+        if error_rate > 0 and random.random() < error_rate:
+            self.reply(503)
+            return
+        slock.acquire()
+        active_requests += 1
+        active = active_requests
+        slock.release()
+        try:
+            if capacity != None and active > capacity:
+                self.reply(503)
+                return
+            # Requests are served in parallel up to capacity; latency grows
+            # as the server gets busier.
+            load = active / capacity if capacity != None else 0
+            time.sleep(latency * (1 + load))
+            title = self.path[len('/wiki/'):]
+            if fixture_pages != None:
+                body = fixture_page(title)
+            else:
+                body = generate_page(title).encode('utf-8')
+            if invalid_utf8:
+                body = body.replace(b'</p>', INVALID_UTF8 + b'</p>', 1)
+            headers = {'Content-Type': 'text/html; charset=' + charset}
+            if send_validators:
+                etag, last_modified = page_validators(body)
+                headers = {'ETag': etag, 'Last-Modified': last_modified}
+                if not_modified(self.headers, etag, last_modified):
+                    self.reply(304, headers=headers)
+                    return
+                headers['Content-Type'] = 'text/html; charset=' + charset
+            self.reply(200, body, headers)
+        finally:
+            slock.acquire()
+            active_requests -= 1
+            slock.release()
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', port), ThrottlingHandler)
+    server.daemon_threads = True
+    print('Serving on http://127.0.0.1:%d' % (port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    total = sum(responses.values())
+    print('\n%d requests served' % (total))
+    for status, count in sorted(responses.items()):
+        print('%d: %d (%.2f%%)' % (status, count, count / total * 100))
+
+
+###############
+# Global data #
+###############
+port = 8765
+request_rate = None   # Max requests/sec before replying with 429 (None: no limit)
+burst = 10   # Max requests at once before replying with 429
+capacity = None   # Max concurrent requests before replying with 503 (None: no limit)
+latency = 0.05   # Response time (seconds) of an idle server
+error_rate = 0.0   # Fraction of requests failed at random with 503
+num_pages = 100000   # Number of distinct pages that are linked
+num_links = 40   # Number of links per page
+page_size = 20000   # Approximate size of the text of every page (chars)
+size_spread = 1.0   # Sizes of generated pages vary up to size_spread times page_size
+seed = 0
+fixture_pages = None   # {filename: HTML bytes} of the served fixture set
+send_validators = False   # Send validators and reply to conditional requests
+generation = 0   # Generation of the validators
+revision_id_regex = re.compile(rb'"wgRevisionId":\s*(\d+)')
+invalid_utf8 = False   # Send pages that are not valid UTF-8
+INVALID_UTF8 = b'\x80 \xc3('   # A stray continuation byte and a truncated sequence
+charset = 'UTF-8'   # Charset of the pages sent in their Content-Type
+tokens = burst
+last_refill = time.monotonic()
+active_requests = 0
+responses = {}   # Number of responses per status code
+slock = threading.Lock()   # Protects the token bucket and the counters
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    for arg in args:
+        if arg.startswith("--port="):
+            port = int(arg.split('=', 1)[1])
+        elif arg.startswith("--rate="):
+            request_rate = float(arg.split('=', 1)[1])
+        elif arg.startswith("--burst="):
+            burst = tokens = int(arg.split('=', 1)[1])
+        elif arg.startswith("--capacity="):
+            capacity = int(arg.split('=', 1)[1])
+        elif arg.startswith("--latency="):
+            latency = float(arg.split('=', 1)[1])
+        elif arg.startswith("--error-rate="):
+            error_rate = float(arg.split('=', 1)[1])
+        elif arg.startswith("--links="):
+            num_links = int(arg.split('=', 1)[1])
+        elif arg.startswith("--size="):
+            page_size = int(arg.split('=', 1)[1])
+        elif arg.startswith("--size-spread="):
+            size_spread = float(arg.split('=', 1)[1])
+        elif arg.startswith("--seed="):
+            seed = int(arg.split('=', 1)[1])
+        elif arg.startswith("--fixtures="):
+            fixture_pages = load_fixtures(arg.split('=', 1)[1])
+        elif arg == "--validators":
+            send_validators = True
+        elif arg.startswith("--generation="):
+            generation = int(arg.split('=', 1)[1])
+        elif arg == "--invalid-utf8":
+            invalid_utf8 = True
+        elif arg.startswith("--charset="):
+            charset = arg.split('=', 1)[1]
+        else:
+            print("Uknown command-line argument: '" + arg + "'", file=sys.stderr)
+            exit(1)
+    main()
@@ -0,0 +1,1244 @@
+#!/usr/bin/env python3
+
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Wikipedia crawler. A crawl is described by a CrawlConfig, which starts
+# from one of the PROFILES (the 6k-article 'small' corpus or the 100k-article
+# 'large' one) and is then adjusted from the command line. A Crawler runs
+# the crawl through four stages, each of which may be replaced by another
+# object with the same methods:
+#  - Fetcher: sends requests (rate limiting, adaptive concurrency, retries),
+#  - FrontierBuilder: builds the crawl frontier out of the seeds,
+#  - FileStorage/SegmentStorage: stores the raw HTML of the articles,
+#  - CrawlStats: keeps the counters of the crawl and reports them.
+# Redirects (aliases) of articles and near-duplicate articles are dropped
+# as early as possible (see dedup.py): aliases found while building the
+# frontier are never downloaded, the download of an alias stops as soon as
+# its <head> is received and near-duplicates are neither stored nor
+# preprocessed.
+# crawl-wikipedia.py and crawl-wikipedia-large.py run the two profiles.
+#
+# Usage:
+#     python crawler.py [--profile=small|large] [options]
+
+
+import os
+import re
+import sys
+import time
+import requests
+from requests.exceptions import RequestException
+import threading
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from frontier import CrawlFrontier
+from scheduler import fill_work_queue, consume_work_queue, print_utilization
+from crawlstate import CrawlState, PENDING, DONE, FAILED, DUPLICATE, REMOVED
+from segments import SegmentWriter, stale_fraction, compact
+from linkextract import LinkExtractor, canonical_link
+from dedup import DuplicateDetector, canonical_href, content_text, simhash
+from metrics import Metrics, SamplingProfiler, profile_prefix, LATENCY_BUCKETS, \
+        SIZE_BUCKETS
+from ratelimit import RateLimiter, AIMDController, is_congested, retry_after, \
+        retry_delay
+from math import ceil
+
+
+########################
+# Function definitions #
+########################
+
+
+# Print message to STDERR.
+def perror(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+    sys.stderr.flush()
+
+
+# Article titles starting with a '.' will be stored as hidden files.
+# i.e. '.NET_Framework'. This function replaces leading '.' with '__dot__'.
+# Filenames are truncated to max_size characters first, unless it is None.
+def canonicalize(filename, max_size=None):
+    if max_size != None:
+        filename = filename[:max_size]
+    if filename.startswith('.'):
+        filename = '__dot__' + filename[1:]
+    return filename
+
+
+# Read one href per line from a text file (i.e. seeds or urls.txt).
+def read_hrefs(filename):
+    hrefs = []
+    try:
+        f = open(filename, mode='r', encoding='utf-8')
+        for line in f.readlines():
+            hrefs.append(line.strip())
+        f.close()
+        return hrefs
+    except OSError as ose:
+        perror(filename + ': ' + ose.strerror)
+        exit(ose.errno)
+
+
+# Write URLs to urls.txt
+def write_urls_tofile(article_hrefs, repo_path):
+    try:
+        outfile = open(repo_path + 'urls.txt', mode='w', encoding='utf-8')
+        for href in article_hrefs:
+            outfile.write(href + '\n')
+        outfile.close()
+    except OSError as ose:
+        perror('Cannot write \'' + repo_path + 'urls.txt\': ' + ose.strerror)
+        exit(ose.errno)
+
+
+# Return the text of the raw HTML data of a (streamed) response. Unlike
+# req.text, the encoding is not guessed if the server sent none.
+def decode_body(req, data):
+    try:
+        return str(data, req.encoding or 'utf-8', errors='replace')
+    except LookupError:   # Unknown encoding
+        return str(data, 'utf-8', errors='replace')
+
+
+# Return the revision id of a Wikipedia article or None if it is not found.
+def revision_id(html_text):
+    match = revision_id_regex.search(html_text)
+    if match == None:
+        return None
+    return int(match.group(1))
+
+
+# Settings of a crawl. Every setting has the default value below, which may
+# be overridden by a profile (see PROFILES) and then by the command line.
+class CrawlConfig:
+
+    def __init__(self, profile='large'):
+        self.profile = profile
+        self.repo_path = './repository/'   # Where downloaded HTML files will be stored
+        self.corpus_path = './corpus/'   # Where preprocessed articles are stored (pipelined mode)
+        self.url_prefix = 'https://en.wikipedia.org'
+        self.seeds_filename = 'crawler-seeds-extended.txt'   # Crawler seeds
+        self.article_target = 100000   # Number of articles to download
+        # The crawl frontier holds redundancy times more hyperlinks than
+        # article_target, i.e. to make up for bad hyperlinks.
+        self.redundancy = 1.005
+        self.excluded_href_substrings = ()   # Hyperlinks containing any of them are ignored
+        self.filename_max_size = 64   # Longer filenames are truncated (None: no limit)
+        self.num_threads = 7   # Initial number of requests in flight during downloading
+        self.max_threads = 32   # Max number of threads (requests in flight) during downloading
+        self.frontier_threads = None   # Threads used during frontier building (None: num_threads)
+        self.link_chunk_size = 2**14   # Bytes of an article parsed at once for hyperlinks
+        self.max_downld_retries = 6   # How many times (at most) retry downloading an article
+        self.download_batch_size = 4   # Number of articles a thread pulls from the work queue at once
+        self.adaptive_concurrency = True   # Adapt the number of requests in flight (AIMD)
+        self.request_rate = None   # Max requests/sec per host (None: no limit)
+        self.request_burst = None   # Max requests sent at once when under request_rate
+        self.backoff_base = 1.0   # Backoff before the first retry is up to backoff_base seconds
+        self.max_backoff = 60.0   # Max delay (seconds) before retrying a request
+        self.request_timeout = 60.0   # Seconds before a request times out (threads: without data, asyncio: in total)
+        self.update_corpus = False
+        self.download_missing = False
+        self.resume_crawl = False   # Resume an interrupted crawl using the crawl state
+        self.incremental_update = False   # Update using conditional requests
+        self.storage_backend = 'files'   # 'files' (one file per article) or 'segments'
+        # Segment files are compacted at the end of a crawl once more than
+        # this fraction of their bytes is held by removed or replaced records
+        self.compaction_threshold = 0.5
+        self.download_engine = 'threads'   # 'threads' or 'async' (asyncio engine)
+        self.max_inflight = 64   # Max requests in flight when using the asyncio engine
+        self.max_conns_per_host = 64   # Max keep-alive connections per host (asyncio engine)
+        self.pipeline_mode = False   # Preprocess articles while they are being downloaded
+        self.pipeline_queue_size = 64   # Max articles waiting to be preprocessed (pipelined mode)
+        self.metrics_filename = None   # Where metrics are written (.prom: Prometheus, else JSON)
+        self.profile_every = 0   # Profile every profile_every-th download with cProfile (0: never)
+        self.detect_duplicates = True   # Drop aliases (redirects) and near-duplicate articles
+        # Max number of different bits of the SimHashes of near-duplicates
+        # (None: only aliases are dropped)
+        self.near_duplicate_distance = 3
+        for name, value in PROFILES[profile].items():
+            setattr(self, name, value)
+
+    # Number of hyperlinks to add in the crawl frontier.
+    def article_limit(self):
+        return ceil(self.article_target * self.redundancy)
+
+    def segments_path(self):
+        return self.repo_path + 'segments/'
+
+    def crawl_state_path(self):
+        return self.repo_path + 'crawl-state.db'
+
+
+# Return the controller of the number of requests in flight. With adaptive
+# concurrency the limit starts at num_threads and may grow up to
+# max_threads (or max_inflight when using the asyncio engine). Otherwise it
+# is fixed to num_threads (or max_inflight).
+def concurrency_controller(config):
+    if not config.adaptive_concurrency:
+        if config.download_engine == 'async':
+            fixed = config.max_inflight
+        else:
+            fixed = config.num_threads
+        return AIMDController(fixed, min_limit=fixed, max_limit=fixed)
+    if config.download_engine == 'async':
+        return AIMDController(min(config.num_threads, config.max_inflight),
+                max_limit=config.max_inflight)
+    return AIMDController(config.num_threads,
+            max_limit=max(config.num_threads, config.max_threads))
+
+
+# Fetcher stage: sends the requests of the crawl once the rate limiter of
+# their host allows it and a slot of the concurrency controller is free
+# (see ratelimit.py).
+class Fetcher:
+
+    def __init__(self, config):
+        self.config = config
+        self.rate_limiter = RateLimiter(config.request_rate, config.request_burst)
+        self.concurrency = concurrency_controller(config)
+
+    # Send a GET request for url and receive the body of its (streamed)
+    # response req by calling receive(req). The slot of the request is only
+    # freed once receive() returns, so the controller bounds the bodies
+    # being transferred too, not just the requests waiting for headers.
+    # The outcome of the request is fed back to the controller: a
+    # congestion signal if the request failed, timed out (also while its
+    # body was being received) or was throttled. Throttled requests also
+    # pause the host for the time the server asked for (Retry-After), if
+    # any.
+    # Return: 1) The response
+    #         2) The value returned by receive(req)
+    def send_request(self, url, receive, headers=None):
+        time.sleep(self.rate_limiter.wait_time(url))
+        ticket = self.concurrency.acquire()
+        congested = True
+        try:
+            req = requests.get(url, headers=headers, stream=True,
+                    timeout=self.config.request_timeout)
+            congested = is_congested(req.status_code)
+            if congested:
+                delay = retry_after(req.headers)
+                if delay != None:
+                    self.rate_limiter.pause(url, min(delay, self.config.max_backoff))
+            received = receive(req)
+        except RequestException:
+            congested = True
+            raise
+        finally:
+            self.concurrency.release(ticket, congested)
+        return req, received
+
+    # Wait before retrying after attempt (0-based) failed attempts, for the
+    # time asked by the server in resp_headers or an exponential backoff.
+    def wait_before_retry(self, attempt, resp_headers=None):
+        time.sleep(retry_delay(attempt, resp_headers, self.config.backoff_base,
+                self.config.max_backoff))
+
+
+# Hyperlinks of an article of the frontier, handed by the worker thread
+# that parses it to the coordinator in batches, as soon as they are found.
+# The last item of batches is True if parsing was successful, False
+# otherwise. If the coordinator needs no more hyperlinks, it cancels the
+# stream and the worker stops downloading the article. The canonical URL
+# of the article is set before any batch is handed (it is found in the
+# <head>).
+class LinkStream:
+
+    def __init__(self, href):
+        self.href = href
+        self.batches = queue.Queue()
+        self.cancelled = False
+        self.canonical_url = None
+
+
+# Frontier stage: builds the crawl frontier using the input seeds. Up to
+# frontier_threads articles of the frontier are downloaded and parsed
+# concurrently, while a single coordinator merges the extracted hyperlinks
+# in frontier order. The frontier is therefore the same as the one built by
+# parsing one article at a time. Progress is saved in the crawl state after
+# every merged article, so when resuming, frontier building continues from
+# the first unmerged article.
+class FrontierBuilder:
+
+    def __init__(self, config, fetcher):
+        self.config = config
+        self.fetcher = fetcher
+        self.crawl_frontier = None
+        self.frontier_threads = config.frontier_threads
+        if self.frontier_threads == None:
+            self.frontier_threads = config.num_threads
+
+    # Add the hyperlinks currently not in the crawl frontier, until
+    # article_limit hyperlinks (other than aliases) have been collected.
+    # Return: 1) List of hrefs added to the frontier
+    #         2) True if no more hyperlinks need to be extracted
+    def expand_frontier(self, hrefs):
+        article_limit = self.config.article_limit()
+        added = self.crawl_frontier.extend(hrefs, limit=article_limit)
+        for href in added:
+            print('Adding   \'%s\' to frontier' % (href))
+        return added, self.crawl_frontier.num_articles() == article_limit
+
+    # Extract the hyperlinks to articles contained in the body of the
+    # response req, while it is being received, and hand them over to
+    # link_stream. The body of an unsuccessful response is not received.
+    # Return True if hyperlink extraction was successful.
+    def receive_hrefs(self, req, link_stream):
+        if req.status_code != 200:
+            req.close()
+            return False
+        # If the download is retried, the hyperlinks already found are
+        # found again and ignored by the frontier.
+        extractor = LinkExtractor(self.config.excluded_href_substrings)
+        for chunk in req.iter_content(chunk_size=self.config.link_chunk_size):
+            hrefs = extractor.feed(chunk)
+            link_stream.canonical_url = extractor.canonical_url
+            if len(hrefs) > 0:
+                link_stream.batches.put(hrefs)
+            if extractor.done or link_stream.cancelled:
+                break
+        req.close()
+        return extractor.found_content
+
+    # Download an article and extract the hyperlinks to articles it
+    # contains, while its HTML text is being received.
+    # Return True if hyperlink extraction was successful.
+    def stream_hrefs(self, link_stream):
+        config = self.config
+        download_attempts = 0
+        url = config.url_prefix + link_stream.href
+        while download_attempts <= config.max_downld_retries and \
+                not link_stream.cancelled:
+            try:
+                print('Parsing \'%s\'' % (url))
+                req, found_content = self.fetcher.send_request(url,
+                        lambda req: self.receive_hrefs(req, link_stream))
+                if req.status_code != 200:
+                    raise RequestException('Status code: ' +
+                            str(req.status_code), response=req)
+                if not found_content:
+                    perror('Error parsing article \'%s\' for hyperlinks' % (url))
+                return found_content
+            except RequestException as e:
+                perror('Error extracting hrefs from: \'%s\'' % (url))
+                download_attempts += 1
+                if download_attempts <= config.max_downld_retries:
+                    self.fetcher.wait_before_retry(download_attempts - 1,
+                            e.response.headers if e.response != None else None)
+        return False
+
+    # Executed by the worker threads of build(). The stream is always
+    # terminated, so that the coordinator never waits forever.
+    def extract_hrefs_from_article(self, link_stream):
+        success = False
+        try:
+            success = self.stream_hrefs(link_stream)
+        finally:
+            link_stream.batches.put(success)
+
+    # Merge the hyperlinks of link_stream in the frontier as they arrive,
+    # until the stream ends or article_limit hyperlinks have been collected.
+    # Return: 1) List of hrefs added to the frontier
+    #         2) True if hyperlink extraction was successful
+    #         3) True if no more hyperlinks need to be extracted
+    def merge_link_stream(self, link_stream):
+        added = []
+        while True:
+            batch = link_stream.batches.get()
+            if not isinstance(batch, list):   # End of the stream
+                return added, batch, False
+            added_hrefs, limit_reached = self.expand_frontier(batch)
+            added += added_hrefs
+            if limit_reached == True:
+                link_stream.cancelled = True
+                return added, True, True
+
+    # Resolve the canonical href of the article of link_stream, once it has
+    # been parsed. Return the canonical href if it is another one.
+    def resolve_canonical_href(self, link_stream):
+        if not self.config.detect_duplicates:
+            return None
+        href = canonical_href(link_stream.canonical_url)
+        if href == None or href == link_stream.href:
+            return None
+        if self.crawl_frontier.resolve(link_stream.href, href):
+            print('Dropping \'%s\' from frontier (alias of \'%s\')' %
+                    (link_stream.href, href))
+        return href
+
+    # Return: 1) The hrefs of the crawl frontier, without aliases
+    #         2) Number of articles parsed to build it
+    def build(self, seeds, crawl_state):
+        if self.config.resume_crawl and len(crawl_state.load_frontier()) > 0:
+            self.crawl_frontier = CrawlFrontier(crawl_state.load_frontier())
+            for href, canonical in crawl_state.load_canonical_hrefs():
+                self.crawl_frontier.resolve(href, canonical)
+            parse_cursor = crawl_state.get_progress('parse_cursor')
+            webpages_parsed = crawl_state.get_progress('webpages_parsed')
+            if crawl_state.frontier_complete():
+                print('Crawl frontier has already been built [%d hyperlinks]' %
+                        (self.crawl_frontier.num_articles()))
+                return self.crawl_frontier.articles(), webpages_parsed
+            print('Resuming frontier building at article %d/%d' %
+                    (parse_cursor + 1, len(self.crawl_frontier)))
+        else:
+            crawl_state.clear()
+            self.crawl_frontier = CrawlFrontier(seeds)
+            parse_cursor = webpages_parsed = 0
+            crawl_state.save_frontier_progress(self.crawl_frontier,
+                    parse_cursor, webpages_parsed)
+        crawl_frontier = self.crawl_frontier
+        next_href = parse_cursor   # Index of the next frontier href to be parsed
+        in_flight = deque()   # LinkStreams of the articles being parsed, in order
+
+        executor = ThreadPoolExecutor(max_workers=self.frontier_threads)
+        while True:
+            # Keep the worker pool busy with the next hrefs of the frontier
+            while len(in_flight) < self.frontier_threads and \
+                    next_href < len(crawl_frontier):
+                link_stream = LinkStream(crawl_frontier[next_href])
+                executor.submit(self.extract_hrefs_from_article, link_stream)
+                in_flight.append(link_stream)
+                next_href += 1
+            if len(in_flight) == 0:   # Frontier exhausted
+                break
+            link_stream = in_flight.popleft()
+            added, success, limit_reached = self.merge_link_stream(link_stream)
+            if success == True:
+                webpages_parsed += 1
+            canonical = self.resolve_canonical_href(link_stream)
+            if link_stream.href in crawl_frontier.duplicates:
+                # One more article is needed in place of the alias
+                limit_reached = False
+            parse_cursor += 1
+            crawl_state.save_frontier_progress(added, parse_cursor,
+                    webpages_parsed, link_stream.href, canonical)
+            if limit_reached == True:
+                break
+        # Articles still in flight are not needed anymore
+        for link_stream in in_flight:
+            link_stream.cancelled = True
+        executor.shutdown(wait=True, cancel_futures=True)
+        crawl_state.mark_frontier_complete()
+        if len(crawl_frontier.duplicates) > 0:
+            print('Dropped %d aliases of other articles from the frontier' %
+                    (len(crawl_frontier.duplicates)))
+
+        return crawl_frontier.articles(), webpages_parsed
+
+
+# Storage stage: every article is stored as a separate raw HTML file in the
+# repository.
+class FileStorage:
+
+    def __init__(self, config):
+        self.repo_path = config.repo_path
+
+    # Write the raw HTML text of an article.
+    # Return: 1) Size of the HTML text in bytes
+    #         2) Number of bytes written
+    def write(self, filename, html_text):
+        data = html_text.encode('utf-8')
+        outfile = open(self.repo_path + filename, mode='wb')
+        outfile.write(data)
+        outfile.close()
+        return len(data), len(data)
+
+    # Return True if the raw HTML file of an article is stored.
+    def exists(self, filename):
+        return os.path.exists(self.repo_path + filename)
+
+    # Return the names of the stored HTML files.
+    def names(self):
+        try:
+            return [f for f in os.listdir(self.repo_path) if f.endswith('.html')]
+        except OSError as ose:
+            perror('Cannot list files in directory: %s: %s' %
+                    (self.repo_path, ose.strerror))
+            exit(ose.errno)
+
+    def remove(self, filename):
+        try:
+            os.unlink(self.repo_path + filename)
+        except OSError as ose:
+            perror('Cannot remove file \'%s\': %s' %
+                    (self.repo_path + filename, ose.strerror))
+            exit(ose.errno)
+
+    # Return where filename is stored, for messages.
+    def location(self, filename):
+        return self.repo_path + filename
+
+    def close(self):
+        pass
+
+
+# Storage stage: articles are stored as compressed records appended to the
+# segment files of the repository (see segments.py). Every update of the
+# corpus appends the articles again, so the segment files are compacted
+# when closed if too much of them is stale.
+class SegmentStorage:
+
+    def __init__(self, config):
+        self.segments_path = config.segments_path()
+        self.segment_writer = SegmentWriter(self.segments_path)
+        self.compaction_threshold = config.compaction_threshold
+
+    def write(self, filename, html_text):
+        data = html_text.encode('utf-8')
+        return len(data), self.segment_writer.append(filename, data)
+
+    def exists(self, filename):
+        return filename in self.segment_writer
+
+    def names(self):
+        return self.segment_writer.names()
+
+    def remove(self, filename):
+        self.segment_writer.remove(filename)
+
+    def location(self, filename):
+        return self.segments_path + filename
+
+    def close(self):
+        self.segment_writer.close()
+        stale = stale_fraction(self.segments_path)
+        if stale > self.compaction_threshold:
+            size_before, size_after = compact(self.segments_path)
+            print('Compacted segment files (%.1f%% stale): %.2f MB -> %.2f MB' %
+                    (stale * 100, size_before / 2**20, size_after / 2**20))
+
+
+# Stats stage: counters of the crawl, updated by all download threads, and
+# the reports printed at the end of the crawl.
+class CrawlStats:
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()   # Protects access to all counters
+        self.webpages_parsed = 0   # Articles parsed to build the frontier
+        self.frontier_build_time = 0
+        self.download_time = 0
+        self.total_downloads = 0   # How many articles where downloaded by all threads
+        self.not_modified_count = 0   # How many articles were not modified (incremental update)
+        self.downloaded_bytes = 0   # Size of HTML text downloaded by all threads
+        self.stored_bytes = 0   # Size of HTML text written to the repository by all threads
+        self.num_removals = 0   # Redundant articles removed
+        self.corpus_size = 0   # Articles in the corpus (done), including earlier runs
+        self.not_needed = 0   # Articles not downloaded since article_target was reached
+        self.duplicates = []   # Articles dropped as aliases or near-duplicates
+        self.download_stats = []   # WorkerStats of the download threads
+        self.download_failures = []
+        self.write_failures = []
+        # Time per stage (fetch/decode/write), latency and size of articles
+        self.metrics = Metrics('crawler')
+
+    def article_stored(self, html_size, stored_size):
+        self.lock.acquire()
+        self.downloaded_bytes += html_size
+        self.stored_bytes += stored_size
+        self.corpus_size += 1
+        self.lock.release()
+        self.metrics.observe('document_size_bytes', html_size, SIZE_BUCKETS)
+
+    def article_not_modified(self, html_size):
+        self.lock.acquire()
+        self.not_modified_count += 1
+        self.downloaded_bytes += html_size
+        self.corpus_size += 1
+        self.lock.release()
+
+    # An article that was already stored (download_missing).
+    def article_exists(self):
+        self.lock.acquire()
+        self.corpus_size += 1
+        self.lock.release()
+
+    def article_not_needed(self):
+        self.lock.acquire()
+        self.not_needed += 1
+        self.lock.release()
+
+    def article_duplicate(self, href):
+        self.lock.acquire()
+        self.duplicates.append(href)
+        self.lock.release()
+
+    def download_failed(self, url):
+        self.lock.acquire()
+        self.download_failures.append(url)
+        self.lock.release()
+
+    def write_failed(self, filename):
+        self.lock.acquire()
+        self.write_failures.append(filename)
+        self.lock.release()
+
+    # Account for the articles downloaded by a download thread.
+    def worker_done(self, worker_stats):
+        self.lock.acquire()
+        self.total_downloads += worker_stats.successes
+        self.download_stats.append(worker_stats)
+        self.lock.release()
+
+    def print_startup_info(self):
+        print('############################## INFO ##############################')
+        print('Profile: %s, downloading %d articles' % (self.config.profile,
+                self.config.article_target))
+        print('Raw HTML files will be stored in: \'%s\'' % (self.config.repo_path))
+        print('##################################################################\n')
+
+    def print_failures(self):
+        if len(self.download_failures) > 0:
+            print('\nFailed to download the following webpages:')
+            for i in range(len(self.download_failures)):
+                print('%2d - %s' % (i+1, self.download_failures[i]))
+        if len(self.write_failures) > 0:
+            print('\nFailed to write the following HTML files:')
+            for i in range(len(self.write_failures)):
+                print(' %2d - %s' % (i+1, self.write_failures[i]))
+
+    def print_stats(self, concurrency, crawl_state):
+        config = self.config
+        article_limit = config.article_limit()
+        download_fail_num = len(self.download_failures)
+        write_fail_num = len(self.write_failures)
+        print_utilization(self.download_stats, self.download_time,
+                worker_name='Thread')
+        print('\n################################ STATS ##########################################')
+        if not config.update_corpus:
+            print('Extracted %d hyperlinks from %d articles in %.2f minutes' %
+                    (article_limit, self.webpages_parsed,
+                        self.frontier_build_time/60))
+        if config.download_engine == 'async':
+            print('Downloaded %d/%d articles in %.2f minutes using asyncio [%d in flight]' %
+                    (self.total_downloads, article_limit, self.download_time/60,
+                        config.max_inflight))
+        else:
+            print('Downloaded %d/%d articles in %.2f minutes using %d threads' %
+                    (self.total_downloads, article_limit, self.download_time/60,
+                        concurrency.max_limit))
+        print(concurrency.summary())
+        self.metrics.print_summary({
+                'document_latency_seconds': ('Article latency', 'sec'),
+                'document_size_bytes': ('Article size', 'bytes')})
+        if config.incremental_update:
+            print('%d articles were not modified since the last download' %
+                    (self.not_modified_count))
+        print('Downloaded %.2f MB of HTML' % (self.downloaded_bytes / 2**20))
+        if config.storage_backend == 'segments':
+            print('Stored %.2f MB of compressed HTML in segment files' %
+                    (self.stored_bytes / 2**20))
+        if download_fail_num > 0:
+            print('Failed to download %d webpages [%.4f%%]' %
+                    (download_fail_num, download_fail_num / article_limit * 100))
+        if write_fail_num > 0:
+            print('Failed to write %d HTML documents [%.4f%%]' %
+                    (write_fail_num, write_fail_num / max(self.total_downloads, 1) * 100))
+        if len(self.duplicates) > 0:
+            print('Dropped %d duplicate articles (aliases or near-duplicates)' %
+                    (len(self.duplicates)))
+        if self.not_needed > 0:
+            print('Stopped at %d articles; %d articles of the frontier were not needed' %
+                    (config.article_target, self.not_needed))
+        if self.num_removals > 0:
+            print('Removed %d/%d articles of the corpus to drop article count to %d' %
+                    (self.num_removals, self.num_removals + config.article_target,
+                        config.article_target))
+        status_counts = crawl_state.download_counts()
+        print('Crawl state: %d downloaded, %d failed, %d duplicate, %d removed, '
+                '%d pending articles' % (status_counts.get(DONE, 0),
+                    status_counts.get(FAILED, 0), status_counts.get(DUPLICATE, 0),
+                    status_counts.get(REMOVED, 0), status_counts.get(PENDING, 0)))
+        print('#################################################################################\n')
+
+    # Write the metrics of the crawl to metrics_filename.
+    def write_metrics(self):
+        filename = self.config.metrics_filename
+        metrics = self.metrics
+        metrics.set_value('frontier_build_seconds', self.frontier_build_time)
+        metrics.set_value('download_seconds', self.download_time)
+        metrics.set_value('articles_downloaded', self.total_downloads)
+        metrics.set_value('downloaded_bytes', self.downloaded_bytes)
+        metrics.set_value('download_failures', len(self.download_failures))
+        metrics.set_value('duplicates_dropped', len(self.duplicates))
+        try:
+            metrics.write(filename)
+            print('Metrics written to \'%s\'' % (filename))
+        except OSError as ose:
+            perror('Cannot write metrics \'%s\': %s' % (filename, ose.strerror))
+
+
+# Return the storage stage selected by config.
+def create_storage(config):
+    if config.storage_backend == 'segments':
+        return SegmentStorage(config)
+    return FileStorage(config)
+
+
+# A crawl: builds the crawl frontier (unless updating an existing corpus),
+# downloads the articles and stores them, using the given stages.
+class Crawler:
+
+    def __init__(self, config, fetcher=None, frontier_builder=None,
+            storage=None, stats=None):
+        self.config = config
+        self.fetcher = fetcher if fetcher != None else Fetcher(config)
+        self.frontier_builder = frontier_builder
+        if frontier_builder == None:
+            self.frontier_builder = FrontierBuilder(config, self.fetcher)
+        self.storage = storage if storage != None else create_storage(config)
+        self.stats = stats if stats != None else CrawlStats(config)
+        self.crawl_state = None
+        self.pipeline = None
+        self.profiler = SamplingProfiler(config.profile_every)
+        self.duplicates = None   # DuplicateDetector of the downloads
+        if config.detect_duplicates:
+            self.duplicates = DuplicateDetector(config.near_duplicate_distance)
+
+    # Map an article href to the name of its raw HTML file.
+    def article_filename(self, href):
+        return canonicalize(href.split('/')[-1],
+                self.config.filename_max_size) + '.html'
+
+    # Report a failed download attempt and keep track of articles that
+    # could not be downloaded at all.
+    def report_download_error(self, url, download_attempts, error=None):
+        max_downld_retries = self.config.max_downld_retries
+        perror('Error downloading: \'%s\' [attempt %d/%d]' %
+                (url, download_attempts + 1, max_downld_retries + 1))
+        if download_attempts == max_downld_retries:
+            href = url[len(self.config.url_prefix):]
+            self.stats.download_failed(url)
+            self.crawl_state.record_download(href, FAILED, download_attempts + 1,
+                    str(error))
+            self.forget_article(href)
+
+    # Return the headers of a conditional request for href, based on the
+    # HTTP validators of the stored copy. Only used for incremental updates.
+    def conditional_headers(self, href):
+        headers = {}
+        if not self.config.incremental_update:
+            return headers
+        validators = self.crawl_state.get_validators(href)
+        if validators != None:
+            etag, last_modified, revision = validators
+            if etag != None:
+                headers['If-None-Match'] = etag
+            if last_modified != None:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    # Return True if the response shows that the stored copy of href is up
+    # to date, either because the server replied with 304 (Not Modified) or
+    # because the revision of the article has not changed. Only used for
+    # incremental updates.
+    def is_not_modified(self, href, status_code, html_text):
+        if not self.config.incremental_update:
+            return False
+        if status_code == 304:
+            return True
+        if status_code != 200:
+            return False
+        validators = self.crawl_state.get_validators(href)
+        return validators != None and validators[2] != None and \
+                validators[2] == revision_id(html_text)
+
+    # The stored copy of href is up to date, so it is not written again. As
+    # the raw HTML file is left untouched, it is not preprocessed again
+    # either. If the whole article was received (html_text is not None),
+    # the validators of the response (headers) replace the stored ones, so
+    # that the next update can use them even if the server changed them.
+    def article_not_modified(self, href, download_attempts, headers, html_text):
+        print('Not modified \'%s\'' % (self.config.url_prefix + href))
+        self.crawl_state.record_download(href, DONE, download_attempts)
+        if html_text != None:
+            self.crawl_state.save_validators(href, headers.get('ETag'),
+                    headers.get('Last-Modified'), revision_id(html_text))
+        self.stats.article_not_modified(len(html_text.encode('utf-8'))
+                if html_text != None else 0)
+
+    # Return True if article_target articles are already in the corpus, so
+    # the rest of the frontier need not be downloaded. Articles already in
+    # flight are still stored and the excess is trimmed at the end.
+    def target_reached(self):
+        return self.stats.corpus_size >= self.config.article_target
+
+    # Return True if the article of href need not be downloaded, either
+    # because article_target has been reached or because it is a duplicate.
+    def skip_article(self, href):
+        if self.target_reached():
+            self.stats.article_not_needed()
+            return True
+        return self.skip_duplicate(href)
+
+    # Return True if the article of href need not be downloaded at all,
+    # because an alias of it (a redirect to it) has already been stored.
+    def skip_duplicate(self, href):
+        if self.duplicates == None:
+            return False
+        owner = self.duplicates.owner(href)
+        if owner == None:
+            return False
+        self.article_duplicate(href, owner, 0)
+        return True
+
+    # Receive the body of the (streamed) response req to the request for
+    # href. If duplicates are detected, the canonical URL of the article is
+    # claimed as soon as its <head> has been received, so the rest of an
+    # alias of an article that has already been downloaded is never
+    # received.
+    # Return: 1) The raw HTML data (None if the article is an alias)
+    #         2) The href of the article it is an alias of or None
+    def receive_article(self, href, req):
+        if self.duplicates == None or req.status_code != 200:
+            return req.content, None
+        chunks = []
+        head = None
+        for chunk in req.iter_content(chunk_size=self.config.link_chunk_size):
+            chunks.append(chunk)
+            if head == None:
+                data = b''.join(chunks)
+                if b'</head>' in data or len(data) >= MAX_HEAD_SIZE:
+                    head = data
+                    owner = self.duplicates.claim(href, canonical_link(head))
+                    if owner != None:
+                        req.close()
+                        return None, owner
+        data = b''.join(chunks)
+        if head == None:   # Short article without a </head>
+            owner = self.duplicates.claim(href, canonical_link(data))
+            if owner != None:
+                return None, owner
+        return data, None
+
+    # Return the href of an article stored before, of which html_text (the
+    # article of href) is an alias or a near-duplicate, or None. Only used
+    # if duplicates are detected.
+    def duplicate_of(self, href, html_text, claim_canonical_url=False):
+        if self.duplicates == None:
+            return None
+        with self.stats.metrics.stage('dedup'):
+            if claim_canonical_url:
+                owner = self.duplicates.claim(href, canonical_link(
+                        html_text[:MAX_HEAD_SIZE].encode('utf-8')))
+                if owner != None:
+                    return owner
+            return self.duplicates.near_duplicate(href,
+                    simhash(content_text(html_text)))
+
+    # The article of href is a duplicate of the article of owner, so it is
+    # neither stored nor preprocessed.
+    def article_duplicate(self, href, owner, download_attempts):
+        print('Duplicate \'%s\' of \'%s\'' % (self.config.url_prefix + href,
+                owner))
+        self.crawl_state.record_download(href, DUPLICATE, download_attempts,
+                'Duplicate of ' + owner)
+        self.stats.article_duplicate(href)
+
+    # Release the canonical URL and fingerprint of an article that could
+    # not be stored after all.
+    def forget_article(self, href):
+        if self.duplicates != None:
+            self.duplicates.forget(href)
+
+    # Keep track of an article that was downloaded and written
+    # successfully, along with its HTTP validators for future incremental
+    # updates and its canonical URL and fingerprint to detect duplicates.
+    def article_stored(self, href, headers, html_text, sizes,
+            download_attempts):
+        self.crawl_state.record_download(href, DONE, download_attempts)
+        self.crawl_state.save_validators(href, headers.get('ETag'),
+                headers.get('Last-Modified'), revision_id(html_text))
+        if self.duplicates != None:
+            self.crawl_state.save_fingerprint(href,
+                    *self.duplicates.fingerprint(href))
+        self.stats.article_stored(*sizes)
+        if self.pipeline != None:   # Preprocess the article while downloading
+            self.pipeline.submit(self.article_filename(href), html_text)
+
+    # Download article and save raw HTML file.
+    # Return number of downloaded articles (0 or 1).
+    def download_article(self, href):
+        config = self.config
+        metrics = self.stats.metrics
+        download_attempts = 0
+        while download_attempts <= config.max_downld_retries:
+            try:
+                url = config.url_prefix + href
+                filename = self.article_filename(href)
+                if config.download_missing and self.storage.exists(filename):
+                    self.crawl_state.record_download(href, DONE, 0)
+                    self.stats.article_exists()
+                    return 0
+                if self.skip_article(href):
+                    return 0
+                print('Downloading \'%s\' -> \'%s\'' % (url, filename))
+                with metrics.stage('fetch'):
+                    req, (html_data, owner) = self.fetcher.send_request(url,
+                            lambda req: self.receive_article(href, req),
+                            headers=self.conditional_headers(href))
+                if owner != None:
+                    self.article_duplicate(href, owner, download_attempts + 1)
+                    return 0
+                with metrics.stage('decode'):
+                    html_text = decode_body(req, html_data)
+                if self.is_not_modified(href, req.status_code, html_text):
+                    self.article_not_modified(href, download_attempts + 1,
+                            req.headers,
+                            html_text if req.status_code == 200 else None)
+                    return 0
+                if req.status_code != 200:
+                    raise RequestException('Status code: ' +
+                            str(req.status_code), response=req)
+                owner = self.duplicate_of(href, html_text)
+                if owner != None:
+                    self.article_duplicate(href, owner, download_attempts + 1)
+                    return 0
+                with metrics.stage('write'):
+                    sizes = self.storage.write(filename, html_text)
+                self.article_stored(href, req.headers, html_text, sizes,
+                        download_attempts + 1)
+                return 1   # Downloaded one article
+            except RequestException as e:
+                # perror(e)
+                self.report_download_error(url, download_attempts, e)
+                resp_headers = e.response.headers if e.response != None else None
+            except OSError as ose:
+                perror('Error writing: \'%s\' -> \'%s\': %s [attempt %d/%d' %
+                        (url, self.storage.location(filename), ose.strerror,
+                            download_attempts + 1, config.max_downld_retries + 1))
+                if download_attempts == config.max_downld_retries:
+                    self.stats.write_failed(filename)
+                    self.crawl_state.record_download(href, FAILED,
+                            download_attempts + 1, ose.strerror)
+                    self.forget_article(href)
+                resp_headers = None
+            download_attempts += 1
+            if download_attempts <= config.max_downld_retries:
+                self.fetcher.wait_before_retry(download_attempts - 1,
+                        resp_headers)
+        return 0   # No article was stored
+
+    # Save the raw HTML file of an article downloaded by the asyncio engine.
+    # html_text is None if the server replied with 304 (Not Modified).
+    # Return number of stored articles (0 or 1).
+    def store_article(self, href, status, headers, html_text):
+        if self.is_not_modified(href, status, html_text):
+            self.article_not_modified(href, 1, headers, html_text)
+            return 0
+        owner = self.duplicate_of(href, html_text, claim_canonical_url=True)
+        if owner != None:
+            self.article_duplicate(href, owner, 1)
+            return 0
+        filename = self.article_filename(href)
+        print('Downloaded  \'%s\' -> \'%s\'' % (self.config.url_prefix + href,
+                filename))
+        try:
+            with self.stats.metrics.stage('write'):
+                sizes = self.storage.write(filename, html_text)
+            self.article_stored(href, headers, html_text, sizes, 1)
+            return 1
+        except OSError as ose:
+            perror('Error writing: \'%s\' -> \'%s\': %s' %
+                    (self.config.url_prefix + href,
+                        self.storage.location(filename), ose.strerror))
+            self.stats.write_failed(filename)
+            self.crawl_state.record_download(href, FAILED, 1, ose.strerror)
+            self.forget_article(href)
+            return 0
+
+    # Download articles using the asyncio engine: one thread keeps at most
+    # max_inflight requests in flight over persistent (keep-alive)
+    # connections. Aliases are only found once they have been received.
+    def async_download(self, article_hrefs):
+        import asyncdownload   # aiohttp is only required by the asyncio engine
+        config = self.config
+        if config.download_missing:
+            article_hrefs = [href for href in article_hrefs
+                    if not self.storage.exists(self.article_filename(href))]
+        # Evaluated lazily, as every href is taken by a worker
+        article_hrefs = (href for href in article_hrefs
+                if not self.skip_article(href))
+        self.stats.total_downloads = asyncdownload.download_all(article_hrefs,
+                config.url_prefix, self.store_article,
+                self.report_download_error,
+                request_headers=self.conditional_headers,
+                max_inflight=config.max_inflight,
+                max_conns_per_host=config.max_conns_per_host,
+                max_retries=config.max_downld_retries,
+                rate_limiter=self.fetcher.rate_limiter,
+                concurrency=self.fetcher.concurrency,
+                backoff_base=config.backoff_base,
+                max_backoff=config.max_backoff,
+                metrics=self.stats.metrics,
+                request_timeout=config.request_timeout)
+
+    # download_article(), sampled by the profiler. The latency of every
+    # article, including retries, is kept in a histogram.
+    def timed_download_article(self, href):
+        t0 = time.perf_counter()
+        downloaded = self.profiler.call('download_article',
+                self.download_article, href)
+        self.stats.metrics.observe('document_latency_seconds',
+                time.perf_counter() - t0, LATENCY_BUCKETS)
+        return downloaded
+
+    # Download articles pulled from the shared work queue.
+    def download(self, work_queue, tid):
+        self.stats.worker_done(consume_work_queue(work_queue,
+                self.timed_download_article, tid))
+
+    # Articles are assigned to threads dynamically, download_batch_size
+    # articles at a time. There is a thread for every request that may be
+    # in flight, while the concurrency controller decides how many of them
+    # are actually sending requests.
+    def multithreaded_download(self, article_hrefs):
+        num_threads = self.fetcher.concurrency.max_limit
+        thread_list = []
+        work_queue = queue.Queue()
+        fill_work_queue(work_queue, article_hrefs,
+                self.config.download_batch_size, num_threads)
+        # Create threads
+        for i in range(min(num_threads, len(article_hrefs))):
+            thread = threading.Thread(target=self.download,
+                    args=(work_queue, i))
+            thread_list.append(thread)
+            thread.start()
+        # Join threads
+        for thread in thread_list:
+            thread.join()
+
+    # Remove redundant files to reach article_target. The articles of the
+    # corpus are known from the crawl state, in frontier order, so the ones
+    # in excess are the lowest-priority ones (the last of the frontier),
+    # i.e. those downloaded while the target was being reached. hrefs whose
+    # (truncated) filenames collide share a single file. The canonical URLs
+    # and fingerprints of the removed articles are forgotten, so that their
+    # aliases and near-duplicates are not dropped by later crawls.
+    def remove_redundant_files(self):
+        hrefs_of = {}   # {filename: hrefs stored in it}
+        for href in self.crawl_state.done_downloads():
+            hrefs_of.setdefault(self.article_filename(href), []).append(href)
+        filenames = list(hrefs_of)   # In order of their first href
+        redundant_files = filenames[self.config.article_target:]
+        self.stats.num_removals = len(redundant_files)
+        for i, filename in enumerate(redundant_files):
+            print("Removing redundant file: %3d - %s" % (i+1, filename))
+            self.storage.remove(filename)
+            for href in hrefs_of[filename]:
+                self.crawl_state.record_download(href, REMOVED, 0)
+                self.crawl_state.delete_fingerprint(href)
+                self.forget_article(href)
+
+    def run(self):
+        config = self.config
+        stats = self.stats
+        stats.print_startup_info()
+        os.makedirs(config.repo_path, exist_ok=True)
+        self.crawl_state = CrawlState(config.crawl_state_path())
+        if config.update_corpus == True:
+            article_hrefs = read_hrefs(config.repo_path + 'urls.txt')
+        else:
+            seeds = read_hrefs(config.seeds_filename)
+            t0 = time.time()
+            article_hrefs, stats.webpages_parsed = self.frontier_builder.build(
+                    seeds, self.crawl_state)
+            stats.frontier_build_time = time.time() - t0
+            write_urls_tofile(article_hrefs, config.repo_path)
+        self.crawl_state.add_downloads(article_hrefs)
+        if self.duplicates != None:
+            # Articles stored by earlier runs (i.e. when updating the corpus)
+            for href, canonical_url, fingerprint in \
+                    self.crawl_state.load_fingerprints():
+                self.duplicates.add(href, canonical_url, fingerprint)
+        if config.resume_crawl == True:
+            # Only articles that have not been downloaded yet
+            article_hrefs = self.crawl_state.pending_downloads()
+            print('Resuming download of %d pending articles' %
+                    (len(article_hrefs)))
+        elif config.update_corpus == True:
+            # Only the articles of the corpus, not the ones removed or not
+            # needed (if the crawl state of the corpus is available)
+            stored_hrefs = self.crawl_state.done_downloads()
+            if len(stored_hrefs) > 0:
+                article_hrefs = stored_hrefs
+            self.crawl_state.reset_downloads()
+        stats.corpus_size = self.crawl_state.download_counts().get(DONE, 0)
+        if config.pipeline_mode == True:
+            import preprocess   # Only required by the pipelined mode
+            preprocess.repo_path = config.repo_path
+            preprocess.segments_path = config.segments_path()
+            preprocess.corpus_path = config.corpus_path
+            preprocess.manifest_path = config.corpus_path + 'manifest.tsv'
+            preprocess.storage_backend = config.storage_backend
+            preprocess.profile_every = config.profile_every
+            if config.metrics_filename != None:
+                root, ext = os.path.splitext(config.metrics_filename)
+                preprocess.metrics_filename = root + '-preprocess' + ext
+            self.pipeline = preprocess.PreprocessingPipeline(
+                    config.pipeline_queue_size)
+        try:
+            t2 = time.time()
+            if config.download_engine == 'async':
+                self.async_download(article_hrefs)
+            else:
+                self.multithreaded_download(article_hrefs)
+            stats.download_time = time.time() - t2
+            stats.print_failures()
+            self.remove_redundant_files()
+            stats.print_stats(self.fetcher.concurrency, self.crawl_state)
+            if config.metrics_filename != None:
+                stats.write_metrics()
+            for filename in self.profiler.dump(profile_prefix(
+                    config.metrics_filename, 'crawler')):
+                print('Profile written to \'%s\'' % (filename))
+            if self.pipeline != None:
+                self.pipeline.finish()
+        finally:
+            self.crawl_state.close()
+            self.storage.close()
+
+
+# Return the CrawlConfig described by the command-line arguments args,
+# starting from profile unless another one is given (--profile).
+def parse_args(args, profile='large'):
+    for arg in args:
+        if arg.startswith("--profile="):
+            profile = arg.split('=', 1)[1]
+            if profile not in PROFILES:
+                perror("Unknown profile: '" + profile + "'")
+                exit(1)
+    config = CrawlConfig(profile)
+    for arg in args:
+        if arg.startswith("--profile="):
+            continue
+        elif arg == "--update":
+            config.update_corpus = True
+        elif arg == "--download-missing":
+            config.download_missing = True
+            config.update_corpus = True
+        elif arg == "--incremental":
+            config.incremental_update = True
+            config.update_corpus = True
+        elif arg == "--resume":
+            config.resume_crawl = True
+        elif arg == "--storage=files":
+            config.storage_backend = 'files'
+        elif arg == "--storage=segments":
+            config.storage_backend = 'segments'
+        elif arg == "--compact":
+            config.compaction_threshold = 0.0
+        elif arg == "--async":
+            config.download_engine = 'async'
+        elif arg == "--pipeline":
+            config.pipeline_mode = True
+        elif arg.startswith("--pipeline-queue="):
+            config.pipeline_mode = True
+            config.pipeline_queue_size = int(arg.split('=', 1)[1])
+        elif arg.startswith("--max-inflight="):
+            config.max_inflight = int(arg.split('=', 1)[1])
+            config.max_conns_per_host = config.max_inflight
+        elif arg.startswith("--threads="):
+            config.num_threads = int(arg.split('=', 1)[1])
+        elif arg.startswith("--max-threads="):
+            config.max_threads = int(arg.split('=', 1)[1])
+        elif arg == "--fixed-concurrency":
+            config.adaptive_concurrency = False
+        elif arg.startswith("--rate="):
+            config.request_rate = float(arg.split('=', 1)[1])
+        elif arg.startswith("--burst="):
+            config.request_burst = int(arg.split('=', 1)[1])
+        elif arg.startswith("--metrics="):
+            config.metrics_filename = arg.split('=', 1)[1]
+        elif arg.startswith("--cprofile="):
+            config.profile_every = int(arg.split('=', 1)[1])
+        elif arg == "--no-dedup":
+            config.detect_duplicates = False
+        elif arg == "--no-near-dups":
+            config.near_duplicate_distance = None
+        elif arg.startswith("--near-dup-distance="):
+            config.near_duplicate_distance = int(arg.split('=', 1)[1])
+        elif arg.startswith("--url-prefix="):
+            config.url_prefix = arg.split('=', 1)[1].rstrip('/')
+        elif arg.startswith("--seeds="):
+            config.seeds_filename = arg.split('=', 1)[1]
+        elif arg.startswith("--target="):
+            config.article_target = int(arg.split('=', 1)[1])
+        elif arg.startswith("--redundancy="):
+            config.redundancy = float(arg.split('=', 1)[1])
+        elif arg.startswith("--repo="):
+            config.repo_path = os.path.join(arg.split('=', 1)[1], '')
+        elif arg.startswith("--corpus="):
+            config.corpus_path = os.path.join(arg.split('=', 1)[1], '')
+        else:
+            perror("Uknown command-line argument: '" + arg + "'")
+            exit(1)
+    return config
+
+
+def main(config):
+    Crawler(config).run()
+
+
+###############
+# Global data #
+###############
+revision_id_regex = re.compile(r'"wgRevisionId":\s*(\d+)')
+MAX_HEAD_SIZE = 2**16  # Bytes of an article received before its canonical URL is claimed
+# Settings of the two corpora (see CrawlConfig for the defaults)
+PROFILES = {
+    # 6k articles out of the basic list of seeds
+    'small': {
+        'seeds_filename': 'crawler-seeds.txt',
+        'article_target': 6000,
+        'redundancy': 1.0,
+        # Articles named {ISO,IEC,IEEE}_* and 802.* are excluded to support a
+        # larger variety of articles as there are many variants of them.
+        # i.e. IEEE_802.11{ac,ad,af,ah,ai,ax,ay,be}
+        'excluded_href_substrings': ('ISO_', 'IEEE_', '802.', 'IEC_'),
+        'filename_max_size': None,
+        'num_threads': os.cpu_count() * 16,
+        'max_threads': os.cpu_count() * 16,
+        'max_downld_retries': 3,
+    },
+    # 100k articles out of the extended list of seeds; the crawl frontier is
+    # 0.5% larger than article_target for redundancy reasons (i.e. bad
+    # hyperlinks). Downloading stops once article_target articles are
+    # stored and the few in excess (in flight at that time) are removed at
+    # the end.
+    'large': {
+        'seeds_filename': 'crawler-seeds-extended.txt',
+        'article_target': 100000,
+        'redundancy': 1.005,
+        'excluded_href_substrings': (),
+        'filename_max_size': 64,
+        'num_threads': 7,
+        'max_threads': 32,
+        'max_downld_retries': 6,
+    },
+}
+
+
+if __name__ == '__main__':
+    main(parse_args(sys.argv[1:]))
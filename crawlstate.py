@@ -0,0 +1,250 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Persistent crawl state stored in an SQLite database. It holds the crawl
+# frontier (in BFS order), the position of the next frontier article to be
+# parsed for hyperlinks and the download status of every article, so that an
+# interrupted crawl can be resumed without rebuilding the frontier or
+# scanning the repository directory. The HTTP validators (ETag,
+# Last-Modified) and revision id of every stored article are also kept, to
+# update the corpus using conditional requests, along with its canonical
+# URL and SimHash fingerprint, to detect duplicates (see dedup.py).
+
+
+import sqlite3
+import threading
+
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+DUPLICATE = 'duplicate'
+REMOVED = 'removed'   # Downloaded, then removed to trim the corpus
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS frontier (
+    pos INTEGER PRIMARY KEY,
+    href TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS canonical_hrefs (
+    pos INTEGER PRIMARY KEY,
+    href TEXT NOT NULL UNIQUE,
+    canonical_href TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS progress (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS downloads (
+    pos INTEGER PRIMARY KEY,
+    href TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE TABLE IF NOT EXISTS validators (
+    href TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    revision INTEGER
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    href TEXT PRIMARY KEY,
+    canonical_url TEXT,
+    simhash TEXT
+);
+'''
+
+
+class CrawlState:
+
+    def __init__(self, path):
+        # The connection is shared by all threads; lock serializes access.
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.executescript(SCHEMA)
+            self.conn.commit()
+
+    # Forget everything, i.e. when a new crawl starts from the seeds.
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM frontier')
+            self.conn.execute('DELETE FROM canonical_hrefs')
+            self.conn.execute('DELETE FROM progress')
+            self.conn.execute('DELETE FROM downloads')
+            self.conn.execute('DELETE FROM fingerprints')
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    ############
+    # Frontier #
+    ############
+
+    # Return the stored frontier hrefs in BFS order.
+    def load_frontier(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT href FROM frontier ORDER BY pos')
+            return [row[0] for row in rows]
+
+    def get_progress(self, key, default=0):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM progress WHERE key = ?',
+                    (key,)).fetchone()
+        return default if row is None else row[0]
+
+    # Return the (href, canonical href) of the parsed frontier articles
+    # whose canonical href is another one, in the order they were parsed.
+    def load_canonical_hrefs(self):
+        with self.lock:
+            return self.conn.execute('SELECT href, canonical_href FROM '
+                    'canonical_hrefs ORDER BY pos').fetchall()
+
+    # Atomically append the hrefs added to the frontier after parsing one
+    # more article, together with the new parse cursor (index of the next
+    # frontier article to be parsed) and the number of parsed articles.
+    # canonical_href is the canonical href of the parsed article, if it is
+    # another one.
+    def save_frontier_progress(self, added_hrefs, parse_cursor, webpages_parsed,
+            parsed_href=None, canonical_href=None):
+        with self.lock:
+            self.conn.executemany('INSERT OR IGNORE INTO frontier (href) VALUES (?)',
+                    ((href,) for href in added_hrefs))
+            if canonical_href != None:
+                self.conn.execute('INSERT OR IGNORE INTO canonical_hrefs '
+                        '(href, canonical_href) VALUES (?, ?)',
+                        (parsed_href, canonical_href))
+            self.conn.executemany('INSERT OR REPLACE INTO progress VALUES (?, ?)',
+                    (('parse_cursor', parse_cursor),
+                    ('webpages_parsed', webpages_parsed)))
+            self.conn.commit()
+
+    # Mark that no more hyperlinks need to be extracted.
+    def mark_frontier_complete(self):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO progress VALUES (?, ?)',
+                    ('frontier_complete', 1))
+            self.conn.commit()
+
+    def frontier_complete(self):
+        return self.get_progress('frontier_complete') == 1
+
+    #############
+    # Downloads #
+    #############
+
+    # Register hrefs to be downloaded. Already registered hrefs keep their
+    # current status.
+    def add_downloads(self, hrefs):
+        with self.lock:
+            self.conn.executemany('INSERT OR IGNORE INTO downloads (href, status) '
+                    'VALUES (?, ?)', ((href, PENDING) for href in hrefs))
+            self.conn.commit()
+
+    # Mark the articles of the corpus (done) as pending, i.e. when the corpus
+    # is updated. The hrefs that failed, were removed from the corpus or are
+    # duplicates keep their status, as an update does not download them.
+    def reset_downloads(self):
+        with self.lock:
+            self.conn.execute('UPDATE downloads SET status = ?, attempts = 0, '
+                    'last_error = NULL WHERE status = ?', (PENDING, DONE))
+            self.conn.commit()
+
+    # Return the hrefs that have not been downloaded yet (pending or failed)
+    # in the order they were registered.
+    def pending_downloads(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT href FROM downloads WHERE status '
+                    'NOT IN (?, ?, ?) ORDER BY pos', (DONE, DUPLICATE, REMOVED))
+            return [row[0] for row in rows]
+
+    # Return the hrefs of the articles that are part of the corpus (done)
+    # in the order they were registered, i.e. in frontier order.
+    def done_downloads(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT href FROM downloads WHERE status = ? '
+                    'ORDER BY pos', (DONE,))
+            return [row[0] for row in rows]
+
+    # Record the outcome of downloading href after the given number of
+    # attempts. last_error describes the last failure, if any.
+    def record_download(self, href, status, attempts, last_error=None):
+        with self.lock:
+            self.conn.execute('UPDATE downloads SET status = ?, '
+                    'attempts = attempts + ?, last_error = ? WHERE href = ?',
+                    (status, attempts, last_error, href))
+            self.conn.commit()
+
+    # Return a dictionary of the form {status: number of hrefs}.
+    def download_counts(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT status, COUNT(*) FROM downloads '
+                    'GROUP BY status')
+            return dict(rows.fetchall())
+
+    ##############
+    # Validators #
+    ##############
+
+    # Return the (etag, last_modified, revision) of the stored copy of href
+    # or None if nothing is known about it.
+    def get_validators(self, href):
+        with self.lock:
+            return self.conn.execute('SELECT etag, last_modified, revision '
+                    'FROM validators WHERE href = ?', (href,)).fetchone()
+
+    def save_validators(self, href, etag, last_modified, revision):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?)',
+                    (href, etag, last_modified, revision))
+            self.conn.commit()
+
+    ################
+    # Fingerprints #
+    ################
+
+    # Return the (href, canonical URL, SimHash) of every stored article.
+    # Either of the last two may be None.
+    def load_fingerprints(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT href, canonical_url, simhash '
+                    'FROM fingerprints').fetchall()
+        return [(href, canonical_url, int(simhash, 16) if simhash != None
+                else None) for href, canonical_url, simhash in rows]
+
+    # SimHashes are unsigned 64-bit integers, which SQLite cannot store as
+    # INTEGER, so they are stored in hex.
+    def save_fingerprint(self, href, canonical_url, simhash):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)',
+                    (href, canonical_url, '%016x' % (simhash)
+                        if simhash != None else None))
+            self.conn.commit()
+
+    # Forget the fingerprint of an article that is no longer stored.
+    def delete_fingerprint(self, href):
+        with self.lock:
+            self.conn.execute('DELETE FROM fingerprints WHERE href = ?', (href,))
+            self.conn.commit()
@@ -0,0 +1,229 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Duplicate detection of the crawler. Two kinds of duplicates are dropped:
+#  - aliases: Wikipedia serves redirects (i.e. '/wiki/USA') with the text of
+#    the target article and a <link rel="canonical"> to it, so every
+#    canonical URL is claimed by the first article found with it and any
+#    other article with the same canonical URL is an alias,
+#  - near-duplicates: articles whose text is almost the same as the text of
+#    an article already stored (i.e. variants of the same article), found
+#    by comparing the 64-bit SimHash fingerprints of their word shingles.
+#    Fingerprints are kept in an LSH index of max_distance + 1 bands, so
+#    that any two fingerprints differing in at most max_distance bits share
+#    at least one band (pigeonhole principle) and only the fingerprints of
+#    the same bucket are compared.
+
+
+import re
+import hashlib
+import threading
+from urllib.parse import urlsplit, unquote
+
+
+SHINGLE_SIZE = 4   # Words per shingle
+script_regex = re.compile(r'<(script|style)\b.*?</\1>', re.IGNORECASE | re.DOTALL)
+tag_regex = re.compile(r'<[^>]*>')
+word_regex = re.compile(r'\w+')
+
+
+# Return the key of the article of href (or of a URL), which is the same
+# for all spellings of the same title, or None if it is not an article.
+def article_key(href):
+    if href == None:
+        return None
+    path = urlsplit(href).path
+    if not path.startswith('/wiki/'):
+        return None
+    return unquote(path)
+
+
+# Return the href ('/wiki/<title>') of canonical_url or None if it is not
+# the URL of an article.
+def canonical_href(canonical_url):
+    if canonical_url == None:
+        return None
+    path = urlsplit(canonical_url).path
+    return path if path.startswith('/wiki/') else None
+
+
+# Return the text of the content of an article, without tags.
+def content_text(html_text):
+    start = html_text.find('id="mw-content-text"')
+    end = html_text.find('class="printfooter"', max(start, 0))
+    if end == -1:
+        end = len(html_text)
+    content = script_regex.sub(' ', html_text[max(start, 0):end])
+    return tag_regex.sub(' ', content)
+
+
+# Return the 64-bit SimHash of text: every bit is set if it is set in the
+# (BLAKE2) hashes of more than half of the shingles of SHINGLE_SIZE words
+# of text. Return None if text has no words.
+def simhash(text):
+    words = word_regex.findall(text.lower())
+    if len(words) == 0:
+        return None
+    shingles = set(' '.join(words[i:i + SHINGLE_SIZE])
+            for i in range(max(len(words) - SHINGLE_SIZE + 1, 1)))
+    num_shingles = len(shingles)
+    # All hashes as the 64-bit lanes of a single integer, so that the
+    # number of hashes with a bit set is counted at once for all of them
+    lanes = int.from_bytes(b''.join(hashlib.blake2b(shingle.encode('utf-8'),
+            digest_size=8).digest() for shingle in shingles), 'little')
+    low_bits = int.from_bytes(b'\x01\0\0\0\0\0\0\0' * num_shingles, 'little')
+    fingerprint = 0
+    for bit in range(64):
+        if 2 * ((lanes >> bit) & low_bits).bit_count() > num_shingles:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+# LSH index of SimHash fingerprints.
+class SimHashIndex:
+
+    def __init__(self, max_distance=3):
+        self.max_distance = max_distance
+        num_bands = max_distance + 1
+        band_size = 64 // num_bands
+        # (shift, mask) of every band; the last one takes the bits left
+        self.bands = [(i * band_size, (1 << band_size) - 1)
+                for i in range(num_bands - 1)]
+        last_shift = (num_bands - 1) * band_size
+        self.bands.append((last_shift, (1 << (64 - last_shift)) - 1))
+        self.buckets = [{} for band in self.bands]   # {band value: [key]}
+        self.fingerprints = {}   # {key: fingerprint}
+
+    # Return the key of a fingerprint within max_distance bits of
+    # fingerprint, other than the one of key, or None.
+    def find(self, fingerprint, key=None):
+        for (shift, mask), buckets in zip(self.bands, self.buckets):
+            for other in buckets.get((fingerprint >> shift) & mask, ()):
+                if other != key and hamming_distance(fingerprint,
+                        self.fingerprints[other]) <= self.max_distance:
+                    return other
+        return None
+
+    def add(self, fingerprint, key):
+        self.remove(key)
+        self.fingerprints[key] = fingerprint
+        for (shift, mask), buckets in zip(self.bands, self.buckets):
+            buckets.setdefault((fingerprint >> shift) & mask, []).append(key)
+
+    def remove(self, key):
+        fingerprint = self.fingerprints.pop(key, None)
+        if fingerprint == None:
+            return
+        for (shift, mask), buckets in zip(self.bands, self.buckets):
+            band = (fingerprint >> shift) & mask
+            buckets[band].remove(key)
+            if len(buckets[band]) == 0:
+                del buckets[band]
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+
+# Duplicate detector shared by all download threads. Articles are referred
+# to by their hrefs. near_duplicate_distance is the max number of different
+# bits of the fingerprints of near-duplicates (None: only aliases are
+# detected).
+class DuplicateDetector:
+
+    def __init__(self, near_duplicate_distance=3):
+        self.lock = threading.Lock()
+        self.owners = {}   # {canonical key: href of the article stored for it}
+        self.claims = {}   # {href: canonical key claimed by it}
+        self.index = None
+        if near_duplicate_distance != None:
+            self.index = SimHashIndex(near_duplicate_distance)
+
+    # Claim canonical_url for the article of href. Return the href of the
+    # article that has already claimed it or None if href claimed it (or
+    # has no canonical URL).
+    def claim(self, href, canonical_url):
+        key = article_key(canonical_url)
+        if key == None:
+            return None
+        self.lock.acquire()
+        owner = self.owners.get(key)
+        if owner == None or owner == href:
+            self.owners[key] = href
+            self.claims[href] = key
+            owner = None
+        self.lock.release()
+        return owner
+
+    # Return the href of the article that has claimed href as its canonical
+    # URL (i.e. href is the target of a redirect downloaded before it) or
+    # None. Such articles need not be downloaded at all.
+    def owner(self, href):
+        self.lock.acquire()
+        owner = self.owners.get(article_key(href))
+        self.lock.release()
+        return owner if owner != href else None
+
+    # Return the href of an article whose fingerprint is within
+    # near_duplicate_distance bits of fingerprint or None, in which case
+    # fingerprint is added as the fingerprint of href.
+    def near_duplicate(self, href, fingerprint):
+        if self.index == None or fingerprint == None:
+            return None
+        self.lock.acquire()
+        other = self.index.find(fingerprint, href)
+        if other == None:
+            self.index.add(fingerprint, href)
+        self.lock.release()
+        return other
+
+    # Return the canonical key and the fingerprint of the article of href
+    # (either may be None), to be stored along with the article.
+    def fingerprint(self, href):
+        self.lock.acquire()
+        key = self.claims.get(href)
+        fingerprint = None
+        if self.index != None:
+            fingerprint = self.index.fingerprints.get(href)
+        self.lock.release()
+        return key, fingerprint
+
+    # Add the canonical URL (or key) and fingerprint of an article stored
+    # in an earlier run.
+    def add(self, href, canonical_url, fingerprint):
+        self.claim(href, canonical_url)
+        if self.index != None and fingerprint != None:
+            self.lock.acquire()
+            self.index.add(fingerprint, href)
+            self.lock.release()
+
+    # Forget the article of href, i.e. if it could not be stored after all.
+    def forget(self, href):
+        self.lock.acquire()
+        key = self.claims.pop(href, None)
+        if key != None and self.owners.get(key) == href:
+            del self.owners[key]
+        if self.index != None:
+            self.index.remove(href)
+        self.lock.release()
+
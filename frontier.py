@@ -0,0 +1,91 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Crawl frontier used by the crawlers. hrefs are kept in insertion (BFS)
+# order in a list, while a hash set answers "already seen" queries in O(1)
+# instead of scanning the whole list for every extracted hyperlink.
+# Once an article of the frontier is parsed, its canonical href is known:
+# if it is another article of the frontier, the article is an alias of it
+# (i.e. a redirect) and is marked as a duplicate, which is not downloaded
+# and does not count towards the limit of the frontier.
+class CrawlFrontier:
+
+    def __init__(self, hrefs=()):
+        self.hrefs = []
+        self.seen = set()
+        self.duplicates = set()   # Aliases of other hrefs of the frontier
+        self.extend(hrefs)
+
+    # Append href at the end of the frontier unless it has already been seen.
+    # Return True if href was added.
+    def add(self, href):
+        if href in self.seen:
+            return False
+        self.seen.add(href)
+        self.hrefs.append(href)
+        return True
+
+    # Bulk add hrefs in the given order, stopping as soon as the frontier
+    # holds limit hrefs other than duplicates (if limit is not None).
+    # Return the list of hrefs that were actually added.
+    def extend(self, hrefs, limit=None):
+        added = []
+        for href in hrefs:
+            if limit is not None and self.num_articles() >= limit:
+                break
+            if self.add(href):
+                added.append(href)
+        return added
+
+    # Record that the article of href has canonical_href as its canonical
+    # href. Return True if href turned out to be a duplicate.
+    def resolve(self, href, canonical_href):
+        if canonical_href == None or canonical_href == href:
+            return False
+        if canonical_href in self.seen:
+            self.duplicates.add(href)
+            return True
+        # Hyperlinks to the canonical article are aliases of href
+        self.seen.add(canonical_href)
+        return False
+
+    # Number of hrefs of the frontier other than duplicates.
+    def num_articles(self):
+        return len(self.hrefs) - len(self.duplicates)
+
+    # Return the hrefs of the frontier other than duplicates, in order.
+    def articles(self):
+        return [href for href in self.hrefs if href not in self.duplicates]
+
+    def __contains__(self, href):
+        return href in self.seen
+
+    def __len__(self):
+        return len(self.hrefs)
+
+    # Indexing and slicing are performed on the underlying list, so a slice
+    # is a plain list of hrefs.
+    def __getitem__(self, index):
+        return self.hrefs[index]
+
+    # List iterators pick up elements appended during iteration, so the
+    # frontier can be expanded while it is being traversed.
+    def __iter__(self):
+        return iter(self.hrefs)
@@ -0,0 +1,585 @@
+#!/usr/bin/env python3
+
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Inverted index of the corpus. Documents are indexed while they are still
+# in memory, either by the preprocessing processes (preprocess.py --index),
+# each of which writes partial indexes (runs) that are merged at the end,
+# or by running this script over an existing corpus. Every field of a
+# document (see FIELDS) is indexed separately. An index is a directory of
+# files that are memory-mapped by readers:
+#  - terms.dat: the terms, as '<field>:<term>' in UTF-8, in sorted order,
+#  - terms.idx: one fixed-size TERM_RECORD per term, in the same order, so
+#    that terms are looked up by binary search,
+#  - postings.dat: the posting list of every term, as (doc id delta, term
+#    frequency) pairs encoded as varints,
+#  - skips.dat: every SKIP_INTERVAL postings of a list (of every run, in
+#    merged indexes), the doc id of the last posting so far and the offset
+#    of the next one within the list, so that readers may skip whole
+#    blocks of postings without decoding them,
+#  - norms.dat: the length (in terms) of every field of every document,
+#  - docs.dat/docs.idx: url, title and summary of every document (JSON
+#    lines) and the offset of every line,
+#  - meta.json: number of documents, total field lengths etc.
+#
+# Usage:
+#     python invindex.py [--corpus=DIR] [--index=DIR] [--format=xml|jsonl]
+
+
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import heapq
+import shutil
+import struct
+from array import array
+from itertools import groupby
+from collections import Counter
+from shards import ShardReader
+
+########################
+# Function definitions #
+########################
+
+
+# Print message to STDERR.
+def perror(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+    sys.stderr.flush()
+
+
+# Return the terms of text: lowercase runs of letters and digits.
+def tokenize(text):
+    return [term for term in token_regex.findall(text.lower())
+            if len(term) <= MAX_TERM_LENGTH]
+
+
+def encode_varint(value, buf):
+    while value >= 0x80:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+# Return the varint of data at pos and the position following it.
+def decode_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+# Iterate over the (doc id, term frequency) pairs of an encoded posting list.
+def decode_postings(data):
+    pos = 0
+    doc_id = 0
+    end = len(data)
+    while pos < end:
+        delta, pos = decode_varint(data, pos)
+        tf, pos = decode_varint(data, pos)
+        doc_id += delta
+        yield doc_id, tf
+
+
+# Return the {field: text} of a document in the form of
+# preprocess.render_json_document().
+def document_fields(document):
+    headings = []
+    content = []
+    for section in document['sections']:
+        heading = section['heading']
+        # The first section is headed by the title; misc sections (i.e.
+        # __quotes__) are headed by their key.
+        if heading != document['title'] and not heading.startswith('__'):
+            headings.append(heading)
+        content.append(section['content'])
+    summary = document['summary']
+    if summary == NO_DESC_AVAIL:
+        summary = ''
+    return {
+        'title': document['title'],
+        'headings': '\n'.join(headings),
+        'content': '\n'.join(content),
+        'summary': summary,
+        'infobox': document['infobox']
+    }
+
+
+# Return a document in the form of preprocess.render_json_document() out
+# of the text of a virtual XML document (see preprocess.render_virtual_xml()).
+def read_virtual_xml(text):
+    document = {'url': None, 'title': '', 'sections': [],
+            'summary': NO_DESC_AVAIL, 'infobox': ''}
+    tag = None
+    heading = None
+    lines = []
+    for line in text.split('\n'):
+        if tag == None:
+            if line in ['<url>', '<title>', '<heading>', '<content>',
+                    '<published>', '<updated>']:
+                tag = line[1:-1]
+                lines = []
+        elif line == '</' + tag + '>':
+            value = '\n'.join(lines)
+            if tag == 'heading':
+                heading = value
+            elif tag == 'content':
+                if heading == '__summary__':
+                    document['summary'] = value
+                elif heading == '__infobox__':
+                    document['infobox'] = value
+                else:
+                    document['sections'].append({'heading': heading,
+                            'content': value})
+            elif tag in ['url', 'title']:
+                document[tag] = value
+            tag = None
+        else:
+            lines.append(line)
+    return document
+
+
+# Return a read-only memory map of filename (empty files cannot be mapped).
+def map_file(filename):
+    with open(filename, mode='rb') as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# Writes the term dictionary, the posting lists and the skips of an index,
+# term by term, in term order.
+class TermWriter:
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.files = [open(os.path.join(path, filename), mode='wb')
+                for filename in [TERMS_FILENAME, TERMS_INDEX_FILENAME,
+                    POSTINGS_FILENAME, SKIPS_FILENAME]]
+        self.term_offset = 0
+        self.postings_offset = 0
+        self.skips_offset = 0   # In skip entries
+        self.num_terms = 0
+
+    # term is UTF-8 encoded; skips is an array('I') of (doc id, offset)
+    # pairs or None.
+    def add(self, term, df, max_tf, last_doc, data, skips):
+        terms_file, index_file, postings_file, skips_file = self.files
+        num_skips = len(skips) // 2 if skips != None else 0
+        terms_file.write(term)
+        postings_file.write(data)
+        if num_skips > 0:
+            skips.tofile(skips_file)
+        index_file.write(TERM_RECORD.pack(self.term_offset, len(term), df,
+                self.postings_offset, len(data), max_tf, last_doc,
+                self.skips_offset, num_skips))
+        self.term_offset += len(term)
+        self.postings_offset += len(data)
+        self.skips_offset += num_skips
+        self.num_terms += 1
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+
+# Write the files of an index to path. postings is a sorted list of
+# (key, [df, last doc id, max tf, encoded postings, skips]).
+def write_index(path, postings, docs, norms, total_lengths):
+    term_writer = TermWriter(path)
+    for key, (df, last_doc, max_tf, data, skips) in postings:
+        term_writer.add(key.encode('utf-8'), df, max_tf, last_doc, data, skips)
+    term_writer.close()
+    write_documents(path, docs, norms, total_lengths, term_writer.num_terms)
+
+
+# Write the document table, the norms and meta.json of an index.
+def write_documents(path, docs, norms, total_lengths, num_terms):
+    offsets = array('Q', [0])
+    with open(os.path.join(path, DOCS_FILENAME), mode='wb') as docs_file:
+        for record in docs:
+            docs_file.write(record)
+            offsets.append(offsets[-1] + len(record))
+    with open(os.path.join(path, DOCS_INDEX_FILENAME), mode='wb') as outfile:
+        offsets.tofile(outfile)
+    with open(os.path.join(path, NORMS_FILENAME), mode='wb') as outfile:
+        norms.tofile(outfile)
+    meta = {
+        'version': INDEX_VERSION,
+        'byteorder': sys.byteorder,
+        'fields': FIELDS,
+        'num_docs': len(offsets) - 1,
+        'num_terms': num_terms,
+        'total_lengths': total_lengths
+    }
+    with open(os.path.join(path, META_FILENAME), mode='w',
+            encoding='utf-8') as outfile:
+        json.dump(meta, outfile, indent=2)
+        outfile.write('\n')
+
+
+# Builds an index in memory, document by document. Whenever the postings
+# held in memory reach max_postings, they are written to disk as a run
+# (a complete index of the documents added so far) at '<path>-<run>', so
+# memory stays bounded; runs are merged by merge_indexes().
+class IndexWriter:
+
+    def __init__(self, path, max_postings=2**22):
+        self.path = path
+        self.max_postings = max_postings
+        self.run_paths = []
+        self.reset()
+
+    def reset(self):
+        # {key: [df, last doc id, max tf, encoded postings, skips]}
+        self.postings = {}
+        self.docs = []   # JSON lines of the documents
+        self.norms = array('I')   # Field lengths, num_fields per document
+        self.total_lengths = [0] * len(FIELDS)
+        self.num_postings = 0
+
+    # Add document (in the form of preprocess.render_json_document()) as
+    # the next document of the index.
+    def add(self, name, document):
+        doc_id = len(self.docs)
+        fields = document_fields(document)
+        postings = self.postings
+        for field_id, field in enumerate(FIELDS):
+            terms = tokenize(fields[field])
+            self.norms.append(len(terms))
+            self.total_lengths[field_id] += len(terms)
+            counts = Counter(terms)
+            for term, tf in counts.items():
+                key = field + ':' + term
+                entry = postings.get(key)
+                if entry == None:
+                    entry = postings[key] = [0, 0, 0, bytearray(), None]
+                encode_varint(doc_id - entry[1], entry[3])
+                encode_varint(tf, entry[3])
+                entry[0] += 1
+                entry[1] = doc_id
+                if tf > entry[2]:
+                    entry[2] = tf
+                if entry[0] % SKIP_INTERVAL == 0:
+                    if entry[4] == None:   # Only long lists have skips
+                        entry[4] = array('I')
+                    entry[4].append(doc_id)
+                    entry[4].append(len(entry[3]))
+            self.num_postings += len(counts)
+        self.docs.append((json.dumps({'name': name, 'url': document['url'],
+                'title': document['title'], 'summary': document['summary']},
+                ensure_ascii=False) + '\n').encode('utf-8'))
+        if self.num_postings >= self.max_postings:
+            self.flush()
+
+    # Write the documents added since the last run as a new run.
+    def flush(self):
+        if len(self.docs) == 0:
+            return
+        run_path = '%s-%03d' % (self.path, len(self.run_paths))
+        write_index(run_path, sorted(self.postings.items()), self.docs,
+                self.norms, self.total_lengths)
+        self.run_paths.append(run_path)
+        self.reset()
+
+    # Return the paths of all runs written.
+    def close(self):
+        self.flush()
+        return self.run_paths
+
+
+# Read access to an index. All files are memory-mapped, so opening an index
+# costs next to nothing, whatever its size.
+class IndexReader:
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILENAME), mode='r',
+                encoding='utf-8') as infile:
+            self.meta = json.load(infile)
+        if self.meta['version'] != INDEX_VERSION or \
+                self.meta['byteorder'] != sys.byteorder:
+            raise ValueError('Incompatible index: \'%s\'' % (path))
+        self.fields = self.meta['fields']
+        self.num_fields = len(self.fields)
+        self.num_docs = self.meta['num_docs']
+        self.num_terms = self.meta['num_terms']
+        self.maps = [map_file(os.path.join(path, filename)) for filename in
+                [TERMS_FILENAME, TERMS_INDEX_FILENAME, POSTINGS_FILENAME,
+                    SKIPS_FILENAME, NORMS_FILENAME, DOCS_FILENAME,
+                    DOCS_INDEX_FILENAME]]
+        self.terms, self.terms_index, self.postings_data = self.maps[:3]
+        self.skips = memoryview(self.maps[3]).cast('B').cast('I')
+        self.norms = memoryview(self.maps[4]).cast('B').cast('I')
+        self.docs = self.maps[5]
+        self.doc_offsets = memoryview(self.maps[6]).cast('B').cast('Q')
+
+    # Return the TERM_RECORD of the i-th term as a tuple.
+    def record(self, i):
+        return TERM_RECORD.unpack_from(self.terms_index, i * TERM_RECORD.size)
+
+    # Return the i-th term (as '<field>:<term>' UTF-8 bytes).
+    def term(self, i):
+        record = self.record(i)
+        return self.terms[record[0]:record[0] + record[1]]
+
+    # Iterate over the (term, tag, term index) of all terms, in order.
+    def terms_of(self, tag):
+        for i in range(self.num_terms):
+            yield self.term(i), tag, i
+
+    # Return the index of the term key ('<field>:<term>') or -1.
+    def find(self, key):
+        key = key.encode('utf-8')
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            term = self.term(mid)
+            if term < key:
+                lo = mid + 1
+            elif term > key:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    # Return the encoded posting list of the i-th term.
+    def postings_bytes(self, i):
+        record = self.record(i)
+        return self.postings_data[record[3]:record[3] + record[4]]
+
+    # Return the skips of the i-th term as a flat sequence of (doc id,
+    # offset) pairs.
+    def skips_of(self, i):
+        record = self.record(i)
+        return self.skips[2 * record[7]:2 * (record[7] + record[8])]
+
+    # Iterate over the (doc id, term frequency) pairs of term key of field.
+    def postings(self, field, term):
+        i = self.find(field + ':' + term)
+        if i == -1:
+            return iter(())
+        return decode_postings(self.postings_bytes(i))
+
+    # Return the length (in terms) of field of document doc_id.
+    def norm(self, doc_id, field_id):
+        return self.norms[doc_id * self.num_fields + field_id]
+
+    def average_length(self, field_id):
+        return self.meta['total_lengths'][field_id] / max(self.num_docs, 1)
+
+    # Return the name, url, title and summary of document doc_id.
+    def document(self, doc_id):
+        return json.loads(self.docs[self.doc_offsets[doc_id]:
+                self.doc_offsets[doc_id + 1]])
+
+    def close(self):
+        self.skips.release()
+        self.norms.release()
+        self.doc_offsets.release()
+        for m in self.maps:
+            if isinstance(m, mmap.mmap):
+                m.close()
+
+
+# Merge the indexes stored in paths, in this order, into a single index
+# stored in out_path: document ids of each index are shifted by the number
+# of documents of the indexes before it. Posting lists are not decoded;
+# only the first doc id delta of every list is re-encoded and the skips of
+# every list are shifted accordingly.
+def merge_indexes(paths, out_path):
+    readers = [IndexReader(path) for path in paths]
+    bases = []
+    num_docs = 0
+    for reader in readers:
+        bases.append(num_docs)
+        num_docs += reader.num_docs
+    term_writer = TermWriter(out_path)
+    # (term, reader, term index) in term order; ties in reader order
+    merged_terms = heapq.merge(*[reader.terms_of(r)
+            for r, reader in enumerate(readers)])
+    for term, group in groupby(merged_terms, key=lambda t: t[0]):
+        data = bytearray()
+        skips = array('I')
+        df = max_tf = 0
+        last_doc = None
+        for term, r, i in group:
+            record = readers[r].record(i)
+            postings = readers[r].postings_bytes(i)
+            first_doc, pos = decode_varint(postings, 0)
+            first_doc += bases[r]
+            start = len(data)
+            encode_varint(first_doc - last_doc if last_doc != None
+                    else first_doc, data)
+            # Offsets within the list move by the re-encoded delta
+            shift = len(data) - start - pos
+            data += postings[pos:]
+            run_skips = readers[r].skips_of(i).tolist()
+            for k in range(0, len(run_skips), 2):
+                skips.append(run_skips[k] + bases[r])
+                skips.append(run_skips[k + 1] + start + shift)
+            df += record[2]
+            max_tf = max(max_tf, record[5])
+            last_doc = bases[r] + record[6]
+        term_writer.add(term, df, max_tf, last_doc, data, skips)
+    term_writer.close()
+    norms = array('I')
+    total_lengths = [0] * len(FIELDS)
+    for reader in readers:
+        norms.frombytes(reader.maps[4])
+        for field_id in range(len(FIELDS)):
+            total_lengths[field_id] += reader.meta['total_lengths'][field_id]
+    docs = (reader.docs[reader.doc_offsets[doc_id]:reader.doc_offsets[doc_id + 1]]
+            for reader in readers for doc_id in range(reader.num_docs))
+    write_documents(out_path, docs, norms, total_lengths,
+            term_writer.num_terms)
+    for reader in readers:
+        reader.close()
+
+
+# Merge the runs written to path by IndexWriters (directories named
+# 'part-*', in name order) into the index stored in path and remove them.
+# Return the number of runs merged.
+def merge_runs(path):
+    run_paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+            if name.startswith(RUN_PREFIX))
+    if len(run_paths) == 0:
+        # An empty index (i.e. nothing was preprocessed)
+        write_index(path, [], [], array('I'), [0] * len(FIELDS))
+    else:
+        merge_indexes(run_paths, path)
+    for run_path in run_paths:
+        shutil.rmtree(run_path)
+    return len(run_paths)
+
+
+# Remove the runs left in path, i.e. by an interrupted run.
+def remove_runs(path):
+    if not os.path.isdir(path):
+        return
+    for name in os.listdir(path):
+        if name.startswith(RUN_PREFIX):
+            shutil.rmtree(os.path.join(path, name))
+
+
+# Return the documents of the corpus stored in corpus_path, as
+# (name, document) pairs, out of the virtual XML files or the JSONL shards.
+def read_corpus(corpus_path, corpus_format):
+    if corpus_format == 'jsonl':
+        reader = ShardReader(corpus_path)
+        for name, document in reader:
+            yield name, document
+        reader.close()
+        return
+    for filename in sorted(os.listdir(corpus_path)):
+        if not filename.endswith('.xml'):
+            continue
+        with open(os.path.join(corpus_path, filename), mode='r',
+                encoding='utf-8') as infile:
+            yield filename[:-len('.xml')], read_virtual_xml(infile.read())
+
+
+def print_stats(path, build_time):
+    reader = IndexReader(path)
+    size = sum(os.path.getsize(os.path.join(path, filename))
+            for filename in os.listdir(path) if filename in INDEX_FILENAMES)
+    print('\n############################## STATS ##############################')
+    print('Indexed %d documents in %.3f minutes' % (reader.num_docs,
+            build_time / 60))
+    print('%d terms, %.2f MB of postings, %.2f MB in total' % (reader.num_terms,
+            len(reader.postings_data) / 2**20, size / 2**20))
+    print('Average field lengths: ' + ', '.join('%s %.1f' %
+            (field, reader.average_length(field_id))
+            for field_id, field in enumerate(reader.fields)))
+    print('###################################################################\n')
+    reader.close()
+
+
+# Build the index of the corpus from scratch, in a single process.
+def main():
+    t0 = time.time()
+    os.makedirs(index_path, exist_ok=True)
+    remove_runs(index_path)
+    writer = IndexWriter(os.path.join(index_path, RUN_PREFIX + '000'))
+    try:
+        for name, document in read_corpus(corpus_path, corpus_format):
+            writer.add(name, document)
+    except OSError as ose:
+        perror('Cannot read the corpus: %s' % (ose))
+        exit(ose.errno)
+    writer.close()
+    merge_runs(index_path)
+    print_stats(index_path, time.time() - t0)
+
+
+###############
+# Global data #
+###############
+corpus_path = './corpus/'  # Where the corpus (preprocessed text) is stored
+index_path = './index/'  # Where the index is stored
+corpus_format = 'xml'  # 'xml' (one file per article) or 'jsonl' (shards)
+INDEX_VERSION = 2
+FIELDS = ['title', 'headings', 'content', 'summary', 'infobox']
+# Offset and length of the term in terms.dat, document frequency, offset
+# and length of the posting list in postings.dat, max term frequency, last
+# doc id of the posting list, index of its first skip in skips.dat and
+# number of skips.
+TERM_RECORD = struct.Struct('<QIIQIIIQI')
+TERMS_FILENAME = 'terms.dat'
+TERMS_INDEX_FILENAME = 'terms.idx'
+POSTINGS_FILENAME = 'postings.dat'
+SKIPS_FILENAME = 'skips.dat'
+NORMS_FILENAME = 'norms.dat'
+DOCS_FILENAME = 'docs.dat'
+DOCS_INDEX_FILENAME = 'docs.idx'
+META_FILENAME = 'meta.json'
+INDEX_FILENAMES = [TERMS_FILENAME, TERMS_INDEX_FILENAME, POSTINGS_FILENAME,
+        SKIPS_FILENAME, NORMS_FILENAME, DOCS_FILENAME, DOCS_INDEX_FILENAME, META_FILENAME]
+RUN_PREFIX = 'part-'  # Runs are stored in path/part-*
+SKIP_INTERVAL = 64  # Postings between skips
+MAX_TERM_LENGTH = 64  # Longer terms (i.e. base64 strings) are not indexed
+NO_DESC_AVAIL = 'No description is available'  # As in preprocess.py
+token_regex = re.compile(r'\w+')
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    for arg in args:
+        if arg.startswith("--corpus="):
+            corpus_path = os.path.join(arg.split('=', 1)[1], '')
+        elif arg.startswith("--index="):
+            index_path = os.path.join(arg.split('=', 1)[1], '')
+        elif arg == "--format=xml":
+            corpus_format = 'xml'
+        elif arg == "--format=jsonl":
+            corpus_format = 'jsonl'
+        else:
+            perror("Uknown command-line argument: '" + arg + "'")
+            exit(1)
+    main()
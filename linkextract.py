@@ -0,0 +1,148 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Streaming extraction of the hyperlinks to articles found in the content
+# (<div id="mw-content-text">) of a Wikipedia article. Instead of building a
+# whole BeautifulSoup tree out of the decoded HTML text, the raw bytes of
+# the response are fed chunk by chunk to a small tokenizer that only knows
+# about comments, <div> tags (to find where the content starts and ends)
+# and <a> tags, so hyperlinks are available as soon as they are received.
+# The canonical URL of the article (<link rel="canonical"> of its <head>)
+# is picked up on the way, so that redirects (i.e. '/wiki/USA' for
+# '/wiki/United_States') can be told apart.
+
+
+import re
+import html
+
+
+# Tokens of interest. A token may only be split between chunks after its
+# first MAX_TOKEN_PREFIX bytes, so that many bytes are kept back at the end
+# of every chunk if they do not match.
+token_regex = re.compile(rb'<!--|<div[\s>]|</div\b|<a\s|<link\s', re.IGNORECASE)
+MAX_TOKEN_PREFIX = 5
+content_id_regex = re.compile(rb'\sid\s*=\s*["\']?mw-content-text["\'\s>]',
+        re.IGNORECASE)
+href_regex = re.compile(rb'\shref\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))',
+        re.IGNORECASE)
+link_regex = re.compile(rb'<link\s[^>]*>', re.IGNORECASE)
+canonical_rel_regex = re.compile(rb'\srel\s*=\s*["\']?canonical["\'\s/>]',
+        re.IGNORECASE)
+
+
+# Return True if href is a hyperlink to an article: '/wiki/<title>' where
+# title contains neither '#' (section of an article) nor ':' (special,
+# file, category etc. pages) nor any of excluded_substrings.
+def is_article_href(href, excluded_substrings=()):
+    if not href.startswith('/wiki/') or len(href.strip('/').split('/')) != 2:
+        return False
+    if '#' in href or ':' in href:
+        return False
+    for substring in excluded_substrings:
+        if substring in href:
+            return False
+    return True
+
+
+# Return the (unescaped) value of the href attribute of an <a> tag or None.
+def href_value(tag):
+    match = href_regex.search(tag)
+    if match == None:
+        return None
+    value = match.group(match.lastindex).decode('utf-8', errors='replace')
+    if '&' in value:
+        value = html.unescape(value)
+    return value
+
+
+# Return the URL of the <link rel="canonical"> tag found in data (i.e. the
+# raw bytes of the <head> of an article) or None.
+def canonical_link(data):
+    for match in link_regex.finditer(data):
+        tag = match.group()
+        if canonical_rel_regex.search(tag):
+            return href_value(tag)
+    return None
+
+
+# Incremental tokenizer of an article. feed() takes the next chunk of raw
+# bytes and returns the article hyperlinks it completes, in order. Once the
+# content <div> is closed, done is True and the rest of the article need
+# not be downloaded.
+class LinkExtractor:
+
+    def __init__(self, excluded_substrings=()):
+        self.excluded_substrings = excluded_substrings
+        self.buffer = b''
+        self.in_content = False   # True within <div id="mw-content-text">
+        self.found_content = False
+        self.depth = 0   # Number of open <div>s within the content
+        self.done = False
+        self.canonical_url = None   # URL of <link rel="canonical">, if found
+
+    def feed(self, chunk):
+        hrefs = []
+        if self.done:
+            return hrefs
+        buf = self.buffer + chunk
+        pos = 0
+        while True:
+            match = token_regex.search(buf, pos)
+            if match == None:
+                # Keep the bytes that may be the beginning of a token
+                pos = max(pos, len(buf) - MAX_TOKEN_PREFIX)
+                break
+            token = match.group()
+            if token == b'<!--':
+                end = buf.find(b'-->', match.end())
+                if end == -1:   # Incomplete comment
+                    pos = match.start()
+                    break
+                pos = end + 3
+                continue
+            end = buf.find(b'>', match.end() - 1)
+            if end == -1:   # Incomplete tag
+                pos = match.start()
+                break
+            pos = end + 1
+            if token[1:2] == b'/':   # </div>
+                if self.in_content:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        self.in_content = False
+                        self.done = True
+                        break
+            elif token[1:2] in b'dD':   # <div>
+                if self.in_content:
+                    self.depth += 1
+                elif content_id_regex.search(buf, match.start(), end + 1):
+                    self.in_content = self.found_content = True
+                    self.depth = 1
+            elif token[1:2] in b'lL':   # <link>
+                if not self.found_content and \
+                        canonical_rel_regex.search(buf, match.start(), end + 1):
+                    self.canonical_url = href_value(buf[match.start():end])
+            elif self.in_content:   # <a>
+                href = href_value(buf[match.start():end])
+                if href != None and is_article_href(href,
+                        self.excluded_substrings):
+                    hrefs.append(href)
+        self.buffer = buf[pos:] if not self.done else b''
+        return hrefs
@@ -0,0 +1,311 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Instrumentation of the crawler and the preprocessor: the time spent in
+# every stage of the processing of a document (i.e. fetch/decode/write or
+# read/parse/walk/cleanup/serialize/write), histograms of the latency and
+# the size of the documents and optional cProfile sampling of the hot
+# functions. Metrics are written at the end of a run either as JSON or in
+# the Prometheus text format (i.e. for the textfile collector of
+# node_exporter), while profiles are written as pstats files.
+#
+# Every stage is a separate block of code (and function call), so stacks
+# sampled by an external profiler (i.e. py-spy) map to the same stages.
+
+
+import os
+import time
+import json
+import threading
+import cProfile
+import pstats
+from bisect import bisect_left
+
+
+# Upper bounds of the buckets of the histograms
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+        30, 60]   # Seconds
+SIZE_BUCKETS = [2**k for k in range(12, 25)]   # 4 KB to 16 MB
+
+
+# Histogram with fixed buckets. counts[i] is the number of values v with
+# bounds[i-1] < v <= bounds[i]; the last bucket holds values above all
+# bounds (+Inf).
+class Histogram:
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        for i in range(len(self.counts)):
+            self.counts[i] += other.counts[i]
+        self.count += other.count
+        self.sum += other.sum
+
+    # Return the upper bound of the bucket holding the q-quantile (an
+    # upper bound of the quantile itself) or None if it is above all
+    # bounds or the histogram is empty.
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i in range(len(self.bounds)):
+            cumulative += self.counts[i]
+            if cumulative >= rank:
+                return self.bounds[i]
+        return None
+
+
+# Times a stage of a Metrics object; used as a context manager. The time
+# of a stage excludes the time of the stages nested in it (of the same
+# thread), so the times of all stages add up to the total time.
+class StageTimer:
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.nested_time = 0.0
+        stack = self.metrics.active_stages()
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        stack = self.metrics.active_stages()
+        stack.pop()
+        if len(stack) > 0:
+            stack[-1].nested_time += elapsed
+        self.metrics.add_time(self.stage, elapsed - self.nested_time)
+        return False
+
+
+# Metrics of a run. Safe to update from many threads; worker processes
+# keep their own Metrics and send them to the parent process (where they
+# are merged), so instances must remain picklable.
+class Metrics:
+
+    def __init__(self, name):
+        self.name = name   # Prefix of the Prometheus metrics
+        self.stage_times = {}   # {stage: seconds}
+        self.stage_calls = {}   # {stage: number of times the stage ran}
+        self.histograms = {}   # {name: Histogram}
+        self.values = {}   # {name: number}, i.e. totals of the run
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock'], state['local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    # Return the stack of the StageTimers running in the current thread.
+    def active_stages(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    # Return a context manager that times stage, i.e.
+    #     with metrics.stage('parse'):
+    #         ...
+    def stage(self, stage):
+        return StageTimer(self, stage)
+
+    def add_time(self, stage, seconds):
+        self.lock.acquire()
+        self.stage_times[stage] = self.stage_times.get(stage, 0.0) + seconds
+        self.stage_calls[stage] = self.stage_calls.get(stage, 0) + 1
+        self.lock.release()
+
+    # Add value to histogram name, which is created with bounds if needed.
+    def observe(self, name, value, bounds):
+        self.lock.acquire()
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(bounds)
+        self.histograms[name].observe(value)
+        self.lock.release()
+
+    def set_value(self, name, value):
+        self.lock.acquire()
+        self.values[name] = value
+        self.lock.release()
+
+    # Add the metrics of other (i.e. of a worker process) to these.
+    def merge(self, other):
+        self.lock.acquire()
+        for stage, seconds in other.stage_times.items():
+            self.stage_times[stage] = self.stage_times.get(stage, 0.0) + seconds
+            self.stage_calls[stage] = self.stage_calls.get(stage, 0) + \
+                    other.stage_calls[stage]
+        for name, histogram in other.histograms.items():
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(histogram.bounds)
+            self.histograms[name].merge(histogram)
+        self.lock.release()
+
+    # Print the share of every stage in the total time of all stages and
+    # the quantiles of the histograms in labels ({name: (label, unit)}).
+    def print_summary(self, labels={}):
+        total_time = sum(self.stage_times.values())
+        if total_time > 0:
+            print('Time per stage: ' + ', '.join('%s %.2f%% [%.2f sec]' %
+                    (stage, seconds / total_time * 100, seconds)
+                    for stage, seconds in self.stage_times.items()))
+        for name, (label, unit) in labels.items():
+            histogram = self.histograms.get(name)
+            if histogram == None or histogram.count == 0:
+                continue
+            quantiles = []
+            for q in [0.5, 0.9, 0.99]:
+                bound = histogram.quantile(q)
+                if bound != None:
+                    quantiles.append('p%d <= %g' % (q * 100, bound))
+                else:
+                    quantiles.append('p%d > %g' % (q * 100, histogram.bounds[-1]))
+            print('%s (%s): avg %.4g, %s' % (label, unit,
+                    histogram.sum / histogram.count, ', '.join(quantiles)))
+
+    def to_json(self):
+        return {
+            'name': self.name,
+            'stages': {stage: {'seconds': seconds,
+                    'calls': self.stage_calls[stage]}
+                    for stage, seconds in self.stage_times.items()},
+            'histograms': {name: {
+                    'buckets': [[bound, count] for bound, count in
+                        zip(h.bounds + ['+Inf'], h.counts)],
+                    'count': h.count,
+                    'sum': h.sum,
+                    'p50': h.quantile(0.5),
+                    'p90': h.quantile(0.9),
+                    'p99': h.quantile(0.99)}
+                    for name, h in self.histograms.items()},
+            'values': dict(self.values)
+        }
+
+    # Return the metrics in the Prometheus text exposition format.
+    def to_prometheus(self):
+        lines = []
+        metric = self.name + '_stage_seconds_total'
+        lines.append('# HELP %s Time spent in every stage.' % (metric))
+        lines.append('# TYPE %s counter' % (metric))
+        for stage, seconds in self.stage_times.items():
+            lines.append('%s{stage="%s"} %r' % (metric, stage, seconds))
+        metric = self.name + '_stage_calls_total'
+        lines.append('# HELP %s Number of times every stage ran.' % (metric))
+        lines.append('# TYPE %s counter' % (metric))
+        for stage, calls in self.stage_calls.items():
+            lines.append('%s{stage="%s"} %d' % (metric, stage, calls))
+        for name, h in self.histograms.items():
+            metric = self.name + '_' + name
+            lines.append('# TYPE %s histogram' % (metric))
+            cumulative = 0
+            for bound, count in zip(h.bounds + ['+Inf'], h.counts):
+                cumulative += count
+                lines.append('%s_bucket{le="%s"} %d' % (metric, bound, cumulative))
+            lines.append('%s_sum %r' % (metric, h.sum))
+            lines.append('%s_count %d' % (metric, h.count))
+        for name, value in self.values.items():
+            metric = self.name + '_' + name
+            lines.append('# TYPE %s gauge' % (metric))
+            lines.append('%s %r' % (metric, value))
+        return '\n'.join(lines) + '\n'
+
+    # Write the metrics to filename: in the Prometheus text format if its
+    # extension is .prom, as JSON otherwise.
+    def write(self, filename):
+        with open(filename, mode='w', encoding='utf-8') as outfile:
+            if filename.endswith('.prom'):
+                outfile.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), outfile, indent=2)
+                outfile.write('\n')
+
+
+# Return the prefix of the profile files, which are written next to the
+# metrics file (or named after default if metrics are not written).
+def profile_prefix(metrics_filename, default):
+    if metrics_filename == None:
+        return default
+    return os.path.splitext(metrics_filename)[0]
+
+
+# Runs every sample_every-th call of a function under cProfile (0: never)
+# and accumulates the profiles per function name. Only one call is
+# profiled at a time; calls made by other threads in the meantime are not
+# sampled.
+class SamplingProfiler:
+
+    def __init__(self, sample_every=0):
+        self.sample_every = sample_every
+        self.calls = {}   # {name: number of calls}
+        self.stats = {}   # {name: pstats.Stats}
+        self.profiling = False
+        self.lock = threading.Lock()
+
+    # Return function(*args), profiled if it is the turn of name.
+    def call(self, name, function, *args):
+        if self.sample_every == 0:
+            return function(*args)
+        self.lock.acquire()
+        self.calls[name] = self.calls.get(name, 0) + 1
+        sample = not self.profiling and self.calls[name] % self.sample_every == 0
+        if sample:
+            self.profiling = True
+        self.lock.release()
+        if not sample:
+            return function(*args)
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args)
+        finally:
+            self.lock.acquire()
+            if name in self.stats:
+                self.stats[name].add(profile)
+            else:
+                self.stats[name] = pstats.Stats(profile)
+            self.profiling = False
+            self.lock.release()
+
+    # Write the profile of every function to '<prefix>.<name>.prof'.
+    # Return the names of the files written.
+    def dump(self, prefix):
+        filenames = []
+        for name, stats in self.stats.items():
+            filename = '%s.%s.prof' % (prefix, name)
+            stats.dump_stats(filename)
+            filenames.append(filename)
+        return filenames
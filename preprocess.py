@@ -29,6 +29,17 @@ import traceback
 import datetime
 import pytz
 import json
+import re
+import gc
+import resource
+import difflib
+from scheduler import fill_work_queue, consume_work_queue, print_utilization
+from segments import SegmentReader
+from shards import ShardWriter, remove_shards
+from invindex import IndexWriter, merge_runs, remove_runs
+from progress import SharedProgress, ProgressReporter, IDLE, BUSY, DONE
+from metrics import Metrics, SamplingProfiler, profile_prefix, \
+        LATENCY_BUCKETS, SIZE_BUCKETS
 
 ########################
 # Function definitions #
@@ -50,6 +61,10 @@ def print_stats(preproc_time):
     print('Extracted text from %d HTML files in %.3f minutes' %
             (total_article_count - parse_fail_num, preproc_time / 60))
     print('Preprocessing was performed using %d processes' % (num_processes))
+    if unchanged_count != 0:
+        print('Skipped %d unchanged HTML files' % (unchanged_count))
+    if len(removed_files) != 0:
+        print('Removed %d corpus files of removed HTML files' % (len(removed_files)))
     if parse_fail_num != 0:
         print('Failed to parse %d HTML documents [%.2f%%]' %
                 (parse_fail_num, parse_fail_num / total_article_count * 100))
@@ -59,9 +74,36 @@ def print_stats(preproc_time):
     if total_article_count != 0:
         print('Succesfully extracted text from %d documents [%.2f%%]' %
                 (success_num, success_num / total_article_count * 100))
+    streamed = metrics.histograms.get('streamed_size_bytes')
+    if streamed != None:
+        print('Parsed %d documents in streaming mode' % (streamed.count))
+    if len(worker_peak_rss) != 0:
+        print('Peak RSS: %.1f MB per process [max], %.1f MB per process [avg], '
+                '%.1f MB main process' % (max(worker_peak_rss) / 2**20,
+                    sum(worker_peak_rss) / len(worker_peak_rss) / 2**20,
+                    peak_rss() / 2**20))
+    metrics.print_summary({
+            'document_latency_seconds': ('Document latency', 'sec'),
+            'document_size_bytes': ('Document size', 'bytes')})
     print('###################################################################\n')
 
 
+# Write the metrics of all processes to metrics_filename.
+def write_metrics(preproc_time):
+    metrics.set_value('preprocessing_seconds', preproc_time)
+    if len(worker_peak_rss) != 0:
+        metrics.set_value('process_peak_rss_bytes', max(worker_peak_rss))
+    metrics.set_value('articles_preprocessed', total_article_count)
+    metrics.set_value('parse_failures', len(parse_failures))
+    metrics.set_value('write_failures', len(write_failures))
+    try:
+        metrics.write(metrics_filename)
+        print('Metrics written to \'%s\'' % (metrics_filename))
+    except OSError as ose:
+        perror('Cannot write metrics \'%s\': %s' % (metrics_filename,
+                ose.strerror))
+
+
 def print_failures():
     if len(parse_failures) > 0:
         print('\nFailed to extract text from the following HTML files:')
@@ -81,20 +123,27 @@ def remove_file(filepath):
         exit(ose.errno)
 
 
+# Remove the text enclosed in (possibly nested) parentheses, together with
+# the parentheses. Unmatched closing parentheses are kept.
 def remove_matching_parentheses(string):
-    stack = []
-    new_str = ''
-    for c in string:
-        if c == '(':
-            stack.append(c)
-        if len(stack) == 0:
-            new_str += c
-        if c == ')':
-            if len(stack) == 0:
-                continue
-            stack.pop()
-    if len(stack) != 0:
+    depth = 0
+    parts = []
+    start = 0  # Where the text outside parentheses starts
+    for match in parenthesis_regex.finditer(string):
+        pos = match.start()
+        if match.group() == '(':
+            if depth == 0:
+                parts.append(string[start:pos])
+            depth += 1
+        elif depth > 0:
+            depth -= 1
+            if depth == 0:
+                start = pos + 1
+    if depth == 0:
+        parts.append(string[start:])
+    else:
         perror('Mismatching parentheses')
+    new_str = ''.join(parts)
     new_str = new_str.replace('  ', ' ')
     return new_str
 
@@ -145,51 +194,170 @@ def get_summary(section_text):
         return NO_DESC_AVAIL
 
 
-# Write plain text to a virtual XML file. The format is named virtual
+# Render plain text as a virtual XML document. The format is named virtual
 # because the output is not a valid XML but XML tags are only used as
 # field separators. Only one XML tag can exist per line, without any
 # other text.
+def render_virtual_xml(dictionary, canonical_url, date_modified,
+        date_published):
+    parts = virtual_xml_header(canonical_url, date_modified, date_published)
+    first_key = True
+    for key in dictionary:
+        parts += virtual_xml_section(key, dictionary[key], first_key)
+        first_key = False
+    parts.append('</document>\n')
+    return ''.join(parts)
+
+
+# Return the fragments of a virtual XML document before its sections.
+def virtual_xml_header(canonical_url, date_modified, date_published):
+    parts = ['<document>\n', '<url>\n', canonical_url, '\n</url>\n']
+    if date_published != "":
+        parts += ['<published>\n', date_published, '\n</published>\n']
+    if date_modified != "":
+        parts += ['<updated>\n', date_modified, '\n</updated>\n']
+    return parts
+
+
+# Return the fragments of a section of a virtual XML document. The heading
+# of the first section is the title of the document.
+def virtual_xml_section(key, string, first_key):
+    parts = []
+    if first_key == True:
+        parts += ['<title>\n', key, '\n</title>\n']
+    parts += ['<section>\n', '<heading>\n', key, '\n</heading>\n']
+    with metrics.stage('cleanup'):
+        clean_str = cleanup_section(string)
+        if key == '__summary__':
+            clean_str = get_summary(clean_str).strip()
+    parts += ['<content>\n', clean_str, '\n</content>\n', '</section>\n']
+    return parts
+
+
+# Write plain text to a virtual XML file (see render_virtual_xml()).
 def write_virtual_xml(dictionary, target_filename, canonical_url,
         date_modified, date_published):
     try:
         filepath = corpus_path + target_filename
+        with metrics.stage('write'):
+            outfile = open(filepath, mode='w', encoding='utf-8')
+            with metrics.stage('serialize'):
+                text = render_virtual_xml(dictionary, canonical_url,
+                        date_modified, date_published)
+            outfile.write(text)
+            outfile.close()
+    except:
+        perror('\tCannot write \'%s\'' % (filepath))
+        traceback.print_exc()
+        write_failures.append(target_filename)
+        remove_file(filepath)
+
+
+# Write the sections of an article, a (heading, content) pair at a time, to
+# a virtual XML file as they are extracted in streaming mode (see
+# stream_article()), so that the text of the article is never kept in
+# memory as a whole. An error while extracting a section is a parse failure
+# of hf, unless it is RepeatedHeading, which is raised again once the file
+# is closed (see stream_article()). Return True if the file was written
+# successfully.
+def write_virtual_xml_stream(hf, sections, canonical_url, date_modified,
+        date_published):
+    target_filename = hf[:-5] + corpus_doc_suffix_xml
+    filepath = corpus_path + target_filename
+    try:
         outfile = open(filepath, mode='w', encoding='utf-8')
-        outfile.write('<document>\n')
-        outfile.write('<url>\n')
-        outfile.write(canonical_url)
-        outfile.write('\n</url>\n')
-        if date_published != "":
-            outfile.write('<published>\n')
-            outfile.write(date_published)
-            outfile.write('\n</published>\n')
-        if date_modified != "":
-            outfile.write('<updated>\n')
-            outfile.write(date_modified)
-            outfile.write('\n</updated>\n')
-        first_key = True
-        for key in dictionary:
-            if first_key == True:
-                first_key = False
-                outfile.write('<title>\n')
-                outfile.write(key)
-                outfile.write('\n</title>\n')
-            outfile.write('<section>\n')
-            outfile.write('<heading>\n')
-            outfile.write(key)
-            outfile.write('\n</heading>\n')
-            outfile.write('<content>\n')
-            clean_str = cleanup_section(dictionary[key])
-            if key == '__summary__':
-                clean_str = get_summary(clean_str).strip()
-            outfile.write(clean_str)
-            outfile.write('\n</content>\n')
-            outfile.write('</section>\n')
+        outfile.write(''.join(virtual_xml_header(canonical_url, date_modified,
+                date_published)))
+    except:
+        perror('\tCannot write \'%s\'' % (filepath))
+        traceback.print_exc()
+        write_failures.append(target_filename)
+        remove_file(filepath)
+        return False
+    first_key = True
+    while True:
+        try:
+            key, string = next(sections)
+        except StopIteration:
+            break
+        except RepeatedHeading:
+            outfile.close()
+            raise
+        except:
+            perror('Cannot parse file: \'%s\'' % (hf))
+            traceback.print_exc()
+            parse_failures.append(hf)
+            outfile.close()
+            remove_file(filepath)
+            return False
+        try:
+            with metrics.stage('write'):
+                with metrics.stage('serialize'):
+                    text = ''.join(virtual_xml_section(key, string, first_key))
+                outfile.write(text)
+            first_key = False
+        except:
+            perror('\tCannot write \'%s\'' % (filepath))
+            traceback.print_exc()
+            write_failures.append(target_filename)
+            outfile.close()
+            remove_file(filepath)
+            return False
+    try:
         outfile.write('</document>\n')
+        outfile.close()
     except:
         perror('\tCannot write \'%s\'' % (filepath))
         traceback.print_exc()
         write_failures.append(target_filename)
         remove_file(filepath)
+        return False
+    return True
+
+
+# Return plain text as a JSON serializable document with the fields
+# url/published/updated/title/sections/summary/infobox. sections holds the
+# {heading, content} of all the other sections, in the order of the virtual
+# XML document.
+def render_json_document(dictionary, canonical_url, date_modified,
+        date_published):
+    document = {
+        'url': canonical_url,
+        'published': int(date_published) if date_published != "" else None,
+        'updated': int(date_modified) if date_modified != "" else None,
+        'title': next(iter(dictionary), ''),
+        'sections': [],
+        'summary': NO_DESC_AVAIL,
+        'infobox': ''
+    }
+    for key in dictionary:
+        with metrics.stage('cleanup'):
+            clean_str = cleanup_section(dictionary[key])
+            if key == '__summary__':
+                clean_str = get_summary(clean_str).strip()
+        if key == '__summary__':
+            document['summary'] = clean_str
+        elif key == '__infobox__':
+            document['infobox'] = clean_str
+        else:
+            document['sections'].append({'heading': key, 'content': clean_str})
+    return document
+
+
+# Append plain text as a document to the shards of the current process.
+def write_json_document(dictionary, name, canonical_url, date_modified,
+        date_published):
+    try:
+        # The JSON encoding of the document is part of the write stage
+        with metrics.stage('write'):
+            with metrics.stage('serialize'):
+                document = render_json_document(dictionary, canonical_url,
+                        date_modified, date_published)
+            shard_writer.append(name, document)
+    except:
+        perror('\tCannot write \'%s\' to the shards' % (name))
+        traceback.print_exc()
+        write_failures.append(name)
 
 
 def write_plain_text(dictionary, target_filename, canonical_url):
@@ -215,20 +383,15 @@ def write_plain_text(dictionary, target_filename, canonical_url):
         remove_file(filepath)
 
 
+# Normalize whitespace: tabs become spaces, runs of spaces become one space,
+# runs of spaces and newlines containing a newline become one newline and
+# spaces before commas and periods are removed.
 def cleanup_section(string):
     string = string.replace('\t', ' ')
-    while '  ' in string:
-        string = string.replace('  ', ' ')
-    while ' \n' in string:
-        string = string.replace(' \n', '\n')
-    while '\n ' in string:
-        string = string.replace('\n ', '\n')
-    while '\n\n' in string:
-        string = string.replace('\n\n', '\n')
-    while ' ,' in string:
-        string = string.replace(' ,', ',')
-    while ' .' in string:
-        string = string.replace(' .', '.')
+    string = spaces_regex.sub(' ', string)
+    string = newlines_regex.sub('\n', string)
+    string = string.replace(' ,', ',')
+    string = string.replace(' .', '.')
     return string.strip()
 
 
@@ -247,21 +410,14 @@ def get_img_alt_text(img):
     return ''
 
 
-# Parse sup element while ignoring those that contain hrefs.
-def parse_sup(c, level, in_infobox):
-    string = parse_childrenof(c, level, ignore_hrefs=True, in_infobox=in_infobox)
-    if string != '':
-        string  = '^' + string
-    return string
-
-
 # Add string to corrsponding misc[key] using join_str to concatenate.
+# misc values are lists of fragments, joined once by parse_article().
 def add_to_misc(key, string, join_str):
     global misc
     if key in misc:
-        misc[key] += join_str + string
+        misc[key] += (join_str, string)
     else:
-        misc[key] = string
+        misc[key] = [string]
 
 
 # Search attrs and return True if string exists.
@@ -277,144 +433,194 @@ def find_in(attrs, string, search_type='matches'):
     return False
 
 
-# Used to call parse_child() recursively.
-def parse_childrenof(c, level, ignore_hrefs=False, in_infobox=False):
-    string = ''
-    for inner_c in c.children:
-        string += parse_child(inner_c, level+1, ignore_hrefs, in_infobox)
-    return string
+# Compile rules (see PARSE_RULES) into lookup tables, so that only the rules
+# that can match an element are examined. Every compiled rule is a tuple
+# (rule index, tag, condition, action), so that sorting a list of rules puts
+# them in order of precedence.
+# Return (tag_rules, token_rules, substring_rules) where
+#     tag_rules = {tag: [rule]} for rules without an attribute,
+#     token_rules = {attribute: {token: [rule]}} for 'matches' rules and
+#     substring_rules = {attribute: [(match, string, rule)]} for
+#                       'contains' and 'startswith' rules.
+def compile_rules(rules):
+    tag_rules = {}
+    token_rules = {}
+    substring_rules = {}
+    for index, (tag, attribute, match, string, condition, action) in enumerate(rules):
+        rule = (index, tag, condition, action)
+        if attribute == None:
+            tag_rules.setdefault(tag, []).append(rule)
+        elif match == 'matches':
+            token_rules.setdefault(attribute, {}).setdefault(string, []).append(rule)
+        elif match in ['contains', 'startswith']:
+            substring_rules.setdefault(attribute, []).append((match, string, rule))
+        else:
+            raise ValueError('Unknown match type: \'%s\'' % (match))
+    return tag_rules, token_rules, substring_rules
 
 
-# Recursively parse current element/node. level corresponds to
-# the relative nesting level of the HTML tag, ignore_refs is
-# used to implement <sup> parsing and in_infobox is used to
-# parse HTML tags of infobox class.
-def parse_child(c, level, ignore_hrefs=False, in_infobox=False):
-    global curr_heading, read_summary, title
-    ########################################################
-    # Segment A - Handle Comments and NavigableStrings     #
-    ########################################################
-    if isinstance(c, Comment):  # Subclass of NavigableString so keep first
-        return ''
+# Return the rules of attribute that match the value of the attribute of an
+# element with the given tag name. Multi-valued attributes (i.e. class) are
+# lists of tokens. Substring matching is slow, so the results for attributes
+# with 'contains' or 'startswith' rules, whose values (i.e. class) are mostly
+# shared by many elements, are cached in matched_rules.
+def match_attribute(name, attribute, value):
+    if isinstance(value, str):
+        value = [value]
+    cached = attribute in substring_rules
+    if cached:
+        key = (name, attribute, *value)
+        if key in matched_rules:
+            return matched_rules[key]
+    matched = []
+    tokens = token_rules.get(attribute)
+    if tokens != None:
+        for token in tokens.keys() & value:
+            matched += tokens[token]
+    for match, string, rule in substring_rules.get(attribute, ()):
+        for token in value:
+            if (match == 'contains' and string in token) or \
+                    (match == 'startswith' and token.startswith(string)):
+                matched.append(rule)
+                break
+    matched = [rule for rule in matched if rule[1] == None or rule[1] == name]
+    if cached and len(matched_rules) < MAX_MATCHED_RULES:
+        matched_rules[key] = matched
+    return matched
+
+
+# Classify current element/node. level corresponds to the relative
+# nesting level of the HTML tag, ignore_hrefs is used to implement
+# <sup> parsing and in_infobox is used to parse HTML tags of infobox class.
+# The first rule of PARSE_RULES (in order of precedence) that matches the
+# element decides how it is parsed.
+# Return (None, text) if the text of the element/node is known without
+# parsing its children, else (action, (ignore_hrefs, in_infobox)), i.e.
+# what to do with the text of its children and the flags to parse them with.
+def classify_child(c, level, ignore_hrefs=False, in_infobox=False):
     if isinstance(c, NavigableString):
-        return c.string
-    ########################################################
-    # Segment B - Handle everything that is ignored        #
-    ########################################################
-    if c.name == 'style':
-        return ''
-    if c.name == 'script':  # Never true due to HTML subset
-        return ''
-    if c.name == 'caption':
-        return ''
-    if c.name == 'a' and ignore_hrefs == True:
-        return ''
-    if c.name == 'span':
-        if c.has_attr('id'):
-            ids = c.attrs['id']
-            if find_in(ids, 'coordinates'):
-                return ''
-    if c.has_attr('role'):
-        roles = c.attrs['role']
-        if 'note' in roles:
-            return ''
-        if 'presentation' in roles:
-            return ''
-        if 'navigation' in roles:
-            return ''
-    if c.has_attr('class'):
-        classes = c.attrs['class']
-        if find_in(classes, 'navbox', search_type='contains'):
-            return ''
-        if find_in(classes, 'noprint'):
-            return ''
-        if find_in(classes, 'haudio'):
-            return ''
-        if find_in(classes, 'mw-editsection'):
-            return ''
-        if find_in(classes, 'mw-cite-backlink'):
-            return '' # ^ in reflist
-        if c.name == 'div':
-            if find_in(classes, 'toc'):
-                return ''
-        '''
-        if c.name == 'a':
-            if find_in(classes, 'external') or find_in(classes, 'autonumber'):
-                return ''
-        '''
-    ########################################################
-    # Segment C - Handle elements containing useful text   #
-    ########################################################
-    if c.name == 'h2':
-        curr_heading = parse_childrenof(c, level, ignore_hrefs, in_infobox)
-        plain_text[curr_heading] = ''
+        if isinstance(c, Comment):  # Subclass of NavigableString
+            return None, ''
+        return None, c.string
+    name = c.name
+    rules = tag_rules.get(name, ())
+    attrs = c.attrs
+    for attribute in rule_attributes:
+        if attribute in attrs:
+            matched = match_attribute(name, attribute, attrs[attribute])
+            if len(matched) != 0:
+                rules = sorted([*rules, *matched])
+    for index, tag, condition, action in rules:
+        if condition == 'ignore_hrefs' and ignore_hrefs != True:
+            continue
+        if condition == 'in_infobox' and in_infobox != True:
+            continue
+        if condition == 'summary' and (level != 0 or read_summary != True):
+            continue
+        if action == 'skip':
+            return None, ''
+        if action == 'math':
+            img = c.find('img')
+            return None, get_img_alt_text(img)
+        if action == 'sup':  # sup elements are parsed while ignoring hrefs
+            return action, (True, in_infobox)
+        if action in ['th', 'infobox']:
+            return action, (ignore_hrefs, True)
+        return action, (ignore_hrefs, in_infobox)
+    return 'children', (ignore_hrefs, in_infobox)
+
+
+# Return the text of an element given the text of its children and update
+# the current section or the misc sections, according to action.
+def finish_element(action, string):
+    global curr_heading, read_summary
+    if action == 'children':
+        return string
+    if action == 'h2':
+        curr_heading = string
+        plain_text[curr_heading] = []
         if curr_heading != title:  # Summary is only taken from first section
             read_summary = False
         return ''
-    if c.name in ['h3','h4','h5','h6']:
-        string = parse_childrenof(c, level, ignore_hrefs, in_infobox)
-        plain_text[curr_heading] += string
+    if action == 'heading':
+        plain_text[curr_heading].append(string)
         return string
-    if c.name == 'p' and level == 0 and read_summary == True:
-        string = parse_childrenof(c, level, ignore_hrefs, in_infobox)
+    if action == 'summary':
         add_to_misc('__summary__', string, ' ')
         return string
-    if c.name == 'blockquote':
-        string = parse_childrenof(c, level, ignore_hrefs, in_infobox)
+    if action == 'blockquote':
         add_to_misc('__quotes__', string, '\n')
-        plain_text[curr_heading] += string
+        plain_text[curr_heading].append(string)
         return ''
-    if c.name == 'tr':  # Put one table row per line
-        string = parse_childrenof(c, level, ignore_hrefs, in_infobox)
-        string = string.replace('\n', ' ')
-        return string
-    if c.name == 'th' and in_infobox == True:
-        string = parse_childrenof(c, level, ignore_hrefs, in_infobox=True)
+    if action == 'tr':
+        return string.replace('\n', ' ')
+    if action == 'th':
         return ' ' + string + ' '  # Add the missing spaces
-    if c.has_attr('class'):
-        classes = c.attrs['class']
-        if c.name == 'div':
-            if find_in(classes, 'quotebox'):
-                string = parse_childrenof(c, level, ignore_hrefs, in_infobox)
-                add_to_misc('__quotes__', string, '\n')
-                return ''
-        if find_in(classes, 'thumbcaption'):
-            string = parse_childrenof(c, level, ignore_hrefs, in_infobox)
-            add_to_misc('__multimedia__', string, '\n')
-            return ''
-        if find_in(classes, 'gallerytext'):
-            string = parse_childrenof(c, level, ignore_hrefs, in_infobox)
-            add_to_misc('__multimedia__', string, '\n')
-            return ''
-        if find_in(classes, 'infobox'):
-            string = parse_childrenof(c, level, ignore_hrefs, in_infobox=True)
-            add_to_misc('__infobox__', string, '\n')
-            return ''
-        if find_in(classes, 'mwe-math-element'):  # Math formulas
-            img = c.find('img')
-            return get_img_alt_text(img)
-        if c.name == 'sup':  # Keep after check for noprint etc.
-            if find_in(classes, 'reference'):
-                return ''
-            elif find_in(classes, 'plainlinks'):
-                return ''
-            else:
-                return parse_sup(c, level, in_infobox)
-        if c.name == 'sub':
-            return '_' + parse_childrenof(c, level, ignore_hrefs, in_infobox)
-        if c.name == 'table':
-            if find_in(classes, 'clade'):  # Ignore cladograms!
-                return ''
-    else:  # Following elements have no classes
-        if c.name == 'sup':  # Keep after check for noprint etc.
-            return parse_sup(c, level, in_infobox)
-        if c.name == 'sub':
-            return '_' + parse_childrenof(c, level, ignore_hrefs, in_infobox)
-    return parse_childrenof(c, level, ignore_hrefs, in_infobox)
+    if action == 'quotes':
+        add_to_misc('__quotes__', string, '\n')
+        return ''
+    if action in ['multimedia', 'infobox']:
+        add_to_misc('__' + action + '__', string, '\n')
+        return ''
+    if action == 'sup':  # sup elements are parsed while ignoring hrefs
+        if string != '':
+            string = '^' + string
+        return string
+    if action == 'sub':
+        return '_' + string
+
+
+# Parse the subtree rooted at element c, whose children are classified as
+# (action, (ignore_hrefs, in_infobox)) by classify_child(), and return its
+# text. The subtree is traversed depth-first using an explicit stack instead
+# of recursion, so the nesting depth of the HTML is not limited by the
+# recursion limit. The text of every element is collected as a list of
+# fragments that is joined once all of its children have been parsed,
+# instead of concatenating the text of the children one by one.
+def walk(c, action, level, ignore_hrefs, in_infobox):
+    stack = []
+    children = iter(c.children)
+    fragments = []
+    while True:
+        for inner_c in children:
+            inner_action, result = classify_child(inner_c, level + 1,
+                    ignore_hrefs, in_infobox)
+            if inner_action is None:
+                fragments.append(result)
+                continue
+            # Descend into inner_c; its siblings are parsed when it is done.
+            stack.append((action, level, ignore_hrefs, in_infobox, children,
+                    fragments))
+            action = inner_action
+            level += 1
+            ignore_hrefs, in_infobox = result
+            children = iter(inner_c.children)
+            fragments = []
+            break
+        else:  # All children have been parsed
+            string = finish_element(action, ''.join(fragments))
+            if len(stack) == 0:
+                return string
+            action, level, ignore_hrefs, in_infobox, children, fragments = stack.pop()
+            fragments.append(string)
+
+
+# Parse the children of current element/node and return their text.
+def parse_childrenof(c, level, ignore_hrefs=False, in_infobox=False):
+    return walk(c, 'children', level, ignore_hrefs, in_infobox)
+
+
+# Parse current element/node and return its text.
+def parse_child(c, level, ignore_hrefs=False, in_infobox=False):
+    action, result = classify_child(c, level, ignore_hrefs, in_infobox)
+    if action is None:
+        return result
+    return walk(c, action, level, *result)
 
 
 def get_article_dates(soup):
-    string = soup.find_all("script")[-2].text
+    # .string, as .text ignores script contents with some tree builders
+    string = soup.find_all("script")[-2].string
     try:
         json_data = json.loads(string)
     except:
@@ -438,101 +644,663 @@ def to_epoch_utc(date_str):
     return str(timestamp)
 
 
-# Returns dictionary of the form {heading: content} and the canonical url
-def parse_article(html_filename):
+# Return the raw HTML text of an article, read either from its file or from
+# the corresponding record of the segment files.
+def open_article(html_filename):
+    if storage_backend == 'segments':
+        return segment_reader.read(html_filename)
+    with open(repo_path + html_filename, mode='r', encoding='utf-8') as infile:
+        return infile.read()
+
+
+# Return dictionary of the form {heading: content} holding the text of the
+# sections of an article parsed by BeautifulSoup.
+def extract_sections(soup):
     global plain_text, misc, curr_heading, read_summary, title
     plain_text = {}
     misc = {}
     read_summary = True
+    title = parse_childrenof(soup.body.find('h1', id='firstHeading'), level=0)
+    content = soup.find('div', id='mw-content-text').contents[0]
+    curr_heading = title
+    plain_text[curr_heading] = []
+    for c in content.children:
+        parse_top_level_child(c)
+    # Append misc sections like infobox/vcard etc. at the end.
+    return {heading: ''.join(fragments) for heading, fragments in
+            finish_sections().items()}
+
+
+# Parse a top-level element/node of the content of an article and add its
+# text to the current section.
+def parse_top_level_child(c):
+    # Sections are lists of fragments. Text appended to the current
+    # section while c is parsed (i.e. by a nested <blockquote>) is
+    # replaced by the text of c, as a string += would do.
+    key = curr_heading
+    section = plain_text[key]
+    mark = len(section)
+    string = parse_child(c, level = 0)
+    del section[mark:]
+    section.append(string)
+    plain_text[key] = section
+
+
+# Return the sections left in plain_text followed by the misc sections, as
+# lists of fragments.
+def finish_sections():
+    # Add __summary__ section in misc.
+    if '__summary__' not in misc:
+        add_to_misc('__summary__', NO_DESC_AVAIL, '')
+    return dict(plain_text, **misc)
+
+
+# Returns dictionary of the form {heading: content} and the canonical url.
+# parser selects the tree builder used by BeautifulSoup ('html5lib' or
+# 'lxml') and defaults to parser_backend. If html_text is given, it is
+# parsed instead of the stored HTML file.
+def parse_article(html_filename, parser=None, html_text=None):
+    global article_size
+    if parser == None:
+        parser = parser_backend
+    article_size = 0
     try:
-        infile = open(repo_path + html_filename, mode='r', encoding='utf-8')
-        soup = BeautifulSoup(infile, 'html5lib')
-        date_modified, date_published = get_article_dates(soup)
-        canonical_url = soup.head.find('link', rel='canonical').get('href')
-        title = parse_childrenof(soup.body.find('h1', id='firstHeading'), level=0)
-        content = soup.find('div', id='mw-content-text').contents[0]
-        curr_heading = title
-        plain_text[curr_heading] = ''
-        for c in content.children:
-            plain_text[curr_heading] += parse_child(c, level = 0)
-        # Add __summary__ section in misc.
-        if '__summary__' not in misc:
-            add_to_misc('__summary__', NO_DESC_AVAIL, '')
-        # Append misc sections like infobox/vcard etc. at the end.
-        plain_text = dict(plain_text, **misc)
+        if html_text == None:
+            with metrics.stage('read'):
+                html_text = open_article(html_filename)
+        article_size = len(html_text.encode('utf-8'))
+        with metrics.stage('parse'):
+            soup = BeautifulSoup(html_text, parser)
+        with metrics.stage('walk'):
+            date_modified, date_published = get_article_dates(soup)
+            canonical_url = soup.head.find('link', rel='canonical').get('href')
+            plain_text = extract_sections(soup)
         return (plain_text, canonical_url, date_modified, date_published)
     except:
         perror('Cannot parse file: \'%s\'' % (html_filename))
         traceback.print_exc()
         parse_failures.append(html_filename)
-        return ({}, None)
+        return ({}, None, "", "")
 
 
-def preprocess_files(html_files, pid, queue):
-    article_count = 0
-    for hf in html_files:
-        article_count += 1
-        print('Process %2d: file: %4d - %s' % (pid, article_count, hf))
-        dictionary, url, date_modified, date_published = parse_article(hf)
-        if dictionary != {} and url != None:
-            #print_plain_text(dictionary)
-            #write_plain_text(dictionary, hf[:-5] + corpus_doc_suffix, url)
+# Streaming mode of parse_article(), for articles whose DOM would take too
+# much memory: the page is parsed without its content (for the title, the
+# canonical url and the dates), while the content is parsed a chunk (see
+# split_content()) at a time and the tree of every chunk is freed as soon
+# as it has been walked. Return (sections, canonical_url, date_modified,
+# date_published), where sections is a generator of the (heading, content)
+# pairs of parse_article(), in the same order, that yields every section
+# as soon as the <h2> that ends it has been passed. If an <h2> repeats the
+# heading of a section that was already yielded, parse_article() would
+# replace the content of that section, so sections raises RepeatedHeading:
+# the article has to be parsed again with buffered set, in which case all
+# sections are yielded once the whole content has been parsed (trees are
+# still parsed and freed a chunk at a time). Return None if the content of
+# the article cannot be delimited, in which case the whole page has to be
+# parsed by parse_article().
+def stream_article(html_text, parser, buffered=False):
+    content = split_content(html_text)
+    if content == None:
+        return None
+    content_tag, content_end, chunks = content
+    with metrics.stage('parse'):
+        soup = BeautifulSoup(html_text[:content_tag.end()] +
+                html_text[content_end:], parser)
+    with metrics.stage('walk'):
+        date_modified, date_published = get_article_dates(soup)
+        canonical_url = soup.head.find('link', rel='canonical').get('href')
+        article_title = parse_childrenof(soup.body.find('h1', id='firstHeading'),
+                level=0)
+    soup.decompose()
+    sections = stream_sections(html_text, parser, article_title,
+            content_tag.group(0), chunks, buffered)
+    return (sections, canonical_url, date_modified, date_published)
+
+
+# Raised by the sections of stream_article() when a heading is found again
+# after its section was yielded.
+class RepeatedHeading(Exception):
+    pass
+
+
+# Return the (start tag match, end, chunks) of the content of an article,
+# i.e. of the first element of <div id="mw-content-text">, or None if it
+# cannot be found. html_text[start tag match.end():end] holds the children
+# of the element, split into chunks, i.e. (start, end) pairs, of whole
+# top-level elements, of about stream_chunk_size characters (unless a
+# single element is larger). Tags are only matched, not parsed, to keep
+# track of the open elements, closing them like a parser would: by their
+# end tag (along with any element left open in them) or by a start tag
+# that implies their end (see close_implied_elements()), i.e. <p>, <li>,
+# <dd>, <dt>, <tr>, <td> or <th> elements without an end tag.
+def split_content(html_text):
+    match = content_text_regex.search(html_text)
+    if match == None:
+        return None
+    tags = html_tag_regex.finditer(html_text, match.end())
+    content_tag = next(tags, None)
+    if content_tag == None or content_tag.group(3) == None or \
+            content_tag.group(2) == '/':
+        return None
+    content_name = content_tag.group(3).lower()
+    chunk_start = content_tag.end()
+    chunks = []
+    open_elements = []  # Open elements within the content, innermost last
+    for tag in tags:
+        name = tag.group(3)
+        if name != None:
+            name = name.lower()
+            if tag.group(2) == '':
+                close_implied_elements(open_elements, name)
+        if len(open_elements) == 0 and \
+                tag.start() - chunk_start >= stream_chunk_size:
+            chunks.append((chunk_start, tag.start()))
+            chunk_start = tag.start()
+        if name == None or name in VOID_ELEMENTS or \
+                tag.group(4).endswith('/'):
+            continue
+        if tag.group(2) == '':
+            open_elements.append(name)
+        elif name in open_elements:
+            close_element(open_elements, [name], [])
+        elif name == content_name:  # End tag of the content
+            if tag.start() > chunk_start:
+                chunks.append((chunk_start, tag.start()))
+            return content_tag, tag.start(), chunks
+        # Else an end tag without a start tag, which is ignored
+    return None
+
+
+# Close the innermost element of open_elements named one of names, along
+# with the elements opened within it, unless an element named one of
+# stop_names is found first (the element is out of scope).
+def close_element(open_elements, names, stop_names):
+    for i in range(len(open_elements) - 1, -1, -1):
+        if open_elements[i] in names:
+            del open_elements[i:]
+            return
+        if open_elements[i] in stop_names:
+            return
+
+
+# Close the elements of open_elements whose end is implied by a start tag
+# of element name, as the HTML parsing algorithm does, i.e. an open <p> is
+# closed by a block element, an open <li> by another <li> of the same list
+# and an open cell by another cell of the same table.
+def close_implied_elements(open_elements, name):
+    if name in LIST_ITEMS:
+        close_element(open_elements, LIST_ITEMS[name], SPECIAL_ELEMENTS -
+                {'address', 'div', 'p'})
+    if name in CLOSES_PARAGRAPH:
+        close_element(open_elements, ['p'], BUTTON_SCOPE)
+    if name in HEADINGS:
+        if len(open_elements) > 0 and open_elements[-1] in HEADINGS:
+            open_elements.pop()
+    elif name in TABLE_PARTS:
+        close_element(open_elements, TABLE_PARTS[name], TABLE_SCOPE)
+    elif name in ['option', 'optgroup']:
+        if len(open_elements) > 0 and open_elements[-1] == 'option':
+            open_elements.pop()
+        if name == 'optgroup' and len(open_elements) > 0 and \
+                open_elements[-1] == 'optgroup':
+            open_elements.pop()
+
+
+# Yield the sections of an article (see stream_article()), parsing its
+# content a chunk at a time. Every chunk is parsed within the start tag of
+# the content (content_tag), so that its elements are parsed exactly as in
+# the whole page.
+def stream_sections(html_text, parser, article_title, content_tag, chunks,
+        buffered):
+    global plain_text, misc, curr_heading, read_summary, title
+    plain_text = {}
+    misc = {}
+    read_summary = True
+    title = article_title
+    curr_heading = title
+    plain_text[curr_heading] = []
+    yielded = set()  # Headings of the sections yielded so far
+    for start, end in chunks:
+        with metrics.stage('parse'):
+            soup = BeautifulSoup(content_tag + html_text[start:end], parser)
+        for c in soup.body.contents[0].children:
+            with metrics.stage('walk'):
+                parse_top_level_child(c)
+            if len(plain_text) > 1 and not buffered:  # An <h2> was passed
+                if not yielded.isdisjoint(plain_text):
+                    raise RepeatedHeading(curr_heading)
+                for heading in [h for h in plain_text if h != curr_heading]:
+                    yielded.add(heading)
+                    yield heading, ''.join(plain_text.pop(heading))
+        # Trees are full of reference cycles (i.e. parent/child links), so
+        # they are only freed by the garbage collector, often long after
+        # they are no longer used
+        soup.decompose()
+        gc.collect()
+    sections = finish_sections()
+    if not yielded.isdisjoint(sections):  # i.e. a heading named __summary__
+        raise RepeatedHeading(list(yielded.intersection(sections))[0])
+    for heading, fragments in sections.items():
+        yield heading, ''.join(fragments)
+
+
+# Parse an HTML file and write the extracted text to the corpus.
+# Return True if the file was preprocessed successfully.
+def preprocess_file(hf, html_text=None):
+    global article_count
+    article_count += 1
+    if verbose == True:
+        print('Process %2d: file: %4d - %s' % (worker_id, article_count, hf))
+    progress.set_state(worker_id, BUSY)
+    t0 = time.perf_counter()
+    success = write_article_text(hf, html_text)
+    metrics.observe('document_latency_seconds', time.perf_counter() - t0,
+            LATENCY_BUCKETS)
+    metrics.observe('document_size_bytes', article_size, SIZE_BUCKETS)
+    progress.item_done(worker_id, success, article_size)
+    progress.set_state(worker_id, IDLE)
+    if article_count % report_batch_size == 0:
+        report_filenames()
+    return success
+
+
+# Parse an HTML file (or html_text, if given) and write the extracted text
+# to the corpus. Articles whose DOM would not fit in the memory budget of
+# the process (or all articles, if stream_articles is set) are parsed in
+# streaming mode. Return True if the text was written successfully.
+def write_article_text(hf, html_text):
+    if stream_articles or memory_budget != None:
+        if html_text == None:
+            html_text = read_article(hf)
+            if html_text == None:
+                return False
+        if stream_articles or len(html_text) * DOM_SIZE_FACTOR > memory_budget:
+            written = profiler.call('stream_article', write_article_stream, hf,
+                    html_text)
+            if written != None:
+                return written
+            # The content cannot be delimited, so the page is parsed whole
+    dictionary, url, date_modified, date_published = profiler.call(
+            'parse_article', parse_article, hf, None, html_text)
+    if dictionary != {} and url != None:
+        #print_plain_text(dictionary)
+        #write_plain_text(dictionary, hf[:-5] + corpus_doc_suffix, url)
+        num_write_failures = len(write_failures)
+        if output_format == 'jsonl':
+            write_json_document(dictionary, hf[:-5], url, date_modified,
+                    date_published)
+        else:
             write_virtual_xml(dictionary, hf[:-5] + corpus_doc_suffix_xml, url,
                     date_modified, date_published)
+        if len(write_failures) == num_write_failures:
+            written_files.append(hf)
+            if index_writer != None:
+                index_document(hf[:-5], dictionary, url, date_modified,
+                        date_published)
+            return True
+    return False
+
+
+# Return the HTML text of an article or None if it cannot be read.
+def read_article(html_filename):
+    global article_size
+    article_size = 0
+    try:
+        with metrics.stage('read'):
+            return open_article(html_filename)
+    except:
+        perror('Cannot read file: \'%s\'' % (html_filename))
+        traceback.print_exc()
+        parse_failures.append(html_filename)
+        return None
+
+
+# Parse html_text in streaming mode (see stream_article()) and write the
+# extracted text to the corpus. XML documents are written a section at a
+# time, while JSONL documents (and the index) need the whole text of the
+# article, which is still much smaller than its DOM. If a heading is found
+# again after its section was written, the article is parsed and written
+# again, keeping all sections until the end. Return True if the text was
+# written successfully or None if the content of the article cannot be
+# delimited (nothing was written).
+def write_article_stream(hf, html_text):
+    global article_size
+    article_size = len(html_text.encode('utf-8'))
+    metrics.observe('streamed_size_bytes', article_size, SIZE_BUCKETS)
+    buffered = output_format == 'jsonl' or index_writer != None
+    try:
+        return write_streamed_sections(hf, html_text, buffered)
+    except RepeatedHeading:
+        return write_streamed_sections(hf, html_text, True)
+
+
+# Body of write_article_stream(). If buffered is set, all sections are
+# kept until the whole content has been parsed.
+def write_streamed_sections(hf, html_text, buffered):
+    try:
+        streamed = stream_article(html_text, parser_backend, buffered)
+        if streamed == None:
+            return None
+        sections, url, date_modified, date_published = streamed
+        dictionary = None
+        if output_format == 'jsonl' or index_writer != None:
+            dictionary = dict(sections)
+            sections = iter(dictionary.items())
+    except:
+        perror('Cannot parse file: \'%s\'' % (hf))
+        traceback.print_exc()
+        parse_failures.append(hf)
+        return False
+    if output_format == 'jsonl':
+        num_write_failures = len(write_failures)
+        write_json_document(dictionary, hf[:-5], url, date_modified,
+                date_published)
+        if len(write_failures) != num_write_failures:
+            return False
+    elif not write_virtual_xml_stream(hf, sections, url, date_modified,
+            date_published):
+        return False
+    written_files.append(hf)
+    if index_writer != None:
+        index_document(hf[:-5], dictionary, url, date_modified, date_published)
+    return True
+
+
+# Add an article, while its text is still in memory, to the index of the
+# current process.
+def index_document(name, dictionary, url, date_modified, date_published):
+    with metrics.stage('index'):
+        index_writer.add(name, render_json_document(dictionary, url,
+                date_modified, date_published))
+
+
+# Preprocess an (HTML filename, HTML text) pair handed over by the crawler.
+def preprocess_article(article):
+    hf, html_text = article
+    return preprocess_file(hf, html_text)
 
-    # Send to main thread the number of files processed and the
-    # filenames of the HTML files that couldn't be parsed or written.
-    queue.put((article_count, parse_failures, write_failures))
+
+# Send to the main process, in one message, the filenames of the HTML files
+# that couldn't be parsed or written and of the HTML files whose text was
+# written to the corpus since the last report.
+def report_filenames():
+    if len(parse_failures) + len(write_failures) + len(written_files) == 0:
+        return
+    result_queue.put(('filenames', parse_failures[:], write_failures[:],
+            written_files[:]))
+    del parse_failures[:], write_failures[:], written_files[:]
+
+
+# Return the settings of the preprocessing processes (see WORKER_SETTINGS).
+def worker_settings():
+    return {name: globals()[name] for name in WORKER_SETTINGS}
+
+
+# Preprocess the HTML files pulled from the shared work queue. Progress is
+# published through shared_progress, while filenames are reported in
+# batches of report_batch_size files through queue. settings (see
+# worker_settings()) replace the global data of this process, which is not
+# inherited unless the process was forked.
+def preprocess_files(work_queue, pid, queue, shared_progress, settings,
+        process_item=preprocess_file):
+    global worker_id, shard_writer, progress, result_queue, profiler, \
+            index_writer
+    globals().update(settings)
+    worker_id = pid
+    progress = shared_progress
+    result_queue = queue
+    profiler = SamplingProfiler(profile_every)
+    if output_format == 'jsonl':
+        shard_writer = ShardWriter(corpus_path, pid, docs_per_shard)
+    if build_index:
+        index_writer = IndexWriter(index_path + 'part-%03d' % (pid))
+    stats = consume_work_queue(work_queue, process_item, pid)
+    if shard_writer != None:
+        shard_writer.close()
+    if index_writer != None:
+        with metrics.stage('index'):
+            index_writer.close()
+
+    profiler.dump('%s.%d' % (profile_prefix(metrics_filename, 'preprocess'),
+            pid))
+
+    # Send to main process the remaining filenames and the statistics and
+    # metrics of this worker.
+    report_filenames()
+    progress.set_state(worker_id, DONE)
+    queue.put(('stats', stats, metrics, peak_rss()))
     # print('Process %3d is exiting...' % (pid))
 
 
-def calculate_chunk(html_files, pid, num_processes):
-    num_files = len(html_files)
-    chunksize = num_files // num_processes
-    remainder = num_files % num_processes
-
-    if remainder != 0:  # hrefs cannot be divided in equal chunks
-        if chunksize == 0:  # num_files < num_processes
-            chunksize = 1
-            lb = pid
-            if pid >= num_files:  # No work to be assigned
-                return (-1, -1)
-        else:  # num_files > num_processes
-            # First remainder processes get one more href than the remaining
-            if pid < remainder:
-                chunksize += 1
-                lb = pid * chunksize
-            else:
-                lb = remainder * (chunksize + 1) + (pid - remainder) * chunksize
-    else:  # Chunksize is the same for all processes
-        lb = pid * chunksize
-    return (lb, lb + chunksize)
+# Return the peak RSS of the current process in bytes.
+def peak_rss():
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':   # Bytes instead of kilobytes
+        return maxrss
+    return maxrss * 1024
+
+
+# Return the memory available for new processes in bytes or None if it is
+# not known.
+def available_memory():
+    try:
+        with open('/proc/meminfo', mode='r') as infile:
+            for line in infile:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
 
+# Use only as many processes as fit in the available memory, given the
+# memory budget of every process (articles that would not fit in it are
+# streamed, see write_article_text()).
+def throttle_processes():
+    global num_processes
+    if memory_budget == None:
+        return
+    available = available_memory()
+    if available == None:
+        return
+    max_processes = max(available // memory_budget, 1)
+    if max_processes < num_processes:
+        print('Using %d instead of %d processes: %d MB available, %d MB per process' %
+                (max_processes, num_processes, available // 2**20,
+                    memory_budget // 2**20))
+        num_processes = max_processes
 
+
+# HTML files are assigned to processes dynamically, preprocess_batch_size
+# files at a time.
 def multiprocess_preprocessing(html_files):
-    global total_article_count, parse_failures, write_failures
     process_list = []
     # Create processes
+    work_queue = multiprocessing.Queue()
     queue = multiprocessing.Queue()
-    for i in range(num_processes):
-        lb, ub = calculate_chunk(html_files, i, num_processes)
-        if lb == -1 and ub == -1: # No work to be assigned
-            continue
-        arg_list = (html_files[lb:ub], i, queue)
+    fill_work_queue(work_queue, html_files, preprocess_batch_size, num_processes)
+    num_workers = min(num_processes, len(html_files))
+    shared_progress = SharedProgress(num_workers)
+    for i in range(num_workers):
+        arg_list = (work_queue, i, queue, shared_progress, worker_settings())
         process = multiprocessing.Process(target=preprocess_files, args=arg_list)
         process_list.append(process)
         process.start()
-    # Join processes
+    reporter = ProgressReporter(shared_progress, len(html_files),
+            progress_interval, item_name='docs', worker_name='Process')
+    reporter.start()
+    join_preprocessing(process_list, queue)
+    reporter.stop()
+
+
+# Collect the results of the preprocessing processes and join them.
+def join_preprocessing(process_list, queue):
+    global total_article_count, parse_failures, write_failures, written_files
+    # Every process sends batches of filenames and, when it is done, its
+    # statistics.
+    num_done = 0
+    while num_done < len(process_list):
+        message = queue.get()
+        if message[0] == 'filenames':
+            parse_failures += message[1]
+            write_failures += message[2]
+            written_files += message[3]
+        else:
+            # Get the number of files processed by each process
+            stats = message[1]
+            total_article_count += stats.items
+            preprocess_stats.append(stats)
+            metrics.merge(message[2])
+            worker_peak_rss.append(message[3])
+            num_done += 1
     for process in process_list:
-        # Get the number of files processed by each thread
-        article_count, local_parse_failures, local_write_failures = queue.get()
-        total_article_count += article_count
-        parse_failures += local_parse_failures
-        write_failures += local_write_failures
         process.join()
 
 
+# Pipelined preprocessing: articles are preprocessed while the crawler is
+# still downloading, so the two stages overlap instead of running one after
+# the other. The crawler hands over the HTML text of every stored article
+# (no need to read it back from the repository) through a bounded queue, so
+# downloads are throttled (backpressure) whenever preprocessing falls behind
+# and at most queue_size articles are kept in memory.
+class PreprocessingPipeline:
+
+    def __init__(self, queue_size):
+        self.work_queue = multiprocessing.Queue(maxsize=queue_size)
+        self.queue = multiprocessing.Queue()
+        self.process_list = []
+        self.start_time = time.time()
+        os.makedirs(corpus_path, exist_ok=True)
+        throttle_processes()
+        shared_progress = SharedProgress(num_processes)
+        for i in range(num_processes):
+            arg_list = (self.work_queue, i, self.queue, shared_progress,
+                    worker_settings(), preprocess_article)
+            process = multiprocessing.Process(target=preprocess_files,
+                    args=arg_list)
+            self.process_list.append(process)
+            process.start()
+        # The number of articles is not known in advance (no ETA)
+        self.reporter = ProgressReporter(shared_progress, None,
+                progress_interval, item_name='docs', worker_name='Process')
+        self.reporter.start()
+
+    # Hand over the HTML text of an article; blocks while the queue is full.
+    def submit(self, html_filename, html_text):
+        self.work_queue.put([(html_filename, html_text)])
+
+    # Wait for all submitted articles to be preprocessed, then bring the
+    # manifest up to date: corpus files of articles removed in the meantime
+    # (i.e. by remove_redundant_files()) are removed as well.
+    def finish(self):
+        global segment_reader
+        for process in self.process_list:
+            self.work_queue.put(None)
+        join_preprocessing(self.process_list, self.queue)
+        self.reporter.stop()
+        if output_format == 'xml':
+            if storage_backend == 'segments':
+                segment_reader = SegmentReader(segments_path)
+            manifest = read_manifest()
+            changed_files, fingerprints = find_changed_files(list_html_files(),
+                    manifest)
+            update_manifest(manifest, fingerprints)
+        preproc_time = time.time() - self.start_time
+        print_failures()
+        print_utilization(preprocess_stats, preproc_time, worker_name='Process')
+        print_stats(preproc_time)
+        if metrics_filename != None:
+            write_metrics(preproc_time)
+
+
+# Return a string that changes whenever the raw HTML of an article changes:
+# its size and modification time or, for segment files, the size and fetch
+# time of its record (a rewritten article is always appended as a new
+# record, while compaction moves records but keeps their fetch times).
+def source_fingerprint(html_filename):
+    if storage_backend == 'segments':
+        segment, offset, length, fetch_time, codec = \
+                segment_reader.entries[html_filename]
+        return '%d:%.3f' % (length, fetch_time)
+    stat = os.stat(repo_path + html_filename)
+    return '%d:%d' % (stat.st_size, stat.st_mtime_ns)
+
+
+# Read the manifest of the corpus, i.e. what every corpus file was
+# extracted from. Return a dictionary of the form
+#     {html_filename: (fingerprint, parser version, corpus filename)}
+def read_manifest():
+    manifest = {}
+    try:
+        infile = open(manifest_path, mode='r', encoding='utf-8')
+    except FileNotFoundError:
+        return manifest
+    for line in infile:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) == 4:
+            manifest[fields[0]] = tuple(fields[1:])
+    infile.close()
+    return manifest
+
+
+# Atomically replace the manifest of the corpus.
+def write_manifest(manifest):
+    try:
+        outfile = open(manifest_path + '.tmp', mode='w', encoding='utf-8')
+        for html_filename, entry in manifest.items():
+            outfile.write('%s\t%s\t%s\t%s\n' % (html_filename, *entry))
+        outfile.close()
+        os.replace(manifest_path + '.tmp', manifest_path)
+    except:
+        perror('Cannot write manifest \'%s\'' % (manifest_path))
+        traceback.print_exc()
+
+
+# Compare the HTML files with the manifest and remove the corpus files of
+# articles that no longer exist (i.e. removed by remove_redundant_files()).
+# Return the HTML files that are new or changed since they were last
+# preprocessed (or preprocessed by another parser version), together with
+# the fingerprints of all HTML files.
+def find_changed_files(html_files, manifest):
+    version = '%d/%s' % (PARSER_VERSION, parser_backend)
+    corpus_files = set(os.listdir(corpus_path))
+    fingerprints = {}
+    changed_files = []
+    for hf in html_files:
+        fingerprints[hf] = (source_fingerprint(hf), version)
+        entry = manifest.get(hf)
+        if entry == None or entry[:2] != fingerprints[hf] or \
+                entry[2] not in corpus_files:
+            changed_files.append(hf)
+    for hf in set(manifest) - set(fingerprints):
+        corpus_filename = manifest.pop(hf)[2]
+        if corpus_filename in corpus_files:
+            remove_file(corpus_path + corpus_filename)
+        removed_files.append(corpus_filename)
+    return changed_files, fingerprints
+
+
+# Record the HTML files whose text was written to the corpus in the manifest
+# and forget those that couldn't be parsed, so that they are retried on the
+# next run. fingerprints holds the fingerprints of the existing HTML files.
+def update_manifest(manifest, fingerprints):
+    for hf in parse_failures:
+        manifest.pop(hf, None)
+    for hf in written_files:
+        corpus_filename = hf[:-5] + corpus_doc_suffix_xml
+        if hf in fingerprints:
+            manifest[hf] = (*fingerprints[hf], corpus_filename)
+        elif corpus_filename not in removed_files:  # Removed after it was preprocessed
+            remove_file(corpus_path + corpus_filename)
+            removed_files.append(corpus_filename)
+    write_manifest(manifest)
+
+
+# Records of the segment files are returned in storage order, so that
+# every batch of the work queue is read sequentially.
 def list_html_files():
+    if storage_backend == 'segments':
+        return segment_reader.names()
     try:
         files = os.listdir(repo_path)
         html_files = [f for f in files if f.endswith('.html')]
@@ -543,14 +1311,96 @@ def list_html_files():
         exit(1)
 
 
+# Golden-output comparison: parse (up to sample_size) HTML files with every
+# parser backend and check that all of them produce the same virtual XML
+# as html5lib, which is the reference backend.
+# Return True if the outputs of all backends are identical.
+def compare_parsers(html_files, sample_size):
+    if sample_size > 0:
+        html_files = html_files[:sample_size]
+    parse_times = {parser: 0.0 for parser in PARSER_BACKENDS}
+    mismatches = []
+    for hf in html_files:
+        outputs = {}
+        for parser in PARSER_BACKENDS:
+            t0 = time.time()
+            dictionary, url, date_modified, date_published = \
+                    parse_article(hf, parser)
+            parse_times[parser] += time.time() - t0
+            if dictionary != {} and url != None:
+                outputs[parser] = render_virtual_xml(dictionary, url,
+                        date_modified, date_published)
+            else:
+                outputs[parser] = None
+        for parser in PARSER_BACKENDS[1:]:
+            if outputs[parser] != outputs[PARSER_BACKENDS[0]]:
+                mismatches.append((hf, parser))
+                perror('Output mismatch: \'%s\' [%s vs %s]' %
+                        (hf, PARSER_BACKENDS[0], parser))
+                if outputs[parser] != None and outputs[PARSER_BACKENDS[0]] != None:
+                    diff = difflib.unified_diff(
+                            outputs[PARSER_BACKENDS[0]].splitlines(),
+                            outputs[parser].splitlines(), PARSER_BACKENDS[0],
+                            parser, n=1, lineterm='')
+                    for line in list(diff)[:20]:
+                        perror('\t' + line)
+    print('\n############################## PARSERS ##############################')
+    for parser in PARSER_BACKENDS:
+        print('%-8s: parsed %d HTML files in %.3f sec [%.2f docs/sec]' %
+                (parser, len(html_files), parse_times[parser],
+                    len(html_files) / max(parse_times[parser], 1e-9)))
+    print('%d/%d HTML files produced identical output with all parsers' %
+            (len(html_files) - len(set(hf for hf, parser in mismatches)),
+                len(html_files)))
+    print('###################################################################\n')
+    return len(mismatches) == 0
+
+
+# Merge the partial indexes written by the preprocessing processes.
+def merge_partial_indexes():
+    t0 = time.time()
+    num_runs = merge_runs(index_path)
+    merge_time = time.time() - t0
+    metrics.set_value('index_merge_seconds', merge_time)
+    print('Merged %d partial indexes into \'%s\' in %.2f sec' %
+            (num_runs, index_path, merge_time))
+
+
 def main():
+    global segment_reader, unchanged_count
+    if storage_backend == 'segments':
+        segment_reader = SegmentReader(segments_path)
     html_files = list_html_files()
+    if compare_sample_size != None:
+        identical = compare_parsers(html_files, compare_sample_size)
+        exit(0 if identical else 1)
     t0 = time.time()
+    os.makedirs(corpus_path, exist_ok=True)
+    if output_format == 'jsonl':
+        remove_shards(corpus_path)  # Shards are rewritten from scratch
+    else:
+        manifest = read_manifest()
+        changed_files, fingerprints = find_changed_files(html_files, manifest)
+        # The index is rebuilt from all articles
+        if incremental_preprocessing and not build_index:
+            unchanged_count = len(html_files) - len(changed_files)
+            html_files = changed_files
+    if build_index:
+        os.makedirs(index_path, exist_ok=True)
+        remove_runs(index_path)  # Left by an interrupted run
+    throttle_processes()
     multiprocess_preprocessing(html_files)
+    if output_format == 'xml':
+        update_manifest(manifest, fingerprints)
+    if build_index:
+        merge_partial_indexes()
     t1 = time.time()
     preproc_time = t1 - t0
     print_failures()
+    print_utilization(preprocess_stats, preproc_time, worker_name='Process')
     print_stats(preproc_time)
+    if metrics_filename != None:
+        write_metrics(preproc_time)
 
 
 ###############
@@ -558,19 +1408,194 @@ def main():
 ###############
 repo_path = './repository/'  # Where downloaded HTML files are stored
 corpus_path = './corpus/'  # Where corpus (parsed) text files will be stored
+storage_backend = 'files'  # 'files' (one file per article) or 'segments'
+segments_path = repo_path + 'segments/'  # Where segment files are stored
+segment_reader = None
+PARSER_BACKENDS = ['html5lib', 'lxml']  # html5lib is the reference backend
+parser_backend = 'html5lib'  # Tree builder used by BeautifulSoup
+compare_sample_size = None  # Number of files used to compare parsers (0: all)
 corpus_doc_suffix = '.txt'
 corpus_doc_suffix_xml = '.xml'
+output_format = 'xml'  # 'xml' (one file per article) or 'jsonl' (shards)
+docs_per_shard = 1000  # Number of documents per JSONL shard
+shard_writer = None  # ShardWriter of the current process
+build_index = False  # Build an inverted index of the corpus (see invindex.py)
+index_path = './index/'  # Where the index is stored
+index_writer = None  # IndexWriter of the current process
 parse_failures = []  # filenames of HTML files that text wasn't extracted
 write_failures = []  # filenames of TXT files that couldn't be stored to disk
+written_files = []  # filenames of HTML files whose text was stored to disk
+removed_files = []  # filenames of corpus files whose HTML file was removed
+unchanged_count = 0  # Number of HTML files that didn't need preprocessing
+incremental_preprocessing = True  # Only preprocess new or changed HTML files
+manifest_path = corpus_path + 'manifest.tsv'  # What corpus files were extracted from
+PARSER_VERSION = 2  # Increase whenever the extracted text changes
 field_separator = '\n\n'
 num_processors = os.cpu_count()
 num_processes = num_processors # Number of processes used during preprocessing
 total_article_count = 0  # How many articles where preprocessed by all processes
+preprocess_batch_size = 8  # Number of files a process pulls from the work queue at once
+preprocess_stats = []  # WorkerStats of the preprocessing processes
+worker_peak_rss = []  # Peak RSS (bytes) of the preprocessing processes
+memory_budget = None  # Memory (bytes) per process; limits num_processes (None: no limit)
+DOM_SIZE_FACTOR = 30  # Memory taken by the DOM of an article per character of HTML
+stream_articles = False  # Stream all articles, not only those above memory_budget
+stream_chunk_size = 2**18  # Characters of the content parsed at once in streaming mode
+worker_id = 0  # Id of the current preprocessing process
+article_count = 0  # How many articles where preprocessed by the current process
+article_size = 0  # Size of the HTML text of the last parsed article in bytes
+progress = None  # SharedProgress of the preprocessing processes
+result_queue = None  # Where the current process reports filenames
+report_batch_size = 256  # Filenames are reported every report_batch_size articles
+progress_interval = 2  # Seconds between progress reports
+verbose = False  # Print a line for every preprocessed file
+metrics = Metrics('preprocess')  # Time per stage, latency and size of the documents
+metrics_filename = None  # Where metrics are written (.prom: Prometheus, else JSON)
+profile_every = 0  # Profile every profile_every-th parse_article() with cProfile (0: never)
+profiler = SamplingProfiler()  # Profiler of the current process
+# Global data set by the command line (or the crawler) that the
+# preprocessing processes need
+WORKER_SETTINGS = ['repo_path', 'corpus_path', 'storage_backend',
+        'segments_path', 'segment_reader', 'parser_backend', 'output_format',
+        'docs_per_shard', 'build_index', 'index_path', 'memory_budget',
+        'stream_articles', 'stream_chunk_size', 'report_batch_size',
+        'verbose', 'metrics_filename', 'profile_every']
 MAX_SUMMARY_LENGTH_CHARS = 170
 MIN_SUMMARY_SENTENCE_LENGTH_CHARS = 25
 NO_DESC_AVAIL = 'No description is available'
+spaces_regex = re.compile(' {2,}')
+newlines_regex = re.compile('[ \n]*\n[ \n]*')
+parenthesis_regex = re.compile('[()]')
+# Comments, raw text elements (skipped as a whole) and start/end tags:
+#     (raw text tag), (end tag slash), (tag), (attributes)
+html_tag_regex = re.compile(r'<!--.*?-->|'
+        r'<(script|style)\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*>.*?</\1\s*>|'
+        r'<(/?)([a-zA-Z][^\s/>]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>',
+        re.DOTALL | re.IGNORECASE)
+content_text_regex = re.compile(r'<div\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*'
+        r'\bid="mw-content-text"(?:[^>"\']|"[^"]*"|\'[^\']*\')*>')
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+        'link', 'meta', 'param', 'source', 'track', 'wbr'}
+# Elements of the HTML parsing algorithm that implied end tags depend on:
+# headings, elements whose start tag closes an open <p>, list items (along
+# with the list items each of them closes), table parts (along with the
+# table parts each of them closes), the 'special' category and the
+# elements that delimit the scope of an open <p> and of table parts.
+HEADINGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+CLOSES_PARAGRAPH = HEADINGS | {'address', 'article', 'aside', 'blockquote',
+        'center', 'details', 'dialog', 'dir', 'div', 'dl', 'fieldset',
+        'figcaption', 'figure', 'footer', 'form', 'header', 'hgroup', 'hr',
+        'li', 'dd', 'dt', 'listing', 'main', 'menu', 'nav', 'ol', 'p',
+        'plaintext', 'pre', 'search', 'section', 'summary', 'table', 'ul',
+        'xmp'}
+LIST_ITEMS = {'li': ['li'], 'dd': ['dd', 'dt'], 'dt': ['dd', 'dt']}
+TABLE_PARTS = {'td': ['td', 'th'], 'th': ['td', 'th'],
+        'tr': ['tr', 'td', 'th'], 'tbody': ['tbody', 'thead', 'tfoot'],
+        'thead': ['tbody', 'thead', 'tfoot'], 'tfoot': ['tbody', 'thead', 'tfoot']}
+SPECIAL_ELEMENTS = CLOSES_PARAGRAPH | VOID_ELEMENTS | {'applet', 'basefont',
+        'bgsound', 'body', 'button', 'caption', 'colgroup', 'frame',
+        'frameset', 'head', 'html', 'iframe', 'keygen', 'marquee', 'noembed',
+        'noframes', 'noscript', 'object', 'script', 'select', 'style',
+        'tbody', 'td', 'template', 'textarea', 'tfoot', 'th', 'thead',
+        'title', 'tr'}
+TABLE_SCOPE = {'html', 'table', 'template'}
+BUTTON_SCOPE = TABLE_SCOPE | {'applet', 'button', 'caption', 'marquee',
+        'object', 'td', 'th'}
+# Rules deciding how every HTML element is parsed, in order of precedence:
+#     (tag, attribute, match, string, condition, action)
+# A rule matches an element if its tag is None or the tag of the element and
+# either its attribute is None or the value (one of the tokens, for class) of
+# the element's attribute matches string, i.e. equals string ('matches'),
+# contains string ('contains') or starts with string ('startswith'). condition, if not None, must also hold:
+#     'ignore_hrefs': the element is part of a <sup> element
+#     'in_infobox': the element is part of an infobox
+#     'summary': the element is a top-level element of the first section
+# action is one of the actions of finish_element() or 'skip' (ignore the
+# element) or 'math' (use the alt text of the image of a math formula).
+# Elements matching no rule are replaced by the text of their children.
+PARSE_RULES = [
+    # Everything that is ignored
+    ('style', None, None, None, None, 'skip'),
+    ('script', None, None, None, None, 'skip'),  # Never true due to HTML subset
+    ('caption', None, None, None, None, 'skip'),
+    ('a', None, None, None, 'ignore_hrefs', 'skip'),
+    ('span', 'id', 'matches', 'coordinates', None, 'skip'),
+    (None, 'role', 'contains', 'note', None, 'skip'),
+    (None, 'role', 'contains', 'presentation', None, 'skip'),
+    (None, 'role', 'contains', 'navigation', None, 'skip'),
+    (None, 'class', 'contains', 'navbox', None, 'skip'),
+    (None, 'class', 'matches', 'noprint', None, 'skip'),
+    (None, 'class', 'matches', 'haudio', None, 'skip'),
+    (None, 'class', 'matches', 'mw-editsection', None, 'skip'),
+    (None, 'class', 'matches', 'mw-cite-backlink', None, 'skip'),  # ^ in reflist
+    ('div', 'class', 'matches', 'toc', None, 'skip'),
+    # Elements containing useful text
+    ('h2', None, None, None, None, 'h2'),
+    ('h3', None, None, None, None, 'heading'),
+    ('h4', None, None, None, None, 'heading'),
+    ('h5', None, None, None, None, 'heading'),
+    ('h6', None, None, None, None, 'heading'),
+    ('p', None, None, None, 'summary', 'summary'),
+    ('blockquote', None, None, None, None, 'blockquote'),
+    ('tr', None, None, None, None, 'tr'),  # Put one table row per line
+    ('th', None, None, None, 'in_infobox', 'th'),
+    ('div', 'class', 'matches', 'quotebox', None, 'quotes'),
+    (None, 'class', 'matches', 'thumbcaption', None, 'multimedia'),
+    (None, 'class', 'matches', 'gallerytext', None, 'multimedia'),
+    (None, 'class', 'matches', 'infobox', None, 'infobox'),
+    (None, 'class', 'matches', 'mwe-math-element', None, 'math'),  # Math formulas
+    ('sup', 'class', 'matches', 'reference', None, 'skip'),
+    ('sup', 'class', 'matches', 'plainlinks', None, 'skip'),
+    ('sup', None, None, None, None, 'sup'),  # Keep after check for noprint etc.
+    ('sub', None, None, None, None, 'sub'),
+    ('table', 'class', 'matches', 'clade', None, 'skip'),  # Ignore cladograms!
+]
+tag_rules, token_rules, substring_rules = compile_rules(PARSE_RULES)
+rule_attributes = list(token_rules.keys() | substring_rules.keys())
+matched_rules = {}  # {(tag, attribute, *value): [rule]}
+MAX_MATCHED_RULES = 100000  # Bounds the size of matched_rules
 
 
 if __name__ == '__main__':
+    args = sys.argv[1:]
+    for arg in args:
+        if arg == "--storage=files":
+            storage_backend = 'files'
+        elif arg == "--storage=segments":
+            storage_backend = 'segments'
+        elif arg == "--verbose":
+            verbose = True
+        elif arg.startswith("--progress-interval="):
+            progress_interval = float(arg.split('=', 1)[1])
+        elif arg == "--full":
+            incremental_preprocessing = False
+        elif arg == "--output=xml":
+            output_format = 'xml'
+        elif arg == "--output=jsonl":
+            output_format = 'jsonl'
+        elif arg == "--index":
+            build_index = True
+        elif arg.startswith("--index="):
+            build_index = True
+            index_path = os.path.join(arg.split('=', 1)[1], '')
+        elif arg.startswith("--shard-size="):
+            docs_per_shard = int(arg.split('=', 1)[1])
+        elif arg == "--stream":
+            stream_articles = True
+        elif arg.startswith("--memory-budget="):
+            memory_budget = int(arg.split('=', 1)[1]) * 2**20
+        elif arg.startswith("--parser=") and arg[9:] in PARSER_BACKENDS:
+            parser_backend = arg[9:]
+        elif arg.startswith("--metrics="):
+            metrics_filename = arg.split('=', 1)[1]
+        elif arg.startswith("--cprofile="):
+            profile_every = int(arg.split('=', 1)[1])
+        elif arg == "--compare-parsers":
+            compare_sample_size = 0
+        elif arg.startswith("--compare-parsers="):
+            compare_sample_size = int(arg.split('=', 1)[1])
+        else:
+            perror("Uknown command-line argument: '" + arg + "'")
+            exit(1)
     main()
 
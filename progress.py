@@ -0,0 +1,130 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Live progress of worker processes. Every worker updates its own counters
+# in shared memory (no locks, no messages), while a thread of the parent
+# process periodically reads all of them and prints one progress line
+# with the throughput, the ETA and the state of every worker.
+
+
+import sys
+import time
+import threading
+import multiprocessing
+
+
+# Worker states
+IDLE = 0   # Waiting for work
+BUSY = 1   # Processing an item
+DONE = 2   # Exited
+STATE_CHARS = 'IBD'
+
+# Counters of every worker
+ITEMS = 0   # Number of items processed
+SUCCESSES = 1   # Number of items processed successfully
+BYTES = 2   # Size of the processed items in bytes
+STATE = 3
+NUM_COUNTERS = 4
+
+
+# Per-worker counters in shared memory. A counter is only ever written by
+# the worker it belongs to, so plain (unsynchronized) memory is enough;
+# readers may only see values that are slightly out of date.
+class SharedProgress:
+
+    def __init__(self, num_workers):
+        self.num_workers = num_workers
+        self.counters = multiprocessing.RawArray('q', num_workers * NUM_COUNTERS)
+
+    def set_state(self, wid, state):
+        self.counters[wid * NUM_COUNTERS + STATE] = state
+
+    # Account for an item of size bytes processed by worker wid.
+    def item_done(self, wid, success, size):
+        base = wid * NUM_COUNTERS
+        self.counters[base + ITEMS] += 1
+        if success:
+            self.counters[base + SUCCESSES] += 1
+        self.counters[base + BYTES] += size
+
+    # Return the sum of counter over all workers.
+    def total(self, counter):
+        return sum(self.counters[counter::NUM_COUNTERS])
+
+    # Return the state of every worker as a string, i.e. 'BBID'.
+    def states(self):
+        return ''.join(STATE_CHARS[state]
+                for state in self.counters[STATE::NUM_COUNTERS])
+
+
+# Print the progress of the workers every interval seconds, from a
+# (daemon) thread of the parent process. If the total number of items is
+# not known in advance, total_items is None and no ETA is printed.
+class ProgressReporter:
+
+    def __init__(self, progress, total_items=None, interval=2.0,
+            item_name='items', worker_name='Worker', stream=sys.stdout):
+        self.progress = progress
+        self.item_name = item_name
+        self.total_items = total_items
+        self.interval = interval
+        self.worker_name = worker_name
+        self.stream = stream
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.start_time = time.time()
+
+    def start(self):
+        self.start_time = time.time()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.report()
+
+    def report(self):
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        items = self.progress.total(ITEMS)
+        items_rate = items / elapsed
+        line = 'Progress: %d' % (items)
+        if self.total_items != None:
+            line += '/%d %s [%.2f%%]' % (self.total_items, self.item_name,
+                    items / max(self.total_items, 1) * 100)
+        else:
+            line += ' ' + self.item_name
+        line += ' | %.1f %s/sec | %.2f MB/sec' % (items_rate, self.item_name,
+                self.progress.total(BYTES) / elapsed / 2**20)
+        if self.total_items != None and items_rate > 0:
+            eta = (self.total_items - items) / items_rate
+            line += ' | ETA %d:%02d:%02d' % (eta // 3600, eta % 3600 // 60,
+                    eta % 60)
+        states = self.progress.states()
+        line += ' | %s states: %s (%d busy)' % (self.worker_name, states,
+                states.count('B'))
+        print(line, file=self.stream)
+        self.stream.flush()
+
+    # Stop reporting; a last progress line is printed.
+    def stop(self):
+        self.stop_event.set()
+        if self.thread != None:
+            self.thread.join()
+        self.report()
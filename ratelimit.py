@@ -0,0 +1,244 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Rate limiting and adaptive concurrency for downloads, shared by both
+# download engines of the crawler:
+#  - A token bucket per host limits the request rate and pauses all
+#    requests to a host when it asks us to back off (Retry-After).
+#  - Failed attempts are retried after an exponential backoff with jitter,
+#    unless the server says how long to wait.
+#  - An AIMD (additive increase, multiplicative decrease) controller sets
+#    the number of requests in flight: it grows while responses are
+#    successful and is halved when requests are throttled, fail or time out.
+
+
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+
+
+THROTTLE_STATUS = (429, 503)   # Status codes of throttled requests
+
+
+# Return True if a response with status code shows that the server is
+# overloaded or throttling us.
+def is_congested(status):
+    return status in THROTTLE_STATUS or status >= 500
+
+
+# Return the delay (seconds) before retrying after attempt failed attempts
+# (0-based), i.e. a random delay in [0, min(cap, base * 2^attempt)] ("full
+# jitter"), so that workers that failed together do not retry together.
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+# Return the delay (seconds) requested by the Retry-After header of a
+# response, given either as seconds or as an HTTP date, or None if there is
+# no (valid) header.
+def retry_after(headers):
+    if headers == None:
+        return None
+    value = headers.get('Retry-After')
+    if value == None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+# Return the delay (seconds) before retrying after attempt failed attempts.
+# The delay requested by the server (if any) is respected, up to cap.
+def retry_delay(attempt, headers=None, base=1.0, cap=60.0):
+    delay = retry_after(headers)
+    if delay != None:
+        return min(delay, cap)
+    return backoff_delay(attempt, base, cap)
+
+
+# Token bucket holding up to burst tokens, refilled at rate tokens/sec. A
+# request takes one token; when the bucket is empty it waits until the
+# token it reserved has been refilled. If rate is None, the request rate is
+# not limited and the bucket is only used to pause requests.
+class TokenBucket:
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.burst = burst if burst != None else max(rate or 1, 1)
+        self.tokens = self.burst
+        self.last = time.monotonic()   # When tokens were last refilled
+        self.lock = threading.Lock()
+
+    # Reserve a token. Return how long (seconds) the caller has to wait
+    # before sending its request.
+    def reserve(self):
+        self.lock.acquire()
+        now = time.monotonic()
+        if now > self.last:   # Not paused
+            if self.rate != None:
+                self.tokens = min(self.burst,
+                        self.tokens + (now - self.last) * self.rate)
+            self.last = now
+        wait = self.last - now
+        if self.rate != None:
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait += -self.tokens / self.rate
+        self.lock.release()
+        return wait
+
+    # Do not hand out tokens for the next delay seconds. The bucket is
+    # emptied, so requests resume at the configured rate after the pause.
+    def pause(self, delay):
+        self.lock.acquire()
+        now = time.monotonic()
+        if now + delay > self.last:
+            self.last = now + delay
+            self.tokens = min(self.tokens, 0)
+        self.lock.release()
+
+
+# One token bucket per host, created on first use.
+class RateLimiter:
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, url):
+        host = urlsplit(url).netloc
+        self.lock.acquire()
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.burst)
+        bucket = self.buckets[host]
+        self.lock.release()
+        return bucket
+
+    # Return how long (seconds) to wait before requesting url.
+    def wait_time(self, url):
+        return self.bucket(url).reserve()
+
+    # Pause all requests to the host of url for delay seconds.
+    def pause(self, url, delay):
+        self.bucket(url).pause(delay)
+
+
+# AIMD controller of the number of requests in flight. Every request takes
+# a slot (acquire() or try_acquire()) and gives it back along with its
+# outcome (release()). The limit starts at initial and:
+#  - grows by 1 per successful response until the first congestion signal
+#    (slow start) and by increase per limit successful responses after,
+#  - is multiplied by decrease on congestion, i.e. a throttled, failed or
+#    timed out request.
+# Latency is not a congestion signal: the response time of an article
+# depends on its size as much as on the load of the server, so a large
+# article after a few small ones would be taken for congestion.
+# Requests already in flight when the limit is decreased were sent at the
+# old limit, so their failures do not decrease it again. Slots are tickets
+# (sequence numbers) to tell them apart. The controller is thread-safe and
+# never blocks in try_acquire(), so it is used by the asyncio engine too.
+class AIMDController:
+
+    def __init__(self, initial, min_limit=1, max_limit=64, increase=1.0,
+            decrease=0.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_start = True
+        self.inflight = 0
+        self.tickets = 0   # Number of slots handed out
+        self.last_decrease = 0   # Last ticket handed out before the last decrease
+        self.congestion_events = 0   # Throttled or failed requests
+        self.decreases = 0
+        self.lowest_limit = self.highest_limit = int(self.limit)
+        self.cond = threading.Condition()
+
+    def take_slot(self):
+        self.inflight += 1
+        self.tickets += 1
+        return self.tickets
+
+    # Take a slot, waiting for one to be freed if the limit is reached.
+    # Return the ticket of the slot.
+    def acquire(self):
+        self.cond.acquire()
+        while self.inflight >= int(self.limit):
+            self.cond.wait()
+        ticket = self.take_slot()
+        self.cond.release()
+        return ticket
+
+    # Return the ticket of a free slot or None if the limit is reached.
+    def try_acquire(self):
+        self.cond.acquire()
+        ticket = None
+        if self.inflight < int(self.limit):
+            ticket = self.take_slot()
+        self.cond.release()
+        return ticket
+
+    # Give back slot ticket. congested is True if the request was
+    # throttled, failed or timed out.
+    def release(self, ticket, congested=False):
+        self.cond.acquire()
+        self.inflight -= 1
+        if congested:
+            self.congestion_events += 1
+            self.decrease_limit(ticket)
+        else:
+            self.increase_limit()
+        self.cond.notify_all()
+        self.cond.release()
+
+    def increase_limit(self):
+        if self.slow_start:
+            self.limit += 1
+        else:
+            self.limit += self.increase / self.limit
+        self.limit = min(self.limit, self.max_limit)
+        self.highest_limit = max(self.highest_limit, int(self.limit))
+
+    def decrease_limit(self, ticket):
+        if ticket <= self.last_decrease:   # Sent before the last decrease
+            return
+        limit = max(self.limit * self.decrease, self.min_limit)
+        if int(limit) < int(self.limit):
+            self.decreases += 1
+        self.limit = limit
+        self.last_decrease = self.tickets
+        self.slow_start = False
+        self.lowest_limit = min(self.lowest_limit, int(self.limit))
+
+    # Return a one-line summary of the controller.
+    def summary(self):
+        return ('Concurrency limit: %d (lowest %d, highest %d), %d decreases, '
+                '%d throttled or failed requests' % (int(self.limit),
+                self.lowest_limit, self.highest_limit, self.decreases,
+                self.congestion_events))
@@ -0,0 +1,91 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Dynamic work distribution shared by the crawlers (threads) and the
+# preprocessor (processes). Work is split in batches that are put in a
+# shared queue (queue.Queue or multiprocessing.Queue) and every worker pulls
+# the next batch as soon as it is done with the previous one. A worker that
+# is slowed down by retries or huge articles therefore processes fewer
+# batches instead of holding up the whole run.
+
+
+import time
+
+
+# Per-worker bookkeeping used to report utilization. Instances are sent
+# back to the parent process, so they must remain picklable.
+class WorkerStats:
+
+    def __init__(self, wid):
+        self.wid = wid
+        self.items = 0   # Number of items processed
+        self.successes = 0   # Number of items processed successfully
+        self.batches = 0   # Number of batches pulled from the work queue
+        self.busy_time = 0.0   # Time spent processing items (seconds)
+        self.start_time = time.time()
+        self.end_time = self.start_time
+
+
+# Split items in batches of (at most) batch_size items and put them in
+# work_queue, followed by one end-of-work marker (None) per worker.
+def fill_work_queue(work_queue, items, batch_size, num_workers):
+    for lb in range(0, len(items), batch_size):
+        work_queue.put(items[lb:lb + batch_size])
+    for i in range(num_workers):
+        work_queue.put(None)
+
+
+# Pull batches from work_queue until the end-of-work marker is found and
+# call process_item() for every item. process_item() returns a true value
+# if the item was processed successfully.
+# Return the WorkerStats of the calling worker.
+def consume_work_queue(work_queue, process_item, wid):
+    stats = WorkerStats(wid)
+    while True:
+        batch = work_queue.get()
+        if batch is None:   # No more work
+            break
+        t0 = time.time()
+        for item in batch:
+            if process_item(item):
+                stats.successes += 1
+        stats.busy_time += time.time() - t0
+        stats.items += len(batch)
+        stats.batches += 1
+    stats.end_time = time.time()
+    return stats
+
+
+# Print how busy each worker was during a stage that lasted wall_time
+# seconds. Idle time is mostly the time a worker waited for the slowest one
+# to finish, i.e. the tail latency of the stage.
+def print_utilization(worker_stats, wall_time, worker_name='Worker'):
+    if len(worker_stats) == 0 or wall_time <= 0:
+        return
+    last_end_time = max(ws.end_time for ws in worker_stats)
+    print('\nWorker utilization:')
+    for ws in sorted(worker_stats, key=lambda ws: ws.wid):
+        print('%s %3d: %6d items in %5d batches, busy %6.2f%%, '
+                'finished %.2f sec before the last worker' %
+                (worker_name, ws.wid, ws.items, ws.batches,
+                    ws.busy_time / wall_time * 100, last_end_time - ws.end_time))
+    total_busy_time = sum(ws.busy_time for ws in worker_stats)
+    print('Average utilization: %.2f%%' %
+            (total_busy_time / (wall_time * len(worker_stats)) * 100))
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Query engine over the inverted index of the corpus (see invindex.py).
+# Documents are scored with BM25, computed separately for every field and
+# weighted by the boost of the field (see field_boosts), i.e. a term found
+# in the title counts more than one found in the headings or the content.
+# The top-k documents are found with MaxScore dynamic pruning: the posting
+# lists of the query are ordered by the highest score they may contribute
+# and the lists that cannot lift a document into the top-k on their own
+# are only used to score the documents found in the rest of the lists,
+# skipping over whole blocks of postings (see SKIP_INTERVAL). Results carry
+# the url, the title and the summary (see preprocess.get_summary()) of
+# every document.
+#
+# The index is memory-mapped, so opening it takes next to no time, and
+# only the pages of the terms and posting lists of a query are read.
+#
+# Usage:
+#     python search.py [--index=DIR] [--top=N] [--exhaustive] [--query=TEXT]
+# Without --query, queries are read from STDIN, one per line.
+
+
+import os
+import sys
+import math
+import time
+import heapq
+from invindex import IndexReader, tokenize
+
+########################
+# Function definitions #
+########################
+
+
+# Print message to STDERR.
+def perror(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+    sys.stderr.flush()
+
+
+# Iterates over a posting list in doc id order. doc is the doc id of the
+# current posting (NO_MORE_DOCS at the end of the list) and tf its term
+# frequency.
+class PostingCursor:
+
+    def __init__(self, searcher, i, field_id, boost):
+        reader = searcher.reader
+        record = reader.record(i)
+        self.data = searcher.postings_data[record[3]:record[3] + record[4]]
+        self.skips = reader.skips_of(i)
+        self.next_skip = 0   # Index of the next skip in skips
+        self.pos = 0
+        self.doc = 0
+        self.tf = 0
+        self.field_id = field_id
+        self.norms = reader.norms
+        self.num_fields = reader.num_fields
+        df = record[2]
+        idf = math.log(1 + (reader.num_docs - df + 0.5) / (df + 0.5))
+        k1 = searcher.k1
+        b = searcher.b
+        self.weight = boost * idf * (k1 + 1)
+        # Length normalization: tf + k1 * (1 - b + b * length / avg length)
+        self.k1_b0 = k1 * (1 - b)
+        self.k1_b1 = k1 * b / max(reader.average_length(field_id), 1e-9)
+        # Scores grow with tf and shrink with the length of the field
+        max_tf = record[5]
+        self.upper_bound = self.weight * max_tf / (max_tf + self.k1_b0)
+        self.next()
+
+    # Move to the next posting.
+    def next(self):
+        data = self.data
+        pos = self.pos
+        if pos >= len(data):
+            self.doc = NO_MORE_DOCS
+            return
+        # Inlined decode_varint() of the doc id delta and tf
+        delta = 0
+        shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            delta |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        byte = data[pos]
+        pos += 1
+        if byte < 0x80:
+            tf = byte
+        else:
+            tf = byte & 0x7f
+            shift = 7
+            while True:
+                byte = data[pos]
+                pos += 1
+                tf |= (byte & 0x7f) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+        self.pos = pos
+        self.doc += delta
+        self.tf = tf
+
+    # Move to the first posting with doc id >= target, skipping whole
+    # blocks of postings when possible.
+    def advance(self, target):
+        if self.doc >= target:
+            return
+        skips = self.skips
+        k = self.next_skip
+        while k < len(skips) and skips[k] < target:
+            k += 2
+        if k > self.next_skip:
+            self.next_skip = k
+            # The last skip before target: its block ends before target
+            if skips[k - 1] > self.pos:
+                self.doc = skips[k - 2]
+                self.pos = skips[k - 1]
+        while self.doc < target:
+            self.next()
+
+    # Return the score of the current posting.
+    def score(self):
+        length = self.norms[self.doc * self.num_fields + self.field_id]
+        return self.weight * self.tf / (self.tf + self.k1_b0 + self.k1_b1 * length)
+
+
+# Searches the index stored in path.
+class Searcher:
+
+    def __init__(self, path, boosts=None, k1=1.2, b=0.75):
+        self.reader = IndexReader(path)
+        self.postings_data = memoryview(self.reader.postings_data)
+        if boosts == None:
+            boosts = field_boosts
+        # (field id, field, boost) of the fields searched
+        self.fields = [(field_id, field, boosts[field])
+                for field_id, field in enumerate(self.reader.fields)
+                if boosts.get(field, 0) > 0]
+        self.k1 = k1
+        self.b = b
+
+    # Return a cursor over every posting list of the terms of query.
+    def cursors(self, query):
+        cursors = []
+        for term in sorted(set(tokenize(query))):
+            for field_id, field, boost in self.fields:
+                i = self.reader.find(field + ':' + term)
+                if i != -1:
+                    cursors.append(PostingCursor(self, i, field_id, boost))
+        return cursors
+
+    # Return the top k (score, doc id) of query, best first. Documents
+    # with equal scores are ranked in doc id order.
+    def top_k(self, query, k=10, exhaustive=False):
+        cursors = self.cursors(query)
+        if exhaustive:
+            top = exhaustive_top_k(cursors, k)
+        else:
+            top = max_score_top_k(cursors, k)
+        return [(score, -neg_doc) for score, neg_doc in
+                sorted(top, reverse=True)]
+
+    # Return the top k results of query as dicts with the name, url, title,
+    # summary and score of every document.
+    def search(self, query, k=10, exhaustive=False):
+        results = []
+        for score, doc_id in self.top_k(query, k, exhaustive):
+            result = self.reader.document(doc_id)
+            result['score'] = score
+            results.append(result)
+        return results
+
+    def close(self):
+        self.postings_data.release()
+        self.reader.close()
+
+
+# Return the top k of the documents found in cursors, as a heap of
+# (score, -doc id), scoring every document of every list.
+def exhaustive_top_k(cursors, k):
+    heap = []
+    while True:
+        doc = min([c.doc for c in cursors], default=NO_MORE_DOCS)
+        if doc == NO_MORE_DOCS:
+            return heap
+        score = 0.0
+        for c in cursors:
+            if c.doc == doc:
+                score += c.score()
+                c.next()
+        if len(heap) < k:
+            heapq.heappush(heap, (score, -doc))
+        elif score > heap[0][0]:
+            heapq.heapreplace(heap, (score, -doc))
+
+
+# Return the top k of the documents found in cursors, as a heap of
+# (score, -doc id), using MaxScore. Cursors are sorted by upper bound and
+# bounds[i] is the sum of the upper bounds of cursors[:i + 1]. Once the
+# threshold (the lowest score in the top-k) reaches bounds[i], no document
+# found only in cursors[:i + 1] can enter the top-k, so candidates are
+# drawn from the rest (the essential lists) and cursors[:i + 1] are only
+# advanced to them. A candidate is dropped as soon as its score plus the
+# bounds of the lists left cannot exceed the threshold.
+def max_score_top_k(cursors, k):
+    cursors = sorted(cursors, key=lambda c: c.upper_bound)
+    bounds = []
+    total = 0.0
+    for c in cursors:
+        total += c.upper_bound
+        bounds.append(total)
+    heap = []
+    threshold = 0.0
+    first_essential = 0
+    while True:
+        doc = NO_MORE_DOCS
+        for i in range(first_essential, len(cursors)):
+            if cursors[i].doc < doc:
+                doc = cursors[i].doc
+        if doc == NO_MORE_DOCS:
+            return heap
+        score = 0.0
+        for i in range(first_essential, len(cursors)):
+            c = cursors[i]
+            if c.doc == doc:
+                score += c.score()
+                c.next()
+        for i in range(first_essential - 1, -1, -1):
+            if score + bounds[i] <= threshold:
+                break
+            c = cursors[i]
+            c.advance(doc)
+            if c.doc == doc:
+                score += c.score()
+        else:
+            if len(heap) < k:
+                heapq.heappush(heap, (score, -doc))
+            elif score > threshold:
+                heapq.heapreplace(heap, (score, -doc))
+            else:
+                continue
+            if len(heap) == k:
+                threshold = heap[0][0]
+                while first_essential < len(cursors) and \
+                        bounds[first_essential] <= threshold:
+                    first_essential += 1
+
+
+def print_results(results):
+    for rank, result in enumerate(results, 1):
+        print('%d. %s [%.4f]' % (rank, result['title'], result['score']))
+        if result['url'] != None:
+            print('   ' + result['url'])
+        print('   ' + result['summary'])
+
+
+# Print the percentiles of latencies (seconds).
+def print_latencies(latencies):
+    latencies = sorted(latencies)
+    percentiles = ['p%d %.2fms' % (p, latencies[min(len(latencies) - 1,
+            int(p / 100 * len(latencies)))] * 1000) for p in [50, 90, 99]]
+    print('%d queries, avg %.2fms, %s, max %.2fms' % (len(latencies),
+            sum(latencies) / len(latencies) * 1000, ', '.join(percentiles),
+            latencies[-1] * 1000))
+
+
+def main():
+    t0 = time.perf_counter()
+    try:
+        searcher = Searcher(index_path)
+    except (OSError, ValueError) as e:
+        perror('Cannot open the index: %s' % (e))
+        exit(getattr(e, 'errno', None) or 1)
+    print('Opened the index (%d documents) in %.2fms' % (searcher.reader.num_docs,
+            (time.perf_counter() - t0) * 1000), file=sys.stderr)
+    queries = [query] if query != None else sys.stdin
+    latencies = []
+    for q in queries:
+        q = q.strip()
+        if q == '':
+            continue
+        t0 = time.perf_counter()
+        results = searcher.search(q, top_k, exhaustive)
+        latencies.append(time.perf_counter() - t0)
+        print('Query: %s (%d results, %.2fms)' % (q, len(results),
+                latencies[-1] * 1000))
+        print_results(results)
+        print()
+    if len(latencies) > 1:
+        print_latencies(latencies)
+    searcher.close()
+
+
+###############
+# Global data #
+###############
+index_path = './index/'  # Where the index is stored
+top_k = 10  # Number of results per query
+exhaustive = False  # Score every document (no pruning); for verification
+query = None  # Read queries from STDIN if None
+# BM25 weight of every field (title > headings > content); 0 disables a field
+field_boosts = {'title': 3.0, 'headings': 2.0, 'content': 1.0, 'summary': 1.0,
+        'infobox': 1.0}
+NO_MORE_DOCS = 2**32  # Doc id of exhausted cursors; above all doc ids
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    for arg in args:
+        if arg.startswith("--index="):
+            index_path = os.path.join(arg.split('=', 1)[1], '')
+        elif arg.startswith("--top="):
+            top_k = int(arg.split('=', 1)[1])
+        elif arg == "--exhaustive":
+            exhaustive = True
+        elif arg.startswith("--query="):
+            query = arg.split('=', 1)[1]
+        else:
+            perror("Uknown command-line argument: '" + arg + "'")
+            exit(1)
+    main()
@@ -0,0 +1,279 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Packed storage backend for raw HTML files. Instead of one file per
+# article, records are compressed one by one (zstd if the zstandard module
+# is available, gzip otherwise) and appended to large segment files.
+# A side index (index.tsv) holds one line per record:
+#     name <TAB> segment <TAB> offset <TAB> length <TAB> fetch_time <TAB> codec
+# so that any article can be read with a single positional read, while the
+# whole repository can be streamed sequentially, segment by segment.
+# Removed articles are marked with a tombstone line (segment = -1) and the
+# latest line of a name always wins.
+# Records that were removed or replaced (i.e. by every --update of the
+# corpus) stay in the segment files until they are compacted (compact()):
+# the live records are copied to new segments, the index is rewritten and
+# the old segments are deleted.
+
+
+import os
+import time
+import gzip
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+INDEX_FILENAME = 'index.tsv'
+SEGMENT_FILENAME = 'segment-%05d.dat'
+DEFAULT_CODEC = 'zstd' if zstandard != None else 'gzip'
+
+
+def compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+# Read the index of the segments stored in path.
+# Return a dictionary of the form
+#     {name: (segment, offset, length, fetch_time, codec)}
+# ordered by the position of the records in the segments.
+def read_index(path):
+    entries = {}
+    try:
+        infile = open(os.path.join(path, INDEX_FILENAME), mode='r',
+                encoding='utf-8')
+    except FileNotFoundError:
+        return entries
+    for line in infile:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) != 6:   # Partially written line
+            continue
+        name, segment, offset, length, fetch_time, codec = fields
+        entries.pop(name, None)
+        if int(segment) >= 0:
+            entries[name] = (int(segment), int(offset), int(length),
+                    float(fetch_time), codec)
+    infile.close()
+    return dict(sorted(entries.items(), key=lambda e: e[1][:2]))
+
+
+# Return the total size (bytes) of the segment files in path.
+def segments_size(path):
+    return sum(os.path.getsize(os.path.join(path, name))
+            for name in os.listdir(path) if name.startswith('segment-'))
+
+
+# Return the fraction of the bytes of the segment files in path that hold
+# records that were removed or replaced.
+def stale_fraction(path):
+    total = segments_size(path)
+    live = sum(entry[2] for entry in read_index(path).values())
+    return 1 - live / total if total > 0 else 0.0
+
+
+# Copy the live records of the segment files in path to new segments, in
+# storage order, and delete the old ones. Records are copied as they are
+# (still compressed) along with their fetch time. The new index replaces
+# the old one atomically, so if compaction is interrupted the old segments
+# are still used and the new ones are deleted by the next compaction. No
+# SegmentWriter or SegmentReader may use path meanwhile.
+# Return the total size (bytes) of the segment files before and after.
+def compact(path, max_segment_size=256*2**20):
+    entries = read_index(path)
+    size_before = segments_size(path)
+    old_segments = [name for name in os.listdir(path)
+            if name.startswith('segment-')]
+    segment = max([int(name[8:13]) for name in old_segments], default=-1)
+    index_filename = os.path.join(path, INDEX_FILENAME)
+    index_file = open(index_filename + '.tmp', mode='w', encoding='utf-8')
+    fds = {}
+    segment_file = None
+    for name, (old_segment, offset, length, fetch_time, codec) in entries.items():
+        if segment_file == None or (segment_file.tell() > 0 and
+                segment_file.tell() + length > max_segment_size):
+            if segment_file != None:
+                close_synced(segment_file)
+            segment += 1
+            segment_file = open(os.path.join(path, SEGMENT_FILENAME % (segment)),
+                    mode='wb')
+        if old_segment not in fds:
+            fds[old_segment] = os.open(os.path.join(path,
+                    SEGMENT_FILENAME % (old_segment)), os.O_RDONLY)
+        new_offset = segment_file.tell()
+        segment_file.write(os.pread(fds[old_segment], length, offset))
+        index_file.write('%s\t%d\t%d\t%d\t%.3f\t%s\n' %
+                (name, segment, new_offset, length, fetch_time, codec))
+    if segment_file != None:
+        close_synced(segment_file)
+    for fd in fds.values():
+        os.close(fd)
+    close_synced(index_file)
+    os.replace(index_filename + '.tmp', index_filename)
+    live_segments = set(SEGMENT_FILENAME % (entry[0])
+            for entry in read_index(path).values())
+    for name in os.listdir(path):
+        if name.startswith('segment-') and name not in live_segments:
+            os.unlink(os.path.join(path, name))
+    return size_before, segments_size(path)
+
+
+# Close outfile once its data is on disk.
+def close_synced(outfile):
+    outfile.flush()
+    os.fsync(outfile.fileno())
+    outfile.close()
+
+
+# Appends records to segment files. Safe to use from multiple threads.
+# A new segment is started on every run and when the current one exceeds
+# max_segment_size bytes.
+class SegmentWriter:
+
+    def __init__(self, path, max_segment_size=256*2**20, codec=DEFAULT_CODEC):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_segment_size = max_segment_size
+        self.codec = codec
+        self.entries = read_index(path)
+        self.lock = threading.Lock()
+        self.segment = -1
+        for name in os.listdir(path):
+            if name.startswith('segment-'):
+                self.segment = max(self.segment, int(name[8:13]))
+        self.segment_file = None
+        self.index_file = open(os.path.join(path, INDEX_FILENAME), mode='a',
+                encoding='utf-8')
+        self.start_segment()
+
+    def start_segment(self):
+        if self.segment_file != None:
+            self.segment_file.close()
+        self.segment += 1
+        self.segment_file = open(os.path.join(self.path,
+                SEGMENT_FILENAME % (self.segment)), mode='ab')
+        self.offset = self.segment_file.tell()
+
+    # Compress and append html_text (str or UTF-8 encoded bytes) as record
+    # name. Return the size of the compressed record.
+    def append(self, name, html_text, fetch_time=None):
+        if fetch_time == None:
+            fetch_time = time.time()
+        if isinstance(html_text, str):
+            html_text = html_text.encode('utf-8')
+        # Compress outside the critical section
+        record = compress(html_text, self.codec)
+        with self.lock:
+            if self.offset > 0 and self.offset + len(record) > self.max_segment_size:
+                self.start_segment()
+            offset = self.offset
+            self.segment_file.write(record)
+            self.segment_file.flush()
+            self.offset += len(record)
+            entry = (self.segment, offset, len(record), fetch_time, self.codec)
+            self.write_index_line(name, entry)
+            self.entries.pop(name, None)
+            self.entries[name] = entry
+        return len(record)
+
+    # Mark record name as removed.
+    def remove(self, name):
+        with self.lock:
+            self.write_index_line(name, (-1, 0, 0, time.time(), self.codec))
+            self.entries.pop(name, None)
+
+    def write_index_line(self, name, entry):
+        segment, offset, length, fetch_time, codec = entry
+        self.index_file.write('%s\t%d\t%d\t%d\t%.3f\t%s\n' %
+                (name, segment, offset, length, fetch_time, codec))
+        self.index_file.flush()
+
+    # Return the names of the stored records.
+    def names(self):
+        with self.lock:
+            return list(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def close(self):
+        with self.lock:
+            self.segment_file.close()
+            self.index_file.close()
+            if self.offset == 0:   # Nothing was written in the last segment
+                os.unlink(os.path.join(self.path,
+                        SEGMENT_FILENAME % (self.segment)))
+
+
+# Random and sequential access to the records of segment files. Records are
+# read with os.pread(), so a reader can be shared by forked processes.
+class SegmentReader:
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = read_index(path)
+        self.fds = {}   # Opened lazily, per segment
+
+    def segment_fd(self, segment):
+        if segment not in self.fds:
+            self.fds[segment] = os.open(os.path.join(self.path,
+                    SEGMENT_FILENAME % (segment)), os.O_RDONLY)
+        return self.fds[segment]
+
+    # Return the names of the stored records in storage order.
+    def names(self):
+        return list(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Return the HTML text of record name.
+    def read(self, name):
+        segment, offset, length, fetch_time, codec = self.entries[name]
+        data = os.pread(self.segment_fd(segment), length, offset)
+        return decompress(data, codec).decode('utf-8')
+
+    # Iterate over (name, HTML text) pairs in storage order.
+    def __iter__(self):
+        for name in self.entries:
+            yield name, self.read(name)
+
+    # Return the total size of the segment files in bytes.
+    def disk_usage(self):
+        return sum(os.path.getsize(os.path.join(self.path, name))
+                for name in os.listdir(self.path))
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
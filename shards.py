@@ -0,0 +1,149 @@
+#+-----------------------------------------------------------------------+
+#|                  Copyright (C) 2020 George Z. Zachos                  |
+#+-----------------------------------------------------------------------+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Contact Information:
+# Name: George Z. Zachos
+# Email: gzzachos_at_gmail.com
+
+
+# Sharded JSONL corpus sink. Instead of one file per article, documents are
+# written as JSON lines to shard files holding a fixed number of documents
+# each. Every writer (i.e. preprocessing process) owns its shards, so no
+# locking is needed, and keeps an index of the form
+#     name <TAB> shard <TAB> offset <TAB> length
+# so that any document can be read with a single positional read.
+
+
+import os
+import json
+
+
+SHARD_FILENAME = 'shard-%03d-%05d.jsonl'
+INDEX_FILENAME = 'shard-%03d.index.tsv'
+
+
+# Remove the shards and indices stored in path, i.e. before a new corpus is
+# written.
+def remove_shards(path):
+    for name in os.listdir(path):
+        if name.startswith('shard-'):
+            os.unlink(os.path.join(path, name))
+
+
+# Read the indices of the shards stored in path.
+# Return a dictionary of the form {name: (shard, offset, length)}.
+def read_index(path):
+    entries = {}
+    for index_name in sorted(os.listdir(path)):
+        if not (index_name.startswith('shard-') and index_name.endswith('.index.tsv')):
+            continue
+        with open(os.path.join(path, index_name), mode='r',
+                encoding='utf-8') as infile:
+            for line in infile:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) != 4:   # Partially written line
+                    continue
+                name, shard, offset, length = fields
+                entries[name] = (shard, int(offset), int(length))
+    return entries
+
+
+# Writes documents to the shards of a single writer. Shard files and the
+# index are written through large buffers, so documents are flushed to the
+# disk in big chunks instead of one small write per field.
+class ShardWriter:
+
+    def __init__(self, path, writer_id, docs_per_shard=1000,
+            buffer_size=2**20):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.writer_id = writer_id
+        self.docs_per_shard = docs_per_shard
+        self.buffer_size = buffer_size
+        self.index_file = open(os.path.join(path, INDEX_FILENAME % (writer_id)),
+                mode='w', encoding='utf-8', buffering=buffer_size)
+        self.shard = -1
+        self.shard_name = None
+        self.shard_file = None
+        self.docs = 0   # Number of documents in the current shard
+        self.offset = 0   # Size of the current shard
+
+    # Shards are opened lazily, so that no empty shard is ever created.
+    def start_shard(self):
+        if self.shard_file != None:
+            self.shard_file.close()
+        self.shard += 1
+        self.shard_name = SHARD_FILENAME % (self.writer_id, self.shard)
+        self.shard_file = open(os.path.join(self.path, self.shard_name),
+                mode='wb', buffering=self.buffer_size)
+        self.docs = 0
+        self.offset = 0
+
+    # Append document (a JSON serializable dictionary) as record name.
+    # Return the size of the record in bytes.
+    def append(self, name, document):
+        record = (json.dumps(document, ensure_ascii=False) + '\n').encode('utf-8')
+        if self.shard_file == None or self.docs == self.docs_per_shard:
+            self.start_shard()
+        self.shard_file.write(record)
+        self.index_file.write('%s\t%s\t%d\t%d\n' %
+                (name, self.shard_name, self.offset, len(record)))
+        self.offset += len(record)
+        self.docs += 1
+        return len(record)
+
+    def close(self):
+        if self.shard_file != None:
+            self.shard_file.close()
+        self.index_file.close()
+
+
+# Random and sequential access to the documents of the shards stored in
+# path, written by any number of writers.
+class ShardReader:
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = read_index(path)
+        self.fds = {}   # Opened lazily, per shard
+
+    def shard_fd(self, shard):
+        if shard not in self.fds:
+            self.fds[shard] = os.open(os.path.join(self.path, shard), os.O_RDONLY)
+        return self.fds[shard]
+
+    def names(self):
+        return list(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Return the document stored as record name.
+    def read(self, name):
+        shard, offset, length = self.entries[name]
+        return json.loads(os.pread(self.shard_fd(shard), length, offset))
+
+    # Iterate over (name, document) pairs, shard by shard.
+    def __iter__(self):
+        for name in sorted(self.entries, key=lambda name: self.entries[name][:2]):
+            yield name, self.read(name)
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}